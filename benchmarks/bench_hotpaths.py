@@ -0,0 +1,275 @@
+"""
+Micro-benchmarks for the dashboard's compute hot paths.
+
+Runs each hot path against synthetic price matrices at several sizes, records
+wall time and peak memory, and flags regressions against a stored baseline.
+Also checks that incrementally extended total-return factors match a full rebuild.
+
+    python benchmarks/bench_hotpaths.py                       # all sizes, compare to baseline
+    python benchmarks/bench_hotpaths.py --sizes small medium  # subset of sizes
+    python benchmarks/bench_hotpaths.py --save-baseline       # store this run as the new baseline
+
+benchmarks/baseline.json is committed. Timings only compare on the same hardware: after
+changing the reference machine (or a dependency that moves the numbers on purpose), re-run
+with --save-baseline there and commit the updated file together with the change.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Shared helpers live next to the dashboard
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "msci_dashboard"))
+from etf_universe import Universe, load_universe
+from returns_engine import calculate_returns, filter_by_timeframe, normalize_prices
+from risk_engine import risk_metrics
+from table_view import build_final_table, column_config, display_frame, style_table, visible_columns
+from total_return import TotalReturn
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Differences below this are run-to-run noise (millisecond cases easily vary by +50%)
+NOISE_FLOOR = {"seconds": 0.010, "peak_mib": 1.0}
+
+# name: (tickers, years)
+SIZES = {
+    "small": (27, 3),      # today's universe
+    "medium": (500, 10),
+    "large": (5000, 20),
+}
+
+CATEGORIES = ["日本株（テーマ別）", "外国株", "エンハンスト型"]
+
+
+# --- SYNTHETIC DATA ---
+
+def make_prices(n_tickers, years, seed=0):
+    """Random-walk Close matrix (business days x tickers) with staggered listings."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end="2026-10-16", periods=260 * years)
+    returns = rng.normal(0.0002, 0.01, (len(dates), n_tickers))
+    prices = 1000 * np.exp(np.cumsum(returns, axis=0))
+    # ~10% of tickers are new listings with missing early history
+    starts = rng.integers(0, len(dates) // 2, n_tickers) * (rng.random(n_tickers) < 0.1)
+    for j in np.nonzero(starts)[0]:
+        prices[:starts[j], j] = np.nan
+    tickers = [f"{1000 + j}.T" for j in range(n_tickers)]
+    return pd.DataFrame(prices, index=dates, columns=tickers)
+
+
+def make_records(tickers):
+    """etf_universe.json records (same fields) for synthetic tickers."""
+    return [
+        {"Ticker": t, "Index": f"MSCI Index {t}", "Name": f"ETF {t}",
+         "Category": CATEGORIES[i % len(CATEGORIES)], "Issuer": "Synthetic", "Label": t}
+        for i, t in enumerate(tickers)
+    ]
+
+
+def make_universe(tickers):
+    return Universe(make_records(tickers))
+
+
+def write_registry(tickers, directory):
+    """Synthetic registry file of len(tickers) records (what etf_universe loads at import)."""
+    path = os.path.join(directory, f"etf_universe_{len(tickers)}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(make_records(tickers), f, ensure_ascii=False, indent=2)
+    return path
+
+
+def make_fundamentals(tickers, universe, seed=0):
+    """Same shape as get_fundamentals() output (indexed by Ticker)."""
+    rng = np.random.default_rng(seed)
+    n = len(tickers)
+    price = rng.uniform(500, 30000, n)
+    nav = price * (1 + rng.normal(0, 0.003, n))
+    df = pd.DataFrame({
+        "Index Name": [universe.get(t, "Index") for t in tickers],
+        "ETF Name": [universe.get(t, "Name") for t in tickers],
+        "Ticker": tickers,
+        "Price": price,
+        "NAV": nav,
+        "Premium %": (price - nav) / nav * 100,
+        "AUM (B)": rng.uniform(1e9, 1e12, n),
+        "P/E": rng.uniform(10, 30, n),
+        "P/B": rng.uniform(0.8, 3.0, n),
+        "Yield %": rng.uniform(0, 5, n),
+    })
+    return df.set_index("Ticker", drop=False)
+
+
+def make_events(df_prices, seed=0):
+    """Semiannual cash dividends (~1% of the close) for every ticker, as a load_events frame."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for t in df_prices.columns:
+        for d in df_prices.index[rng.integers(0, 120)::125]:
+            close = df_prices.at[d, t]
+            if np.isfinite(close):
+                rows.append((t, d, close * 0.01, 0.0))
+    return pd.DataFrame(rows, columns=["Ticker", "Date", "Dividends", "Stock Splits"])
+
+
+# --- CONSISTENCY ---
+
+def check_total_return(df_prices, steps=30, window=None):
+    """
+    Rolls a price window forward one bar at a time (start and end move, like the refresher's
+    3-year window), extending the total-return factors incrementally, and compares them with
+    a full rebuild of the final window. Returns the max relative difference.
+    """
+    window = window or len(df_prices) - steps
+    events = make_events(df_prices)
+    tr = None
+    for i in range(steps + 1):
+        tr = TotalReturn.build(df_prices.iloc[i:i + window], events, tr)
+    full = TotalReturn.build(df_prices.iloc[steps:steps + window], events)
+    return float(np.max(np.abs(tr.factors / full.factors - 1)))
+
+
+# --- HOT PATHS ---
+
+def bench_cases(df_prices, df_fund, df_perf, universe, registry_path):
+    """name -> zero-arg callable, one per hot path in main()."""
+    df_sliced = filter_by_timeframe(df_prices, "3Yr")
+    df_final = build_final_table(df_fund, df_perf, universe)
+    final_cols = visible_columns(df_final)
+    tickers = df_fund["Ticker"]
+    return {
+        # Registry: what `import etf_universe` does (parse + build the indexes), then the
+        # per-rerun lookups (labels for every row, category filter)
+        "universe_load": lambda: load_universe(registry_path),
+        "universe_lookup": lambda: (tickers.map(universe.field_map("Index")),
+                                    universe.tickers_in(CATEGORIES[:2])),
+        "calculate_returns": lambda: calculate_returns(df_prices),
+        "filter_by_timeframe": lambda: filter_by_timeframe(df_prices, "3Yr"),
+        "normalize_prices": lambda: normalize_prices(df_sliced),
+        "risk_metrics": lambda: risk_metrics(df_sliced, benchmark=df_prices.columns[0]),
+        "merge_fund_perf": lambda: build_final_table(df_fund, df_perf, universe),
+        # Styler is lazy; to_html forces the per-cell formatting and CSS that st.dataframe triggers
+        "styler_table": lambda: style_table(df_final, final_cols).to_html(),
+        # Fast path: st.dataframe serializes the plain frame to Arrow when given column_config
+        # instead (measured with pyarrow directly, Streamlit's own converter is private API)
+        "fast_table": lambda: (pa.Table.from_pandas(display_frame(df_final, final_cols)),
+                               column_config(final_cols)),
+    }
+
+
+def measure(fn, repeat):
+    """Returns (median seconds, peak MiB) over repeat runs."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 2**20
+
+
+def run(sizes, repeat):
+    results = {}
+    failures = []
+    registry_dir = tempfile.mkdtemp(prefix="bench-registry-")
+    for size in sizes:
+        n_tickers, years = SIZES[size]
+        print(f"\n== {size}: {n_tickers} tickers x {years} years ==")
+        df_prices = make_prices(n_tickers, years)
+        # Incremental total return must match a full rebuild (same window, same level)
+        drift = check_total_return(df_prices)
+        print(f"  {'total_return drift':<22} {drift:10.2e}")
+        if drift > 1e-9:
+            failures.append(f"{size}: incremental total return differs from a full rebuild by {drift:.2e}")
+        universe = make_universe(list(df_prices.columns))
+        registry_path = write_registry(list(df_prices.columns), registry_dir)
+        df_fund = make_fundamentals(list(df_prices.columns), universe)
+        df_perf = calculate_returns(df_prices)
+
+        for name, fn in bench_cases(df_prices, df_fund, df_perf, universe, registry_path).items():
+            # Fewer repeats for the big sizes so the suite stays usable
+            n = repeat if n_tickers < 1000 else max(1, repeat // 3)
+            seconds, peak_mib = measure(fn, n)
+            results[f"{size}/{name}"] = {"seconds": seconds, "peak_mib": peak_mib}
+            print(f"  {name:<22} {seconds * 1000:10.2f} ms  {peak_mib:10.1f} MiB")
+    return results, failures
+
+
+def compare(results, baseline, tolerance):
+    """Prints and returns the cases slower (or heavier) than baseline * (1 + tolerance)."""
+    regressions = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric in ("seconds", "peak_mib"):
+            if (base[metric] > 0 and cur[metric] > base[metric] * (1 + tolerance)
+                    and cur[metric] - base[metric] > NOISE_FLOOR[metric]):
+                change = (cur[metric] / base[metric] - 1) * 100
+                regressions.append((key, metric, base[metric], cur[metric], change))
+
+    if regressions:
+        print("\nREGRESSIONS:")
+        for key, metric, old, new, change in regressions:
+            print(f"  {key} {metric}: {old:.4g} -> {new:.4g} (+{change:.0f}%)")
+    else:
+        print("\nNo regressions against baseline.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard's compute hot paths.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown / memory growth vs baseline (0.25 = +25%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    results, failures = run(args.sizes, args.repeat)
+    if failures:
+        print("\nCONSISTENCY FAILURES:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        # Where the numbers come from (informational, not compared)
+        baseline["_machine"] = {
+            "platform": platform.platform(), "cpus": os.cpu_count(), "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "pyarrow": pa.__version__,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    return 1 if compare(results, baseline, args.tolerance) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
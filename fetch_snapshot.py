@@ -1,84 +1,111 @@
-import yfinance as yf
 import json
+import os
+import shutil
+import sys
 import pandas as pd
 from datetime import datetime
 
-# Define the list of tickers (from app.py)
-ETF_METADATA = {
-    # 1. 日本株（テーマ別）
-    "1477.T": {"Index": "MSCI 日本株最小分散指数(配当込み)", "Name": "iシェアーズ　MSCI 日本株最小分散 ETF", "Category": "日本株（テーマ別）"},
-    "1478.T": {"Index": "MSCI ジャパン高配当利回り指数(配当込み)", "Name": "iシェアーズ　MSCI ジャパン高配当利回り ETF", "Category": "日本株（テーマ別）"},
-    "1399.T": {"Index": "MSCIジャパンIMIカスタム高流動性高利回り低ボラティリティ指数", "Name": "上場インデックスファンドMSCI日本株高配当低ボラティリティ", "Category": "日本株（テーマ別）"},
-    "1479.T": {"Index": "MSCI日本株人材設備投資指数(配当込み)", "Name": "iFreeETF MSCI日本株人材設備投資指数", "Category": "日本株（テーマ別）"},
-    "1652.T": {"Index": "MSCI日本株女性活躍指数(配当込み)", "Name": "iFreeETF MSCI日本株女性活躍指数(WIN)", "Category": "日本株（テーマ別）"},
-    "2518.T": {"Index": "MSCI 日本株女性活躍指数(セレクト) (配当込み)", "Name": "ＮＥＸＴ ＦＵＮＤＳ ＭＳＣＩ日本株女性活躍指数(セレクト)連動型上場投信", "Category": "日本株（テーマ別）"},
-    "1653.T": {"Index": "MSCIジャパンESGセレクト・リーダーズ指数(配当込み)", "Name": "iFreeETF MSCIジャパンESGセレクト・リーダーズ指数", "Category": "日本株（テーマ別）"},
-    "2564.T": {"Index": "MSCI ジャパン・高配当セレクト25指数(配当込み)", "Name": "グローバルＸ MSCIスーパーディビィデンド-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "2636.T": {"Index": "MSCI Japan Governance-Quality Index (配当込み)", "Name": "グローバルＸ MSCI ガバナンス・クオリティ-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "2643.T": {"Index": "MSCI ジャパンカントリー指数(セレクト) (配当込み)", "Name": "NEXT FUNDS MSCIジャパンカントリー指数(セレクト)連動型上場投信", "Category": "日本株（テーマ別）"},
-    "2848.T": {"Index": "MSCI Japan Climate Change Index (配当込み)", "Name": "グローバルＸ MSCI 気候変動対応-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "2851.T": {"Index": "MSCIジャパン 700 SRIセレクト指数(配当込み)", "Name": "iシェアーズ　MSCI ジャパンSRI ETF", "Category": "日本株（テーマ別）"},
-    "2250.T": {"Index": "MSCIジャパン気候変動アクション指数(配当込み)", "Name": "iシェアーズ　MSCI ジャパン気候変動アクション ETF", "Category": "日本株（テーマ別）"},
-    "234A.T": {"Index": "MSCI Japan IMI High Free Cash Flow Yield 50 Select Index (配当込み)", "Name": "グローバルＸ MSCI キャッシュフローキング-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "294A.T": {"Index": "MSCIジャパン気候変動指数(セレクト) (配当込み)", "Name": "ＮＥＸＴ ＦＵＮＤＳ ＭＳＣＩジャパン気候変動指数(セレクト)連動型上場投信", "Category": "日本株（テーマ別）"},
-
-    # 2. 外国株
-    "1680.T": {"Index": "MSCI-KOKUSAIインデックス", "Name": "上場インデックスファンド海外先進国株式(MSCI-KOKUSAI)", "Category": "外国株"},
-    "1550.T": {"Index": "MSCI-KOKUSAIインデックス", "Name": "MAXIS 海外株式(MSCIコクサイ)上場投信", "Category": "外国株"},
-    "2513.T": {"Index": "MSCI-KOKUSAIインデックス", "Name": "ＮＥＸＴ ＦＵＮＤＳ 外国株式・ＭＳＣＩ‐ＫＯＫＵＳＡＩ指数(為替ヘッジなし)連動型上場投信", "Category": "外国株"},
-    "2514.T": {"Index": "MSCI-KOKUSAI指数(円ペース・為替ヘッジあり)", "Name": "ＮＥＸＴ ＦＵＮＤＳ 外国株式・ＭＳＣＩ‐ＫＯＫＵＳＡＩ指数(為替ヘッジあり)連動型上場投信", "Category": "外国株"},
-    "1681.T": {"Index": "MSCI エマージング・マーケット・インデックス", "Name": "上場インデックスファンド海外新興国株式(MSCIエマージング)", "Category": "外国株"},
-    "2520.T": {"Index": "MSCI エマージング・マーケット・インデックス", "Name": "ＮＥＸＴ ＦＵＮＤＳ新興国株式・MSCIエマージング・マーケット・インデックス(為替ヘッジなし)連動型上場投信", "Category": "外国株"},
-    "1554.T": {"Index": "MSCI ACWI ex Japanインデックス", "Name": "上場インデックスファンド世界株式(MSCI ACWI)除く日本", "Category": "外国株"},
-    "2559.T": {"Index": "MSCI ACWIインデックス", "Name": "ＭＡＸＩＳ全世界株式(オール・カントリー)上場投信", "Category": "外国株"},
-    "1657.T": {"Index": "MSCI コクサイ指数(税引後配当込み、国内投信用、円建て)", "Name": "iシェアーズ・コア MSCI 先進国株(除く日本)ETF", "Category": "外国株"},
-    "1658.T": {"Index": "MSCI エマージング・マーケッツ IMI 指数(税引後配当込み、国内投信用、円建て)", "Name": "iシェアーズ・コア MSCI 新興国株 ETF", "Category": "外国株"},
-    "273A.T": {"Index": "ＭＳＣＩ　サウジアラビア・インデックス(円換算ベース)", "Name": "ＳＢＩ サウジアラビア株式上場投信", "Category": "外国株"},
-
-    # 3. エンハンスト型
-    "1490.T": {"Index": "MSCIジャパンIMIカスタムロングショート戦略85%+円キャッシュ15%指数", "Name": "上場インデックスファンドMSCI日本株高配当低ボラティリティ(βヘッジ)", "Category": "エンハンスト型"},
-}
+# Shared helpers live next to the dashboard
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "msci_dashboard"))
+import fundamentals_history
+from etf_universe import ETF_METADATA
+from fetch_guard import NoData
+from fetch_scheduler import fetch_all
+from fundamentals import SNAPSHOT_PATH, info_to_row
+from price_store import DATA_DIR
+from providers import get_provider
+
+# Per-ticker checkpoints of the current run (the snapshot itself is fundamentals.SNAPSHOT_PATH)
+CHECKPOINT_ROOT = os.path.join(DATA_DIR, "snapshot_checkpoints")
+
+
+def _write_json_atomic(path, payload):
+    """Writes JSON to a temp file next to path, then renames it over path."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _load_checkpoints(checkpoint_dir):
+    """Rows already fetched by an earlier (interrupted) run today."""
+    rows = {}
+    if not os.path.isdir(checkpoint_dir):
+        return rows
+    for name in os.listdir(checkpoint_dir):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(checkpoint_dir, name), "r", encoding="utf-8") as f:
+                row = json.load(f)
+            rows[row["Ticker"]] = row
+        except Exception as e:
+            print(f"Ignoring unreadable checkpoint {name}: {e}")
+    return rows
+
+
+def _load_previous_snapshot():
+    if not os.path.exists(SNAPSHOT_PATH):
+        return {}
+    try:
+        with open(SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            return {row["Ticker"]: row for row in json.load(f)}
+    except Exception as e:
+        print(f"Could not read previous snapshot: {e}")
+        return {}
+
 
 def fetch_snapshot():
     print("Fetching fundamental data snapshot locally...")
-    rows = []
-    
-    for ticker, meta in ETF_METADATA.items():
+
+    # Checkpoints are per day, so a rerun today resumes and tomorrow starts fresh
+    checkpoint_dir = os.path.join(CHECKPOINT_ROOT, datetime.now().strftime("%Y-%m-%d"))
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    done = _load_checkpoints(checkpoint_dir)
+    todo = [t for t in ETF_METADATA if t not in done]
+    if done:
+        print(f"Resuming: {len(done)} tickers already fetched, {len(todo)} to go.")
+
+    def fetch_row(ticker):
         print(f"Processing {ticker}...")
-        try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-            
-            # Extract key metrics
-            price = info.get('regularMarketPreviousClose') or info.get('previousClose')
-            nav = info.get('navPrice')
-            
-            premium = None
-            if price and nav:
-                premium = ((price - nav) / nav) * 100
-                
-            data = {
-                "Index Name": meta["Index"],
-                "ETF Name": meta["Name"],
-                "Ticker": ticker,
-                "Price": price,
-                "NAV": nav,
-                "Premium %": premium,
-                "AUM (B)": info.get('totalAssets'),
-                "P/E": info.get('trailingPE'),
-                "P/B": info.get('priceToBook'),
-                "Yield %": (info.get('yield', 0) or 0) * 100,
-                "Fetched At": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            rows.append(data)
-        except Exception as e:
-            print(f"Error fetching {ticker}: {e}")
-            
-    # Save to JSON
-    with open("msci_dashboard/etf_snapshot.json", "w", encoding="utf-8") as f:
-        json.dump(rows, f, indent=2, ensure_ascii=False)
-        
+        info = get_provider().info(ticker)
+        if not info:
+            raise NoData("empty info")
+        data = info_to_row(ticker, ETF_METADATA[ticker], info)
+        data["Fetched At"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Checkpoint straight away so an interrupted run keeps this ticker
+        _write_json_atomic(os.path.join(checkpoint_dir, f"{ticker}.json"), data)
+        return data
+
+    # Bounded pool with retries: run time ~ the slowest ticker, not the sum of all
+    # Tickers that came back empty recently (negative cache) are skipped, keeping their old row
+    fetched, errors = fetch_all(todo, fetch_row, kind="info")
+    skipped = [t for t in todo if t not in fetched and t not in errors]
+    if skipped:
+        print(f"Skipping {len(skipped)} tickers with no info recently ({', '.join(skipped)}).")
+    done.update(fetched)
+
+    # Failed tickers keep their row from the previous snapshot (if any)
+    previous = _load_previous_snapshot()
+    rows = []
+    for ticker in ETF_METADATA:
+        if ticker in done:
+            rows.append(done[ticker])
+        elif ticker in previous:
+            rows.append(previous[ticker])
+
+    # Publish with an atomic rename: readers see the old file or the new one, never half of it
+    _write_json_atomic(SNAPSHOT_PATH, rows)
     print(f"Snapshot saved to msci_dashboard/etf_snapshot.json with {len(rows)} records.")
 
+    # Keep the point-in-time history (only rows fetched in this run, not carried-over ones)
+    appended = fundamentals_history.append_snapshot(list(done.values()))
+    print(f"Appended {appended} rows to the fundamentals history.")
+
+    if errors:
+        print(f"{len(errors)} tickers failed ({', '.join(errors)}); rerun to retry just those.")
+    else:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
 if __name__ == "__main__":
     fetch_snapshot()
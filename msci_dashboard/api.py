@@ -0,0 +1,266 @@
+"""
+Local HTTP API for the dashboard's data, for downstream systems (no Streamlit page scraping).
+
+    python msci_dashboard/api.py                    # http://127.0.0.1:8502
+    python msci_dashboard/api.py --port 9000 --host 0.0.0.0
+
+    GET /table?tickers=2559.T,1657.T             performance and valuations table
+    GET /prices?tickers=...&start=2024-01-01&end=2024-12-31
+                                                  daily closes (JPY), Date x Ticker
+    GET /normalized?timeframe=1Yr&tickers=...     rebased-to-0% series (%), Date x Ticker
+    GET /health                                   data generation, as_of, last bar date
+    GET /metrics                                  Prometheus text (diagnostics.METRICS)
+
+JSON by default; format=arrow (or Accept: application/vnd.apache.arrow.stream) returns an
+Arrow IPC stream for bulk pulls. Every response carries an ETag; send it back in
+If-None-Match and unchanged data costs only a 304.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pyarrow as pa
+
+from background_refresh import BackgroundRefresher
+from diagnostics import METRICS, timed
+from etf_universe import UNIVERSE
+from returns_engine import TIME_FRAMES, calculate_returns
+from table_view import build_final_table, display_frame, visible_columns
+
+# --- LOCAL DATA API ---
+# Reads the same Dataset as the dashboard: a BackgroundRefresher whose fetches go through
+# the cross-replica shared cache (shared_cache.py), so next to a dashboard on the same
+# MSCI_DATA_DIR upstream is still hit once per refresh interval. Requests only ever read
+# refresher.current(); API traffic never triggers a fetch.
+# Response bodies are cached per data generation, so repeated queries are a dict lookup.
+
+API_HOST = os.environ.get("MSCI_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("MSCI_API_PORT", "8502"))
+
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+JSON_TYPE = "application/json"
+
+ENDPOINTS = ["/table", "/prices", "/normalized"]
+
+# Encoded bodies kept per data generation (LRU)
+BODY_CACHE_SIZE = 256
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- PAYLOADS ---
+
+def performance_table(dataset):
+    """Same table as the dashboard's "Performance and valuations (%)" (AUM and flows in billions JPY)."""
+    df_perf = calculate_returns(dataset.prices).join(dataset.flows.trailing)
+    df_final = build_final_table(dataset.fundamentals, df_perf, UNIVERSE)
+    df = display_frame(df_final, visible_columns(df_final))
+    return df.set_index("Ticker") if "Ticker" in df.columns else df
+
+
+def _tickers(params, available):
+    """Requested tickers (comma separated, repeatable) in request order, or every available one."""
+    requested = [t for v in params.get("tickers", []) for t in v.split(",") if t]
+    if not requested:
+        return list(available)
+    unknown = [t for t in requested if t not in available]
+    if unknown:
+        raise ApiError(404, f"unknown tickers: {', '.join(unknown)}")
+    return list(dict.fromkeys(requested))
+
+
+def _date(params, name):
+    value = params.get(name, [None])[-1]
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise ApiError(400, f"{name}: not a date: {value}")
+
+
+def encode_json(df, orient):
+    return df.to_json(orient=orient, date_format="iso", double_precision=6).encode("utf-8")
+
+
+def encode_arrow(df):
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+class DataApi:
+    """Builds (and caches) response bodies from the refresher's current Dataset."""
+
+    def __init__(self, refresher):
+        self.refresher = refresher
+        self.lock = threading.Lock()
+        self.generation = None
+        self.table = None
+        self.bodies = OrderedDict()
+
+    def _dataset(self):
+        dataset = self.refresher.current()
+        with self.lock:
+            if dataset is not self.generation:
+                # New generation: everything cached for the old one is stale
+                self.generation = dataset
+                self.table = None
+                self.bodies.clear()
+        return dataset
+
+    def _table(self, dataset):
+        with self.lock:
+            if self.table is not None and self.generation is dataset:
+                return self.table
+        with timed("api.table_build"):
+            table = performance_table(dataset)
+        with self.lock:
+            if self.generation is dataset:
+                self.table = table
+        return table
+
+    def frame(self, endpoint, params, dataset):
+        """(DataFrame, JSON orient) for a data endpoint."""
+        if endpoint == "/table":
+            table = self._table(dataset)
+            return table.loc[_tickers(params, table.index)], "index"
+        if endpoint == "/prices":
+            df = dataset.prices
+            tickers = _tickers(params, df.columns)
+            return df.loc[_date(params, "start"):_date(params, "end"), tickers], "split"
+        # /normalized
+        timeframe = params.get("timeframe", ["1Yr"])[-1]
+        if timeframe not in TIME_FRAMES:
+            raise ApiError(400, f"timeframe must be one of {', '.join(TIME_FRAMES)}")
+        tickers = _tickers(params, dataset.prices.columns)
+        return dataset.series.get(timeframe, tickers), "split"
+
+    def body(self, endpoint, params, fmt):
+        """(body, content type, etag), cached per data generation and canonical query."""
+        if endpoint not in ENDPOINTS:
+            raise ApiError(404, f"unknown endpoint {endpoint}")
+        dataset = self._dataset()
+        key = (endpoint, fmt, tuple(sorted((k, tuple(v)) for k, v in params.items() if k != "format")))
+        with self.lock:
+            if self.generation is dataset and key in self.bodies:
+                self.bodies.move_to_end(key)
+                return self.bodies[key]
+
+        with timed(f"api.{endpoint.strip('/')}"):
+            df, orient = self.frame(endpoint, params, dataset)
+            if fmt == "arrow":
+                body, content_type = encode_arrow(df), ARROW_TYPE
+            else:
+                body, content_type = encode_json(df, orient), JSON_TYPE
+        # Content hash: a refresh that changes nothing keeps the same ETag
+        entry = (body, content_type, '"' + hashlib.sha1(body).hexdigest() + '"')
+
+        with self.lock:
+            if self.generation is dataset:
+                self.bodies[key] = entry
+                while len(self.bodies) > BODY_CACHE_SIZE:
+                    self.bodies.popitem(last=False)
+        return entry
+
+    def health(self):
+        dataset = self.refresher.current()
+        prices = dataset.prices
+        return {
+            "as_of": dataset.as_of.isoformat(timespec="seconds"),
+            "source": dataset.source,
+            "tickers": prices.shape[1],
+            "last_date": prices.index[-1].strftime("%Y-%m-%d") if not prices.empty else None,
+            "refreshing": self.refresher.refreshing,
+            "last_error": self.refresher.last_error,
+        }
+
+
+# --- HTTP ---
+
+class Handler(BaseHTTPRequestHandler):
+    api = None  # DataApi, set by serve()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        try:
+            if url.path == "/health":
+                body = json.dumps(self.api.health()).encode("utf-8")
+                return self._send(200, body, JSON_TYPE)
+            if url.path == "/metrics":
+                return self._send(200, METRICS.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+
+            fmt = params.get("format", [None])[-1]
+            if fmt is None:
+                fmt = "arrow" if ARROW_TYPE in self.headers.get("Accept", "") else "json"
+            if fmt not in ("json", "arrow"):
+                raise ApiError(400, "format must be json or arrow")
+
+            body, content_type, etag = self.api.body(url.path, params, fmt)
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                return self._send(304, b"", content_type, etag)
+            self._send(200, body, content_type, etag)
+        except ApiError as e:
+            self._send(e.status, json.dumps({"error": str(e)}).encode("utf-8"), JSON_TYPE)
+        except Exception as e:
+            print(f"API error for {self.path}: {e}")
+            self._send(500, json.dumps({"error": str(e)}).encode("utf-8"), JSON_TYPE)
+
+    def _send(self, status, body, content_type, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+            # Clients may keep it, but must revalidate (cheap: 304)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host=API_HOST, port=API_PORT, refresher=None):
+    refresher = refresher or BackgroundRefresher(UNIVERSE).start()
+    Handler.api = DataApi(refresher)
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"MSCI data API on http://{host}:{port}")
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP API serving the dashboard's returns and prices.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args(argv)
+
+    server = serve(args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
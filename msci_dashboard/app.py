@@ -1,8 +1,27 @@
+import startup
+startup.TIMER.begin()
+
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import yfinance as yf
-from datetime import datetime, timedelta
+
+import diagnostics
+import fundamentals_history
+import intraday_archive
+import total_return
+from etf_universe import UNIVERSE
+from correlation_state import CORR_WINDOWS
+from fund_flows import FLOW_FREQUENCIES
+from downsample import downsample_frame, scatter_class
+from background_refresh import BackgroundRefresher
+from intraday import IntradayStream
+from returns_engine import TIME_FRAMES, calculate_returns, normalize_prices
+from risk_engine import BENCHMARK as RISK_BENCHMARK, RISK_TIME_FRAMES
+from table_view import (TABLE_MODE, build_final_table, column_config, display_frame, risk_column_config,
+                        risk_table, style_table, visible_columns)
+
+# Heavy modules load on the first code path that needs them (MSCI_LAZY_IMPORTS=0 to disable)
+go = startup.lazy_module("plotly.graph_objects")
+startup.TIMER.mark("imports")
 
 # --- CONFIGURATION & STYLING ---
 st.set_page_config(page_title="MSCI ETF Dashboard", layout="wide", page_icon="📈")
@@ -44,362 +63,81 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- DATA CONSTANTS ---
-# Structure: Ticker: (Index Name, ETF Name, Category)
-# Categories: 0=Global/Regional, 1=Japan Strategy
-ETF_METADATA = {
-    # 1. 日本株（テーマ別）
-    "1477.T": {"Index": "MSCI 日本株最小分散指数(配当込み)", "Name": "iシェアーズ　MSCI 日本株最小分散 ETF", "Category": "日本株（テーマ別）"},
-    "1478.T": {"Index": "MSCI ジャパン高配当利回り指数(配当込み)", "Name": "iシェアーズ　MSCI ジャパン高配当利回り ETF", "Category": "日本株（テーマ別）"},
-    "1399.T": {"Index": "MSCIジャパンIMIカスタム高流動性高利回り低ボラティリティ指数", "Name": "上場インデックスファンドMSCI日本株高配当低ボラティリティ", "Category": "日本株（テーマ別）"},
-    "1479.T": {"Index": "MSCI日本株人材設備投資指数(配当込み)", "Name": "iFreeETF MSCI日本株人材設備投資指数", "Category": "日本株（テーマ別）"},
-    "1652.T": {"Index": "MSCI日本株女性活躍指数(配当込み)", "Name": "iFreeETF MSCI日本株女性活躍指数(WIN)", "Category": "日本株（テーマ別）"},
-    "2518.T": {"Index": "MSCI 日本株女性活躍指数(セレクト) (配当込み)", "Name": "ＮＥＸＴ ＦＵＮＤＳ ＭＳＣＩ日本株女性活躍指数(セレクト)連動型上場投信", "Category": "日本株（テーマ別）"},
-    "1653.T": {"Index": "MSCIジャパンESGセレクト・リーダーズ指数(配当込み)", "Name": "iFreeETF MSCIジャパンESGセレクト・リーダーズ指数", "Category": "日本株（テーマ別）"},
-    "2564.T": {"Index": "MSCI ジャパン・高配当セレクト25指数(配当込み)", "Name": "グローバルＸ MSCIスーパーディビィデンド-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "2636.T": {"Index": "MSCI Japan Governance-Quality Index (配当込み)", "Name": "グローバルＸ MSCI ガバナンス・クオリティ-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "2643.T": {"Index": "MSCI ジャパンカントリー指数(セレクト) (配当込み)", "Name": "NEXT FUNDS MSCIジャパンカントリー指数(セレクト)連動型上場投信", "Category": "日本株（テーマ別）"},
-    "2848.T": {"Index": "MSCI Japan Climate Change Index (配当込み)", "Name": "グローバルＸ MSCI 気候変動対応-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "2851.T": {"Index": "MSCIジャパン 700 SRIセレクト指数(配当込み)", "Name": "iシェアーズ　MSCI ジャパンSRI ETF", "Category": "日本株（テーマ別）"},
-    "2250.T": {"Index": "MSCIジャパン気候変動アクション指数(配当込み)", "Name": "iシェアーズ　MSCI ジャパン気候変動アクション ETF", "Category": "日本株（テーマ別）"},
-    "234A.T": {"Index": "MSCI Japan IMI High Free Cash Flow Yield 50 Select Index (配当込み)", "Name": "グローバルＸ MSCI キャッシュフローキング-日本株式 ETF", "Category": "日本株（テーマ別）"},
-    "294A.T": {"Index": "MSCIジャパン気候変動指数(セレクト) (配当込み)", "Name": "ＮＥＸＴ ＦＵＮＤＳ ＭＳＣＩジャパン気候変動指数(セレクト)連動型上場投信", "Category": "日本株（テーマ別）"},
-
-    # 2. 外国株
-    "1680.T": {"Index": "MSCI-KOKUSAIインデックス", "Name": "上場インデックスファンド海外先進国株式(MSCI-KOKUSAI)", "Category": "外国株"},
-    "1550.T": {"Index": "MSCI-KOKUSAIインデックス", "Name": "MAXIS 海外株式(MSCIコクサイ)上場投信", "Category": "外国株"},
-    "2513.T": {"Index": "MSCI-KOKUSAIインデックス", "Name": "ＮＥＸＴ ＦＵＮＤＳ 外国株式・ＭＳＣＩ‐ＫＯＫＵＳＡＩ指数(為替ヘッジなし)連動型上場投信", "Category": "外国株"},
-    "2514.T": {"Index": "MSCI-KOKUSAI指数(円ペース・為替ヘッジあり)", "Name": "ＮＥＸＴ ＦＵＮＤＳ 外国株式・ＭＳＣＩ‐ＫＯＫＵＳＡＩ指数(為替ヘッジあり)連動型上場投信", "Category": "外国株"},
-    "1681.T": {"Index": "MSCI エマージング・マーケット・インデックス", "Name": "上場インデックスファンド海外新興国株式(MSCIエマージング)", "Category": "外国株"},
-    "2520.T": {"Index": "MSCI エマージング・マーケット・インデックス", "Name": "ＮＥＸＴ ＦＵＮＤＳ新興国株式・MSCIエマージング・マーケット・インデックス(為替ヘッジなし)連動型上場投信", "Category": "外国株"},
-    "1554.T": {"Index": "MSCI ACWI ex Japanインデックス", "Name": "上場インデックスファンド世界株式(MSCI ACWI)除く日本", "Category": "外国株"},
-    "2559.T": {"Index": "MSCI ACWIインデックス", "Name": "ＭＡＸＩＳ全世界株式(オール・カントリー)上場投信", "Category": "外国株"},
-    "1657.T": {"Index": "MSCI コクサイ指数(税引後配当込み、国内投信用、円建て)", "Name": "iシェアーズ・コア MSCI 先進国株(除く日本)ETF", "Category": "外国株"},
-    "1658.T": {"Index": "MSCI エマージング・マーケッツ IMI 指数(税引後配当込み、国内投信用、円建て)", "Name": "iシェアーズ・コア MSCI 新興国株 ETF", "Category": "外国株"},
-    "273A.T": {"Index": "ＭＳＣＩ　サウジアラビア・インデックス(円換算ベース)", "Name": "ＳＢＩ サウジアラビア株式上場投信", "Category": "外国株"},
-
-    # 3. エンハンスト型
-    "1490.T": {"Index": "MSCIジャパンIMIカスタムロングショート戦略85%+円キャッシュ15%指数", "Name": "上場インデックスファンドMSCI日本株高配当低ボラティリティ(βヘッジ)", "Category": "エンハンスト型"},
-}
-
-# Invert for data fetching logic
-# PROBLEM: Index Names are NOT unique. We must use a list of tickers or map Ticker -> Index.
-# We already have ETF_METADATA which is Ticker -> Meta.
-# Let's just use ETF_METADATA.keys() for fetching.
-
-MSCI_TICKERS_LIST = list(ETF_METADATA.keys())
+# The ETF list lives in etf_universe.json (see etf_universe.py), shared with
+# fetch_snapshot.py and dashboard.py.
+# ETF_METADATA: Ticker -> {"Index", "Name", "Category", "Issuer", "Label"}
+ETF_METADATA = UNIVERSE.by_ticker
+
+# Index Names are NOT unique, so we always fetch and key by Ticker.
+MSCI_TICKERS_LIST = UNIVERSE.tickers
 
 # CATEGORIES mapping (Category -> [Tickers])
-CATEGORIES = {}
-for ticker, meta in ETF_METADATA.items():
-    cat = meta["Category"]
-    if cat not in CATEGORIES:
-        CATEGORIES[cat] = []
-    CATEGORIES[cat].append(ticker) # Store Ticker, not Index Name
+CATEGORIES = UNIVERSE.by_category
 
 # --- DATA FETCHING ---
 
-@st.cache_data(ttl=3600*12)
-def fetch_data():
-    """Fetches history with safety measures."""
-    # 3 years + buffer (User Request)
-    start_date = datetime.now() - timedelta(days=365*3 + 30)
-    
-    tickers_list = MSCI_TICKERS_LIST
-    
-    try:
-        # optimize: Download in batches to avoid Timeouts/Memory issues on Cloud
-        chunk_size = 5
-        dfs = []
-        
-        # Progress bar
-        progress_bar = st.progress(0)
-        
-        for i in range(0, len(tickers_list), chunk_size):
-            batch = tickers_list[i:i + chunk_size]
-            try:
-                # Download batch
-                df_batch = yf.download(batch, start=start_date, progress=False, threads=False) # threads=False is surprisingly safer for small batches on cloud
-                
-                if not df_batch.empty:
-                    # Isolate Close column for this batch
-                    if isinstance(df_batch.columns, pd.MultiIndex):
-                        # yfinance structure: (Price, Ticker)
-                        # We want Close price for each ticker
-                        if 'Close' in df_batch.columns.get_level_values(0):
-                             dfs.append(df_batch['Close'])
-                        else:
-                             dfs.append(df_batch.xs('Close', axis=1, level=1, drop_level=True))
-                    else:
-                        if 'Close' in df_batch.columns:
-                             dfs.append(df_batch['Close'])
-                        else:
-                             dfs.append(df_batch)
-            except Exception as e:
-                print(f"Error fetching batch {batch}: {e}")
-            
-            # Update progress
-            progress_bar.progress(min((i + chunk_size) / len(tickers_list), 1.0))
-            
-        progress_bar.empty()
-        
-        if not dfs:
-            st.error("Download returned empty dataframe.")
-            return pd.DataFrame()
+@diagnostics.tracked_cache("refresher", st.cache_resource)
+def get_refresher():
+    """One background refresher per process (prices + fundamentals, stale-while-revalidate)."""
+    # Price history: local store + only the missing bars (see price_store / fetch_scheduler).
+    # Fundamentals: snapshot first, live fallback (see fundamentals.py).
+    return BackgroundRefresher(UNIVERSE).start()
 
-        # Combine batches
-        df_close = pd.concat(dfs, axis=1)
 
-        # Clean
-        df_close.index = df_close.index.tz_localize(None)
-        df_close.ffill(inplace=True)
-        
-        # Ensure columns are Tickers (yfinance usually does this, but let's be sure)
-        # If we had single ticker batch, it might not have ticker name as column
-        # Batch download normally returns dataframe with columns = Tickers
-        
-        return df_close
-        
-    except Exception as e:
-        st.error(f"Fetch Error: {e}")
-        return pd.DataFrame()
+@diagnostics.tracked_cache("intraday_stream", st.cache_resource)
+def get_intraday_stream():
+    """Process-wide ring buffers of today's 5m bars (shared by all sessions, polled in the background)."""
+    return IntradayStream().start()
 
 
-@st.cache_data(ttl=300) # shorter cache for intraday
 def fetch_intraday_data(tickers):
-    """Fetches 1D intraday data (5m interval) for selected tickers."""
+    """Today's 5m bars of the selected tickers as buffered so far (never calls upstream)."""
     if not tickers:
         return pd.DataFrame()
         
     try:
-        # Download in one go (small enough usually) or batch if needed
-        # For 1D intraday, yfinance is usually fast.
-        df    = yf.download(tickers, period="1d", interval="5m", progress=False, threads=True)
-        
-        if df.empty:
-            return pd.DataFrame()
-            
-        # Extract Close
-        if isinstance(df.columns, pd.MultiIndex):
-            if 'Close' in df.columns.get_level_values(0):
-                 df_close = df['Close']
-            else:
-                 df_close = df.xs('Close', axis=1, level=1, drop_level=True)
-        else:
-            # Single Ticker Case
-            if 'Close' in df.columns:
-                 # Double brackets to keep as DataFrame
-                 df_close = df[['Close']]
-            else:
-                 df_close = df
-                 
-            # Rename 'Close' to the actual Ticker
-            if len(tickers) == 1:
-                df_close.columns = [tickers[0]]
-            # If multiple tickers but flat columns (unlikely with yfinance), logic might differ
-            # but yfinance standard is MultiIndex for multiple tickers.
-
-        # No Rename needed - we want Tickers as columns
-        # ticker_to_index = {v: k for k, v in MSCI_TICKERS.items() if v in tickers}
-        # df_close.rename(columns=ticker_to_index, inplace=True)
-        
-        # Clean
-        df_close.index = df_close.index.tz_localize(None)
-        df_close.ffill(inplace=True)
-        
-        return df_close
+        # The stream's poller fetches one small delta per watched ticker every
+        # MSCI_INTRADAY_REFRESH seconds; a rerun only reads the buffered frame.
+        # Tickers shown for the first time are empty until the poller's first load.
+        stream = get_intraday_stream()
+        stream.watch(tickers)
+        return stream.frame(tickers)
     except Exception as e:
         st.error(f"Intraday Fetch Error: {e}")
         return pd.DataFrame()
 
-@st.cache_data
-def get_fundamentals():
-    """Fetches fundamental data (Snapshot fallback for Cloud)."""
-    rows = []
-    
-    # 1. Try Loading Snapshot (Fastest/Safest for Cloud)
-    import json
-    import os
-    
-    # Locate json in the same directory as app.py
-    snapshot_path = os.path.join(os.path.dirname(__file__), 'etf_snapshot.json')
-    if os.path.exists(snapshot_path):
-        try:
-            with open(snapshot_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                df = pd.DataFrame(data)
-                # Ensure Metadata Columns exist (Critical for Merge)
-                df["Index Name"] = df["Ticker"].map(lambda t: ETF_METADATA.get(t, {}).get("Index", ""))
-                df["ETF Name"] = df["Ticker"].map(lambda t: ETF_METADATA.get(t, {}).get("Name", ""))
-                return df.set_index("Ticker", drop=False)
-        except:
-            pass
-            
-    # 2. Live Fetch (Fallback/Local)
-    # On Streamlit Cloud, this often returns empty or blocks.
-    for ticker, meta in ETF_METADATA.items():
-        try:
-            stock = yf.Ticker(ticker)
-            info = stock.info
-            
-            price = info.get('regularMarketPreviousClose') or info.get('previousClose')
-            nav = info.get('navPrice')
-            
-            premium = None
-            if price and nav:
-                premium = ((price - nav) / nav) * 100
-            
-            rows.append({
-                "Index Name": meta["Index"],
-                "ETF Name": meta["Name"], 
-                "Ticker": ticker,
-                "Price": price,
-                "NAV": nav,
-                "Premium %": premium,
-                "AUM (B)": info.get('totalAssets'),
-                "P/E": info.get('trailingPE'),
-                "P/B": info.get('priceToBook'),
-                "Yield %": (info.get('yield', 0) or 0) * 100
-            })
-        except:
-            pass
-    return pd.DataFrame(rows)
-
-def calculate_returns(df_prices):
-    """Calculates returns for all requested available timeframes, handling data gaps robustly."""
-    results = {}
-    
-    if df_prices.empty:
+# 1D / 1W charts use 5m bars: the local archive (intraday_archive.py) + today's live stream.
+# Sessions per time frame; until the archive holds that many, the frame shows daily closes.
+INTRADAY_SESSIONS = {"1D": 1, "1W": 5}
+
+def load_intraday_window(tickers, timeframe, tr=None):
+    """
+    5m closes of the last sessions of timeframe, or an empty frame (use daily closes).
+    With tr (a TotalReturn), each bar is scaled by its day's dividend factor.
+    """
+    sessions = INTRADAY_SESSIONS[timeframe]
+    df = intraday_archive.session_window(list(tickers), sessions, fetch_intraday_data(tickers))
+    if df.empty or df.index.normalize().nunique() < sessions:
         return pd.DataFrame()
+    return total_return.apply_to_intraday(df, tr) if tr is not None else df
 
-    # We need to process each column individually because tickers might have different end dates
-    # (e.g. Foreign ETFs vs Japan ETFs with different holidays)
-    
-    periods = {
-        '1D': 1,
-        '1W': 7,
-        '1M': 30,
-        '3M': 91,
-        '1Yr': 365,
-        '3Yr': 365*3,
-        '5Yr': 365*5
-    }
-    
-    # Pre-calculate calendar dates (base reference is today)
-    now = datetime.now()
-    # For calendar metrics (YTD, MTD), we still use a fixed reference point relative to the LATEST data available.
-    # But ideally, we should use the latest date *per ticker*.
-    
-    final_data = []
-
-    for ticker in df_prices.columns:
-        series = df_prices[ticker].dropna()
-        if series.empty:
-            continue
-            
-        last_dt = series.index[-1]
-        last_price = series.iloc[-1]
-        
-        ticker_res = {}
-        ticker_res['Ticker'] = ticker # temporary key for alignment
-        
-        # 1. Rolling Periods
-        for name, days in periods.items():
-            target_dt = last_dt - timedelta(days=days)
-            # Find price on or before target
-            past_series = series[series.index <= target_dt]
-            if not past_series.empty:
-                start_price = past_series.iloc[-1]
-                ticker_res[name] = ((last_price - start_price) / start_price) * 100
-            else:
-                ticker_res[name] = None
-        
-        # 2. Calendar Periods
-        # MTD
-        mtd_target = last_dt.replace(day=1) - timedelta(days=1)
-        past_series = series[series.index <= mtd_target]
-        if not past_series.empty:
-             ticker_res['MTD'] = ((last_price - past_series.iloc[-1]) / past_series.iloc[-1]) * 100
-        else:
-             ticker_res['MTD'] = None
-
-        # QTD
-        curr_month = last_dt.month
-        q_month = ((curr_month - 1) // 3) * 3 + 1
-        qtd_target = datetime(last_dt.year, q_month, 1) - timedelta(days=1)
-        past_series = series[series.index <= qtd_target]
-        if not past_series.empty:
-             ticker_res['QTD'] = ((last_price - past_series.iloc[-1]) / past_series.iloc[-1]) * 100
-        else:
-             ticker_res['QTD'] = None
-
-        # YTD
-        ytd_target = datetime(last_dt.year - 1, 12, 31)
-        past_series = series[series.index <= ytd_target]
-        if not past_series.empty:
-             ticker_res['YTD'] = ((last_price - past_series.iloc[-1]) / past_series.iloc[-1]) * 100
-        else:
-             ticker_res['YTD'] = None
-             
-        final_data.append(ticker_res)
-        
-    if not final_data:
-        return pd.DataFrame()
-        
-    # Convert to DataFrame
-    df_res = pd.DataFrame(final_data)
-    if 'Ticker' in df_res.columns:
-        # Match index to original df_prices columns (Tickers/Index Names)
-        # But wait, df_prices columns ARE the names (Index Names or Tickers depending on where this is called).
-        # In main, we renamed columns to 'Index Name'.
-        # Let's verify what df_prices.columns are.
-        # In fetch_data, we did: ticker_to_index = ... rename ...
-        # So columns are "MSCI ACWI", etc.
-        
-        # We need to set the index back to the column name
-        df_res.set_index('Ticker', inplace=True)
-    
-    return df_res
+# Fundamentals history ranges (days back, None = everything stored)
+HISTORY_RANGES = {"90D": 90, "1Yr": 365, "3Yr": 365*3, "MAX": None}
 
-def filter_by_timeframe(df, timeframe):
-    """Filters dataframe based on selected timeframe."""
-    if df.empty:
-        return df
-        
-    end_date = df.index[-1]
-    start_date = df.index[0] # Default filter
-    
-    if timeframe == "1D":
-        start_date = end_date - timedelta(days=1)
-    elif timeframe == "1W":
-        start_date = end_date - timedelta(days=7)
-    elif timeframe == "1M":
-        start_date = end_date - timedelta(days=30)
-    elif timeframe == "3M":
-        start_date = end_date - timedelta(days=90)
-    elif timeframe == "1Yr":
-        start_date = end_date - timedelta(days=365)
-    elif timeframe == "3Yr":
-        start_date = end_date - timedelta(days=365*3)
-    elif timeframe == "YTD":
-        start_date = datetime(end_date.year, 1, 1)
-    elif timeframe == "MTD":
-        start_date = datetime(end_date.year, end_date.month, 1) 
-    elif timeframe == "QTD":
-        q_month = ((end_date.month - 1) // 3) * 3 + 1
-        start_date = datetime(end_date.year, q_month, 1)
-    elif timeframe == "MAX":
-        start_date = df.index[0]
-        
-    return df[df.index >= start_date].copy()
+@diagnostics.tracked_cache("fundamentals_history", st.cache_data(ttl=600))
+def load_fundamentals_history(field, tickers, days):
+    """Date x Ticker history of one fundamentals field (range query on the local history store)."""
+    return fundamentals_history.field_history(field, list(tickers), days=days)
 
 # --- CONFIGURATION & STYLING ---
 st.set_page_config(page_title="MSCI ETF Dashboard Ver.1", layout="wide", page_icon="📈")
 
 # --- APP LOGIC ---
 
-def main():
+def main(run):
     # DEBUG CHECKPOINT
     # st.write("Initializing Dashboard...")
+    # run: diagnostics.RunTimer, run.lap(name) closes the stage that just finished
     
     st.title("MSCI ETF Dashboard Ver.2")
     
@@ -414,19 +152,20 @@ def main():
     # ... (formatting) ...
 
     # 1. Fetch Data
-    status_text = st.empty()
-    status_text.text("Fetching 3 years of data... please wait.")
+    # Always the last good dataset, refreshed in the background (never waits on Yahoo)
+    refresher = get_refresher()
+    dataset = refresher.current()
     
-    df_prices = fetch_data()
-    df_fund = get_fundamentals()
-    
-    status_text.empty()
+    df_prices = dataset.prices
+    df_fund = dataset.fundamentals
+    startup.TIMER.mark("data")
+    run.lap("dataset")
 
     # --- CATEGORY FILTER ---
     st.sidebar.header("Filter Options")
     
     # Get unique categories
-    all_categories = sorted(list(set(m["Category"] for m in ETF_METADATA.values())))
+    all_categories = sorted(CATEGORIES)
     
     # Sidebar Multiselect
     selected_categories = st.sidebar.multiselect(
@@ -438,14 +177,19 @@ def main():
     # Filter Tickers based on Category
     
     # Filter Tickers based on Category
-    valid_tickers = [t for t, m in ETF_METADATA.items() if m["Category"] in selected_categories]
+    valid_tickers = UNIVERSE.tickers_in(selected_categories)
     # valid_indices is no longer needed for filtering df_prices, as df_prices now uses Tickers
     
+    # Price or dividend-reinvested (配当込み) basis for the table, charts and risk
+    basis = st.sidebar.radio("Returns", ["Price", "Total return"], key="basis",
+                             help="Total return reinvests dividends on the ex-date (like the 配当込み indices).")
+    use_tr = basis == "Total return"
+    tr = dataset.total_return if use_tr else None
+
     # Filter Dataframes
     if not df_prices.empty:
-        # Keep only columns that are in valid_tickers
-        cols_to_keep = [c for c in df_prices.columns if c in valid_tickers]
-        df_prices = df_prices[cols_to_keep]
+        # Keep only columns that are in valid_tickers (a view of the shared matrix, categories are column blocks)
+        df_prices = (dataset.tr_shared if use_tr else dataset.shared).select(valid_tickers)
 
     if not df_fund.empty:
         # Filter fundamental rows
@@ -458,43 +202,45 @@ def main():
     else:
         st.caption("Data as of: Unknown")
 
+    st.caption(f"Last refreshed: {dataset.as_of.strftime('%Y-%m-%d %H:%M')}"
+               + (" (refresh in progress...)" if refresher.refreshing else ""))
+
+    run.lap("filter")
+
     if df_prices.empty:
-        st.error("No data available. Please check connections or adjust filters.")
+        if refresher.refreshing and dataset.source == "store":
+            st.info("Downloading 3 years of data in the background... reload the page in a moment.")
+        else:
+            st.error("No data available. Please check connections or adjust filters.")
         return
 
     # 2. Time Frame Selection
-    # 1D, 1W, 1M, 3M, MTD, QTD, YTD, 1Yr, 3Yr
-    time_frames = [
-        "1D", "1W", "1M", "3M", "MTD", "QTD", "YTD", "1Yr", "3Yr", "MAX"
-    ]
+    # 1D, 1W, 1M, 3M, MTD, QTD, YTD, 1Yr, 3Yr, MAX
+    time_frames = TIME_FRAMES
     
     col_opt, col_blank = st.columns([4, 1]) # Adjust width
     with col_opt:
         selected_tf = st.radio("Time Frame", time_frames, horizontal=True, label_visibility="collapsed")
 
+    # Precomputed per refresh (dataset.series): rebased-to-0% matrices for every time frame
+    series = dataset.tr_series if use_tr else dataset.series
+    df_normalized = None
+
     # Filter Data based on Time Frame
-    if selected_tf == "1D":
-        # Special Case: Fetch Intraday
+    if selected_tf in INTRADAY_SESSIONS:
+        # Special Case: 5m bars (archive + live)
         intraday_tickers = valid_tickers
-        with st.spinner("Fetching intraday data..."):
-             df_intraday = fetch_intraday_data(intraday_tickers)
+        with st.spinner("Loading intraday data..."):
+             df_intraday = load_intraday_window(intraday_tickers, selected_tf, tr)
+        run.lap("intraday")
         
         if not df_intraday.empty:
-            df_sliced = df_intraday
-        else:
-             # Fallback
-             df_sliced = filter_by_timeframe(df_prices, selected_tf)
-    else:
-        df_sliced = filter_by_timeframe(df_prices, selected_tf)
-    
-    # Rebase to 0%
-    if not df_sliced.empty:
-        # Use bfill to get the first VALID price for each ticker, even if they start at slightly different times.
-        # This prevents the whole column from becoming NaN if iloc[0] is NaN.
-        first_valid_prices = df_sliced.bfill().iloc[0]
-        df_normalized = (df_sliced / first_valid_prices - 1) * 100
-    else:
-        df_normalized = df_sliced
+            # Rebase to 0% (intraday frame is small and changes every few minutes)
+            df_normalized = normalize_prices(df_intraday)
+
+    if df_normalized is None:
+        df_normalized = series.get(selected_tf, df_prices.columns)
+    run.lap("series")
 
     # 3. Main Chart: Performance
     st.subheader("Performance")
@@ -541,6 +287,10 @@ def main():
         )
 
     if selected_tickers_chart:
+        # Shape-preserving downsampling to the chart's point budget (+ WebGL when still large)
+        points = downsample_frame(df_normalized[selected_tickers_chart])
+        run.lap("downsample")
+        Scatter = scatter_class(sum(len(y) for _, y in points.values()))
         fig = go.Figure()
         for col in selected_tickers_chart:
             # col is Ticker
@@ -552,9 +302,10 @@ def main():
             # Use Index Name for Legend to keep it clean
             legend_name = index_name if index_name else ticker
 
-            fig.add_trace(go.Scatter(
-                x=df_normalized.index, 
-                y=df_normalized[col], 
+            x, y = points[col]
+            fig.add_trace(Scatter(
+                x=x, 
+                y=y, 
                 mode='lines', 
                 name=legend_name,
                 hovertemplate=f"<b>{legend_name}</b><br>{etf_name} ({ticker})<br>%{{y:.2f}}%<extra></extra>"
@@ -568,85 +319,64 @@ def main():
             template="plotly_white",
             legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
         )
+        run.lap("chart_build")
+        # Plotly JSON serialization happens inside st.plotly_chart
         st.plotly_chart(fig, use_container_width=True)
+        run.lap("chart_render")
+    startup.TIMER.mark("chart")
 
 
     # Calculate All Returns (using full history for table correctness)
     df_perf = calculate_returns(df_prices)
+    # Trailing creations / redemptions (precomputed per refresh from shares outstanding)
+    df_perf = df_perf.join(dataset.flows.trailing)
+    run.lap("calculate_returns")
     # df_perf index is now Tickers (from my previous fix + fetch_data fix)
 
     # 5. Detailed Table
-    st.subheader("Performance and valuations (%)")
+    st.subheader("Performance and valuations (%)" + (" - total return" if use_tr else ""))
     
-    # Base Data: Performance
+    tab_table, tab_risk = st.tabs(["Returns & Valuations", "Risk"])
+    with tab_table:
+        # Base Data: Performance
     
-    cols_perf = ['1D', '1W', '1M', '3M', 'MTD', 'QTD', 'YTD', '1Yr', '3Yr']
-    cols_nav = ['Price', 'NAV', 'Premium %', 'AUM (B)']
-    cols_fund = ['P/B', 'P/E', 'Yield %']
-    cols_meta = ['Category', 'Index Name', 'ETF Name', 'Ticker']
-    final_cols_order = cols_meta + cols_perf + cols_nav + cols_fund 
+        if df_fund.empty:
+            st.warning("⚠️ Live fundamental data (NAV, P/E, AUM) temporarily unavailable. Showing Performance only.")
 
-    if not df_fund.empty:
-        # DEBUG: Check columns
-        # st.write("Fund Columns:", df_fund.columns.tolist())
-        # st.write("Perf Index:", df_perf.index.name)
-        
-        # Add Category if missing (from snapshot or live)
-        if "Category" not in df_fund.columns:
-             df_fund["Category"] = df_fund["Ticker"].map(lambda t: ETF_METADATA.get(t, {}).get("Category", ""))
-
-        # Merge Performance with Fundamentals
-        # df_fund has "Ticker" column. df_perf index is Ticker.
-        # df_fund ALSO has Ticker as Index (from get_fundamentals).
-        # We merge on Index to avoid "Ticker is both index and column" error.
-        df_final = df_fund.merge(df_perf, left_index=True, right_index=True, how="left")
-    else:
-        st.warning("⚠️ Live fundamental data (NAV, P/E, AUM) temporarily unavailable. Showing Performance only.")
-        df_final = df_perf.copy()
-        df_final["Ticker"] = df_final.index
-        df_final["Index Name"] = df_final.index.map(lambda t: ETF_METADATA.get(t, {}).get("Index", ""))
-        df_final["ETF Name"] = df_final.index.map(lambda t: ETF_METADATA.get(t, {}).get("Name", ""))
-        df_final["Category"] = df_final.index.map(lambda t: ETF_METADATA.get(t, {}).get("Category", ""))
-        
-        for c in cols_nav + cols_fund:
-             df_final[c] = pd.NA
- 
-    # Filter only existing columns
-    final_cols = [c for c in final_cols_order if c in df_final.columns]
-    
-    # Safe formatter
-    def safe_fmt(fmt):
-        return lambda x: fmt.format(x) if pd.notnull(x) and x is not None and x is not pd.NA else ""
-        
-    def fmt_aum(x):
-        if pd.notnull(x) and x is not None and x is not pd.NA:
-            try:
-                return f"{float(x)/1_000_000_000:,.1f}B" # Billions
-            except:
-                return ""
-        return ""
-
-    format_dict = {c: safe_fmt("{:+.1f}") for c in cols_perf}
-    format_dict.update({
-        'Price': safe_fmt("{:,.0f}"),
-        'NAV': safe_fmt("{:,.0f}"),
-        'Premium %': safe_fmt("{:+.2f}"),
-        'AUM (B)': fmt_aum,
-        'P/B': safe_fmt("{:.1f}"),
-        'P/E': safe_fmt("{:.1f}"),
-        'Yield %': safe_fmt("{:.1f}"),
-        'ETF Name': lambda x: x # String
-    })
-
-    st.dataframe(
-        df_final[final_cols].style
-        .format(format_dict)
-        .background_gradient(subset=['YTD'], cmap="ocean_r", vmin=-20, vmax=40) 
-        .set_properties(**{'white-space': 'wrap'}, subset=['Index Name', 'ETF Name']),
-        use_container_width=True,
-        height=800,
-        hide_index=True
-    )
+        df_final = build_final_table(df_fund, df_perf, UNIVERSE)
+        final_cols = visible_columns(df_final)
+        run.lap("merge")
+
+        if TABLE_MODE == "styler":
+            table, config = style_table(df_final, final_cols), None
+        else:
+            # Vectorized numeric columns; formats + YTD scale are applied by st.dataframe itself
+            table, config = display_frame(df_final, final_cols), column_config(final_cols)
+        run.lap("table_build")
+        st.dataframe(
+            table,
+            column_config=config,
+            use_container_width=True,
+            height=800,
+            hide_index=True
+        )
+        run.lap("table_render")
+
+    with tab_risk:
+        # Precomputed per refresh for every time frame (dataset.risk), so this is a lookup
+        risk_tf = st.radio("Risk Time Frame", RISK_TIME_FRAMES, horizontal=True, index=RISK_TIME_FRAMES.index("1Yr"), key="risk_tf")
+        df_risk = risk_table((dataset.tr_risk if use_tr else dataset.risk).get(risk_tf, df_prices.columns), UNIVERSE)
+        st.caption(f"Daily returns, annualized. Beta / correlation vs {get_display_name(RISK_BENCHMARK)}.")
+        st.dataframe(
+            df_risk,
+            column_config=risk_column_config(),
+            use_container_width=True,
+            height=800,
+            hide_index=True
+        )
+    run.lap("risk_table")
+    # Time to first meaningful paint: title, chart and table on screen (logged once per process)
+    startup.TIMER.paint()
 
     # 3. Chart (Optional, kept at bottom)
     with st.expander("Show Price Chart"):
@@ -661,20 +391,16 @@ def main():
         
         if selected_etfs_price:
             # Filter
-            if price_tf == "1D":
-                 with st.spinner("Fetching intraday..."):
-                     df_intraday = fetch_intraday_data(selected_etfs_price)
+            df_price_sliced = None
+            if price_tf in INTRADAY_SESSIONS:
+                 with st.spinner("Loading intraday..."):
+                     df_intraday = load_intraday_window(selected_etfs_price, price_tf, tr)
                  if not df_intraday.empty:
-                     df_price_sliced = df_intraday
-                 else:
-                     df_price_sliced = filter_by_timeframe(df_prices[selected_etfs_price], price_tf)
-            else:
-                 df_price_sliced = filter_by_timeframe(df_prices[selected_etfs_price], price_tf)
+                     df_price_sliced = normalize_prices(df_intraday) if normalize else df_intraday
             
-            if normalize and not df_price_sliced.empty:
-                 # Use bfill().iloc[0] for robustness against start-of-day NaNs
-                 first_valid = df_price_sliced.bfill().iloc[0]
-                 df_price_sliced = (df_price_sliced / first_valid - 1) * 100
+            if df_price_sliced is None:
+                 # Lookup into the precomputed matrices, no per-rerun slicing or rebasing
+                 df_price_sliced = series.get(price_tf, selected_etfs_price, normalized=normalize)
             
             # Rename columns to ETF Name for Legend
             if not df_price_sliced.empty:
@@ -689,11 +415,14 @@ def main():
                 df_chart = df_price_sliced.rename(columns=rename_dict)
                 
                 # Use Plotly instead of st.line_chart for robustness and consistency
+                points = downsample_frame(df_chart)
+                Scatter = scatter_class(sum(len(y) for _, y in points.values()))
                 fig_price = go.Figure()
                 for col in df_chart.columns:
-                    fig_price.add_trace(go.Scatter(
-                        x=df_chart.index,
-                        y=df_chart[col],
+                    x, y = points[col]
+                    fig_price.add_trace(Scatter(
+                        x=x,
+                        y=y,
                         mode='lines',
                         name=col,
                         hovertemplate=f"<b>{col}</b><br>%{{y:,.1f}}<extra></extra>"
@@ -703,7 +432,7 @@ def main():
                     hovermode="x unified",
                     margin=dict(l=0, r=0, t=10, b=0),
                     height=400,
-                    yaxis_title="Price (JPY)" if not normalize else "Return (%)",
+                    yaxis_title="Return (%)" if normalize else ("Total return index (JPY)" if use_tr else "Price (JPY)"),
                     template="plotly_white",
                     legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
                 )
@@ -713,11 +442,122 @@ def main():
             else:
                 st.info("No data available for selected range.")
 
+    run.lap("price_chart")
+
+    # 4. Fund Flows (shares outstanding history x close, see fund_flows.py)
+    with st.expander("Show Fund Flows"):
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            flow_tickers = st.multiselect("Select ETF", valid_tickers, default=[t for t in ["2559.T", "1478.T"] if t in valid_tickers], format_func=get_etf_display_name, key="flow_tickers")
+        with col2:
+            flow_freq = st.radio("Frequency", list(FLOW_FREQUENCIES), index=1, horizontal=True, key="flow_freq")
+
+        df_flows = dataset.flows.get(flow_freq, flow_tickers).dropna(how="all")
+        if not df_flows.empty:
+            # Daily bars for 3 years are unreadable; show the last ~120 buckets
+            df_flows = df_flows.iloc[-120:]
+            fig_flow = go.Figure()
+            for col in df_flows.columns:
+                fig_flow.add_trace(go.Bar(
+                    x=df_flows.index,
+                    y=df_flows[col] / 1e9,
+                    name=get_etf_display_name(col),
+                    hovertemplate=f"<b>{col}</b><br>%{{y:+,.2f}}B JPY<extra></extra>"
+                ))
+            fig_flow.update_layout(
+                barmode="group",
+                hovermode="x unified",
+                margin=dict(l=0, r=0, t=10, b=0),
+                height=350,
+                yaxis_title="Net creations (B JPY)",
+                template="plotly_white",
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+            )
+            st.plotly_chart(fig_flow, use_container_width=True)
+        else:
+            st.info("No shares outstanding history stored yet for the selected ETFs.")
+    run.lap("fund_flows")
+
+    # 5. Correlation Heatmap (rolling windows of daily returns, maintained per refresh)
+    with st.expander("Show Correlation Heatmap"):
+        corr_window = st.radio("Window", list(CORR_WINDOWS), index=1, horizontal=True, key="corr_window")
+        # Ordered by the clustering cached with the correlation state (correlated ETFs side by side)
+        df_corr = dataset.correlation.get(corr_window, df_prices.columns)
+        if len(df_corr) >= 2:
+            labels = [f"{ETF_METADATA.get(t, {}).get('Index', t)} ({t})" for t in df_corr.index]
+            fig_corr = go.Figure(go.Heatmap(
+                z=df_corr.to_numpy(),
+                x=list(df_corr.columns),
+                y=labels,
+                zmin=-1, zmax=1,
+                colorscale="RdBu_r",
+                hovertemplate="%{y}<br>%{x}<br>%{z:.2f}<extra></extra>"
+            ))
+            fig_corr.update_layout(
+                margin=dict(l=0, r=0, t=10, b=0),
+                height=max(400, 18 * len(df_corr)),
+                template="plotly_white",
+                yaxis=dict(autorange="reversed")
+            )
+            st.plotly_chart(fig_corr, use_container_width=True)
+        else:
+            st.info("Not enough tickers or history for a correlation matrix.")
+    run.lap("correlation")
+
+    # 6. Fundamentals History (from the snapshots appended by fetch_snapshot.py)
+    with st.expander("Show Fundamentals History"):
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            hist_tickers = st.multiselect("Select ETF", valid_tickers, default=[t for t in ["1478.T"] if t in valid_tickers], format_func=get_etf_display_name, key="fund_hist_tickers")
+        with col2:
+            hist_field = st.selectbox("Metric", fundamentals_history.FIELDS, index=fundamentals_history.FIELDS.index("Premium %"))
+        hist_range = st.radio("Range", list(HISTORY_RANGES), horizontal=True, key="fund_hist_range")
+
+        df_hist = load_fundamentals_history(hist_field, tuple(hist_tickers), HISTORY_RANGES[hist_range]) if hist_tickers else pd.DataFrame()
+
+        if not df_hist.empty:
+            fig_hist = go.Figure()
+            for col in df_hist.columns:
+                fig_hist.add_trace(go.Scatter(
+                    x=df_hist.index,
+                    y=df_hist[col],
+                    mode='lines+markers',
+                    name=get_etf_display_name(col),
+                    hovertemplate=f"<b>{col}</b><br>%{{y:,.2f}}<extra></extra>"
+                ))
+            fig_hist.update_layout(
+                hovermode="x unified",
+                margin=dict(l=0, r=0, t=10, b=0),
+                height=350,
+                yaxis_title=hist_field,
+                template="plotly_white",
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+            )
+            st.plotly_chart(fig_hist, use_container_width=True)
+        else:
+            st.info("No fundamentals history yet. It grows with every run of fetch_snapshot.py.")
+    run.lap("fundamentals_history")
+
 
 if __name__ == '__main__':
+    # ?diag=1 opens the diagnostics panel, ?profile=1 samples the call stack of this rerun
+    show_diag = st.sidebar.checkbox("Diagnostics", value=st.query_params.get("diag") == "1")
+    profiler = diagnostics.SamplingProfiler() if st.query_params.get("profile") == "1" else None
+    run = diagnostics.RunTimer()
     try:
-        main()
+        if profiler:
+            with profiler:
+                main(run)
+        else:
+            main(run)
     except Exception as e:
         import traceback
         st.error(f"An error occurred: {e}")
         st.code(traceback.format_exc())
+    finally:
+        run.finish()
+
+    if profiler:
+        diagnostics.render_profile(st, profiler, profiler.save())
+    if show_diag:
+        diagnostics.render_panel(st)
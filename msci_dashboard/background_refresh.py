@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import correlation_state
+import fund_flows
+import intraday_archive
+import price_store
+import total_return
+from shared_cache import cached_fetch, tickers_key
+from diagnostics import timed
+from fundamentals import load_fundamentals, load_snapshot
+from fund_flows import FlowCache
+from risk_engine import RiskCache
+from series_cache import SeriesCache
+from shared_prices import SharedPrices, category_order
+
+# --- BACKGROUND REFRESH ---
+# A daemon thread keeps prices and fundamentals up to date on a schedule.
+# Sessions always read the last good Dataset immediately (stale-while-revalidate);
+# a finished refresh replaces it in one reference swap, so no rerun ever waits on Yahoo
+# or sees a half-updated dataset.
+
+REFRESH_INTERVAL = int(os.environ.get("MSCI_REFRESH_INTERVAL", str(3600)))  # seconds
+
+# Cross-replica leases (shared_cache.py): short, renewed while the holder computes, so a
+# crashed replica's lease lapses within a minute. Waiting on a live holder (a cold first
+# sync of hundreds of tickers takes minutes) is capped well under the refresh interval.
+SHARED_LEASE_SECONDS = 60
+SHARED_WAIT_SECONDS = 300
+
+# 3 years + buffer (User Request)
+HISTORY_DAYS = 365*3 + 30
+
+
+class Dataset:
+    """One consistent generation of data. Treat as read-only: it is shared by all sessions."""
+
+    def __init__(self, prices, fundamentals, as_of, source, shares=None, order=None, events=None, previous=None):
+        # One read-only float32 matrix in category blocks; sessions take views of it
+        self.shared = SharedPrices(prices, order)
+        self.prices = prices = self.shared.frame
+        self.fundamentals = fundamentals
+        self.shares = shares if shares is not None else pd.DataFrame()
+        self.as_of = as_of      # when this generation was built
+        self.source = source    # "store" (local read at startup) or "refresh"
+        # Sliced / rebased matrices per time frame, built here (refresh thread) not per rerun
+        self.series = SeriesCache(prices)
+        # Risk table per time frame (switching time frame in the Risk tab is a lookup)
+        self.risk = RiskCache(self.series)
+        # Creations / redemptions in JPY (shares outstanding history x close)
+        self.flows = FlowCache(self.shares, prices)
+        # Rolling 1M/3M/1Yr correlation, updated incrementally from the persisted state
+        self.correlation = correlation_state.update(prices)
+        # Dividend-reinvested matrix + its series / risk, for the price / total-return toggle.
+        # Factors extend the previous generation's (see total_return.py)
+        self.total_return = total_return.TotalReturn.build(
+            prices, events if events is not None else total_return.load_events([]),
+            previous.total_return if previous is not None else None
+        )
+        self.tr_shared = SharedPrices(self.total_return.frame(prices), list(prices.columns))
+        self.tr_series = SeriesCache(self.tr_shared.frame)
+        self.tr_risk = RiskCache(self.tr_series)
+
+
+def _history_start():
+    return datetime.now() - timedelta(days=HISTORY_DAYS)
+
+
+def _prepare_prices(df_close):
+    # Clean (store index is already tz-naive)
+    if not df_close.empty:
+        df_close = df_close.ffill()
+    return df_close
+
+
+class BackgroundRefresher:
+    """Serves the current Dataset and rebuilds it every `interval` seconds in the background."""
+
+    def __init__(self, universe, interval=REFRESH_INTERVAL):
+        self.universe = universe
+        self.tickers = list(universe.tickers)
+        self.order = category_order(universe)
+        self.interval = interval
+        self.wait_timeout = min(SHARED_WAIT_SECONDS, interval / 4)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.refreshing = False
+        self.last_error = None
+        self.thread = None
+
+        # Start from whatever is already on disk so the very first session has something to show
+        self._dataset = Dataset(
+            prices=_prepare_prices(price_store.load_prices(self.tickers, _history_start())),
+            fundamentals=load_snapshot(universe),  # no live fallback here: it would block
+            shares=fund_flows.load_shares(self.tickers, _history_start()),
+            order=self.order,
+            events=total_return.load_events(self.tickers),
+            as_of=datetime.now(),
+            source="store"
+        )
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="msci-refresher", daemon=True)
+            self.thread.start()
+        return self
+
+    def current(self):
+        """Returns the last good Dataset (never blocks on the network)."""
+        with self.lock:
+            return self._dataset
+
+    def refresh_now(self):
+        """Asks the worker to refresh on its next loop instead of waiting for the interval."""
+        self.wakeup.set()
+
+    def refresh(self):
+        """Builds a new Dataset and swaps it in. Keeps the old one if anything fails."""
+        self.refreshing = True
+        try:
+            # Through the cross-replica cache: one replica fetches per interval, the rest reuse it
+            ttl = self.interval * 0.9  # < interval, so the fetching replica's next run finds it expired
+            with timed("refresh.prices"):
+                prices = cached_fetch(
+                    tickers_key("prices", self.tickers), ttl,
+                    lambda: _prepare_prices(price_store.sync_prices(self.tickers, _history_start())),
+                    lease_seconds=SHARED_LEASE_SECONDS, wait_timeout=self.wait_timeout
+                )
+            with timed("refresh.shares"):
+                shares = cached_fetch(
+                    tickers_key("shares", self.tickers), ttl,
+                    lambda: fund_flows.sync_shares(self.tickers, _history_start()),
+                    lease_seconds=SHARED_LEASE_SECONDS, wait_timeout=self.wait_timeout
+                )
+            with timed("refresh.fundamentals"):
+                fundamentals = cached_fetch(
+                    tickers_key("fundamentals", self.tickers), ttl,
+                    lambda: load_fundamentals(self.universe),
+                    lease_seconds=SHARED_LEASE_SECONDS, wait_timeout=self.wait_timeout
+                )
+
+            old = self.current()
+            if prices.empty:
+                prices = old.prices
+            if shares.empty:
+                shares = old.shares
+            if fundamentals.empty:
+                fundamentals = old.fundamentals
+
+            # Written by the price sync (this replica's or the one holding the lease)
+            events = total_return.load_events(self.tickers)
+
+            with timed("refresh.series_cache"):
+                dataset = Dataset(prices, fundamentals, datetime.now(), "refresh", shares, self.order,
+                                  events=events, previous=old)
+            with self.lock:
+                self._dataset = dataset
+            self.last_error = None
+        except Exception as e:
+            print(f"Background refresh failed: {e}")
+            self.last_error = f"{datetime.now():%Y-%m-%d %H:%M:%S} {e}"
+        finally:
+            self.refreshing = False
+        self.archive_intraday()
+
+    def archive_intraday(self):
+        """Appends new 5m bars to the on-disk intraday archive (one replica per interval writes)."""
+        try:
+            with timed("refresh.intraday_archive"):
+                cached_fetch(
+                    tickers_key("intraday_archive", self.tickers), self.interval * 0.9,
+                    lambda: {"bars": intraday_archive.sync(self.tickers), "at": datetime.now()},
+                    lease_seconds=SHARED_LEASE_SECONDS, wait_timeout=self.wait_timeout
+                )
+        except Exception as e:
+            print(f"Intraday archive sync failed: {e}")
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            self.refresh()
+            elapsed = time.monotonic() - started
+            self.wakeup.wait(max(self.interval - elapsed, 0))
+            self.wakeup.clear()
+
@@ -1,10 +1,10 @@
-import yfinance as yf
 from datetime import datetime
 
+from providers import get_provider
+
 ticker = "2559.T"
 print(f"Checking timestamps for {ticker}...")
-stock = yf.Ticker(ticker)
-info = stock.info
+info = get_provider().info(ticker)
 
 # Check for various timestamp keys
 keys_to_check = [
@@ -0,0 +1,239 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from price_store import DATA_DIR
+
+# --- ROLLING CORRELATION / COVARIANCE ---
+# Cross-ETF covariance and correlation over rolling 1M / 3M / 1Yr windows of daily returns,
+# maintained incrementally: for each window we keep pairwise sums (count, sum x, sum x^2,
+# sum xy over the days both tickers traded), so a new daily bar is one O(N^2) add and the
+# bar leaving the window one O(N^2) subtract, instead of an O(W * N^2) recompute.
+# The state is persisted next to the price store and picked up again on restart.
+#
+# Only finalized bars are committed: the latest bar can still change (intraday snapshot,
+# re-fetched on the next sync), so it is applied on a copy each time a view is built.
+
+STATE_PATH = os.path.join(DATA_DIR, "correlation", "state.npz")
+
+# Window name -> trading days
+CORR_WINDOWS = {"1M": 21, "3M": 63, "1Yr": 252}
+MAX_WINDOW = max(CORR_WINDOWS.values())
+
+# Adds and subtracts accumulate rounding error; rebuild the sums from the kept returns now and then
+REBUILD_EVERY = 252
+
+
+class WindowSums:
+    """Pairwise-complete sums over the returns currently in one window (all N x N)."""
+
+    def __init__(self, n):
+        self.count = np.zeros((n, n))
+        self.sum_x = np.zeros((n, n))    # [i, j]: sum of x_i over days where i and j both traded
+        self.sum_xx = np.zeros((n, n))   # [i, j]: sum of x_i^2 over the same days
+        self.sum_xy = np.zeros((n, n))
+
+    def add(self, r, sign=1.0):
+        valid = ~np.isnan(r)
+        x = np.where(valid, r, 0.0)
+        v = valid.astype(np.float64)
+        self.count += sign * np.outer(v, v)
+        self.sum_x += sign * np.outer(x, v)
+        self.sum_xx += sign * np.outer(x * x, v)
+        self.sum_xy += sign * np.outer(x, x)
+
+    def copy(self):
+        out = WindowSums(0)
+        out.count, out.sum_x, out.sum_xx, out.sum_xy = (
+            self.count.copy(), self.sum_x.copy(), self.sum_xx.copy(), self.sum_xy.copy())
+        return out
+
+    def covariance(self):
+        """(cov, corr) N x N; NaN where a pair has fewer than 3 common days."""
+        with np.errstate(all="ignore"):
+            n = self.count
+            cov = (self.sum_xy - self.sum_x * self.sum_x.T / n) / (n - 1)
+            var_i = (self.sum_xx - self.sum_x ** 2 / n) / (n - 1)
+            corr = cov / np.sqrt(var_i * var_i.T)
+        bad = n < 3
+        cov[bad] = np.nan
+        corr[bad] = np.nan
+        return cov, np.clip(corr, -1, 1)
+
+
+class CorrelationState:
+    """
+    Committed state: tickers, the last MAX_WINDOW daily returns (oldest first), the close
+    of the last committed date, and one WindowSums per window.
+    """
+
+    def __init__(self, tickers):
+        self.tickers = list(tickers)
+        n = len(self.tickers)
+        self.returns = np.empty((0, n))
+        self.last_date = None
+        self.last_close = np.full(n, np.nan)
+        self.sums = {w: WindowSums(n) for w in CORR_WINDOWS}
+        self.updates = 0
+
+    def push(self, close, date):
+        """Commits one new daily bar (close vector in self.tickers order)."""
+        with np.errstate(all="ignore"):
+            r = close / self.last_close - 1
+        self._push_return(self.returns, self.sums, r)
+        self.returns = np.vstack([self.returns, r[None, :]])[-MAX_WINDOW:]
+        self.last_close = np.where(np.isnan(close), self.last_close, close)
+        self.last_date = date
+        self.updates += 1
+        if self.updates % REBUILD_EVERY == 0:
+            self.rebuild_sums()
+
+    @staticmethod
+    def _push_return(returns, sums, r):
+        for name, window in CORR_WINDOWS.items():
+            sums[name].add(r)
+            if len(returns) >= window:
+                # Return that falls out of this window
+                sums[name].add(returns[len(returns) - window], sign=-1.0)
+
+    def rebuild_sums(self):
+        n = len(self.tickers)
+        for name, window in CORR_WINDOWS.items():
+            sums = WindowSums(n)
+            for r in self.returns[-window:]:
+                sums.add(r)
+            self.sums[name] = sums
+
+    def provisional(self, close):
+        """Window sums with one more (not committed) bar applied, on copies."""
+        with np.errstate(all="ignore"):
+            r = close / self.last_close - 1
+        sums = {name: s.copy() for name, s in self.sums.items()}
+        self._push_return(self.returns, sums, r)
+        return sums
+
+    # -- persistence --
+    def save(self, path=STATE_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {
+            "tickers": np.array(self.tickers),
+            "returns": self.returns,
+            "last_close": self.last_close,
+            "last_date": np.array([np.datetime64(self.last_date, "ns") if self.last_date is not None
+                                   else np.datetime64("NaT", "ns")]),
+            "updates": np.array([self.updates]),
+        }
+        for name, s in self.sums.items():
+            for field in ("count", "sum_x", "sum_xx", "sum_xy"):
+                arrays[f"{name}_{field}"] = getattr(s, field)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                state = cls([str(t) for t in data["tickers"]])
+                state.returns = data["returns"]
+                state.last_close = data["last_close"]
+                last_date = data["last_date"][0]
+                state.last_date = None if np.isnat(last_date) else pd.Timestamp(last_date)
+                state.updates = int(data["updates"][0])
+                for name in CORR_WINDOWS:
+                    s = WindowSums(0)
+                    for field in ("count", "sum_x", "sum_xx", "sum_xy"):
+                        setattr(s, field, data[f"{name}_{field}"])
+                    state.sums[name] = s
+            return state
+        except Exception as e:
+            print(f"Could not read correlation state {path}: {e}")
+            return None
+
+
+def spectral_order(corr):
+    """
+    Heatmap order that puts correlated tickers next to each other: sort by the Fiedler vector
+    of the graph Laplacian with weights (1 + corr) / 2 (NumPy only, no scipy).
+    """
+    n = len(corr)
+    if n < 3:
+        return np.arange(n)
+    w = (1 + np.nan_to_num(corr, nan=0.0)) / 2
+    np.fill_diagonal(w, 0)
+    laplacian = np.diag(w.sum(axis=1)) - w
+    _, vectors = np.linalg.eigh(laplacian)
+    return np.argsort(vectors[:, 1], kind="stable")
+
+
+class CorrelationView:
+    """Per window: cov / corr DataFrames (Ticker x Ticker) and the cluster order of the full universe."""
+
+    def __init__(self, tickers, sums, as_of):
+        self.as_of = as_of
+        self.cov = {}
+        self.corr = {}
+        self.order = {}
+        for name, s in sums.items():
+            cov, corr = s.covariance()
+            self.cov[name] = pd.DataFrame(cov, index=tickers, columns=tickers)
+            self.corr[name] = pd.DataFrame(corr, index=tickers, columns=tickers)
+            self.order[name] = [tickers[i] for i in spectral_order(corr)]
+
+    def get(self, window, tickers):
+        """Correlation submatrix for tickers, in the cached cluster order."""
+        keep = set(tickers)
+        ordered = [t for t in self.order[window] if t in keep]
+        return self.corr[window].loc[ordered, ordered]
+
+
+def _revised(state, close):
+    """
+    True if the closes the state was built from changed: the stored close of last_date no
+    longer matches df_prices (a new split re-downloads the ticker's whole history).
+    """
+    return not np.allclose(state.last_close, close, rtol=1e-6, atol=0.0, equal_nan=True)
+
+
+def update(df_prices, path=STATE_PATH):
+    """
+    Brings the persisted state up to df_prices (Date x Ticker closes, forward-filled) and
+    returns a CorrelationView. Rebuilds from df_prices when the ticker set changed, the
+    stored history no longer lines up (e.g. the store was reset) or past closes were revised.
+    """
+    tickers = list(df_prices.columns)
+    if df_prices.empty or len(df_prices) < 2:
+        return CorrelationView(tickers, {w: WindowSums(len(tickers)) for w in CORR_WINDOWS}, None)
+
+    dates = df_prices.index
+    closes = df_prices.to_numpy(dtype=np.float64)
+    final = len(dates) - 1  # rows [0, final) are committed, row `final` is provisional
+
+    state = CorrelationState.load(path)
+    if state is not None and (state.tickers != tickers or state.last_date is None
+                              or state.last_date not in dates or state.last_date > dates[final - 1]
+                              or _revised(state, closes[dates.get_loc(state.last_date)])):
+        state = None
+
+    if state is None:
+        # Start MAX_WINDOW + 1 rows before the provisional bar (enough for every window)
+        state = CorrelationState(tickers)
+        start = max(final - MAX_WINDOW - 1, 0)
+        state.last_close = closes[start]
+        state.last_date = dates[start]
+        first = start + 1
+    else:
+        first = dates.get_loc(state.last_date) + 1
+
+    for i in range(first, final):
+        state.push(closes[i], dates[i])
+    if first < final or not os.path.exists(path):
+        try:
+            state.save(path)
+        except Exception as e:
+            print(f"Could not write correlation state {path}: {e}")
+
+    return CorrelationView(tickers, state.provisional(closes[final]), dates[final])
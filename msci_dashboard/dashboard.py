@@ -1,10 +1,26 @@
-# --- STEP 1: INSTALL LIBRARIES (If needed) ---
-# Note: In a standard project structure, we use requirements.txt 
-# and install via 'pip install -r requirements.txt'
-# I am keeping the imports but removing the auto-installer for cleaner execution in this script.
+"""
+JPX-listed MSCI ETF report, without Streamlit.
+
+    python msci_dashboard/dashboard.py                          # fetch, print the table, open the chart
+    python msci_dashboard/dashboard.py --out reports/ --formats md html parquet   # headless (cron)
+    python msci_dashboard/dashboard.py --out reports/ --offline # local store only, no network
+
+Prices come from the local price store (price_store.py): only tickers whose stored bars are
+older than --max-age-hours are synced, in parallel, and only from their last stored date.
+Returns use the dashboard's returns_engine, fundamentals the etf_snapshot.json snapshot;
+tickers missing from it reuse recent rows from the fundamentals history, and only the rest
+get live info calls (in parallel), which are then stored for the next run.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
 
+# --- STEP 1: LIBRARIES ---
+# Note: In a standard project structure, we use requirements.txt
+# and install via 'pip install -r requirements.txt'
 try:
-    import yfinance
     import plotly
 except ImportError:
     print("Libraries missing. Please run: pip install -r requirements.txt")
@@ -13,179 +29,223 @@ except ImportError:
 # --- STEP 2: DASHBOARD CODE ---
 import pandas as pd
 import plotly.graph_objects as go
-import yfinance as yf
-from datetime import datetime, timedelta
 
-# 1. Full List of JPX MSCI ETFs
+import fundamentals_history
+import price_store
+from etf_universe import UNIVERSE, Universe
+from fetch_scheduler import fetch_all
+from fundamentals import info_to_row, load_snapshot
+from providers import get_provider
+from returns_engine import calculate_returns, filter_by_timeframe, normalize_prices
+
+# 3 years + buffer, same as the dashboard
+HISTORY_DAYS = 365*3 + 30
+
+FORMATS = ["md", "html", "parquet"]
+
+# Report table columns (returns from returns_engine, valuations from the snapshot)
+REPORT_COLS = ['Ticker', 'Price (JPY)', '1D', '1W', '1M', '3M', 'YTD', '1Yr', '3Yr', 'P/E', 'P/B', 'Yield %']
+
+
+# 1. Data Fetching Engine
+# ---------------------------------------------------------
+def get_prices(tickers, offline=False, max_age_hours=12.0, **scheduler_options):
+    """Close matrix (Date x Ticker) from the local store, syncing only stale tickers first."""
+    start_date = datetime.now() - timedelta(days=HISTORY_DAYS)
+    if not offline:
+        stale = price_store.stale_tickers(tickers, max_age_hours * 3600)
+        if stale:
+            print(f"Syncing {len(stale)}/{len(tickers)} tickers with stale or missing prices...")
+            price_store.sync_prices(stale, start_date, **scheduler_options)
+    return price_store.load_prices(tickers, start_date).ffill()
+
+
+def get_valuations(universe, tickers, offline=False, max_age_hours=12.0, **scheduler_options):
+    """
+    Snapshot rows for tickers. Tickers missing from it come from the fundamentals history
+    (rows fetched by earlier runs) if recent enough, else from live info calls in parallel,
+    which are then appended to the history for the next run.
+    """
+    df = load_snapshot(universe)
+    have = set(df.index) if not df.empty else set()
+    missing = [t for t in tickers if t not in have]
+    parts = [df] if not df.empty else []
+
+    if missing:
+        recent = fundamentals_history.query(missing, start=datetime.now() - timedelta(hours=max_age_hours))
+        if not recent.empty:
+            recent = recent.groupby("Ticker").last()
+            recent["Ticker"] = recent.index
+            parts.append(recent)
+            missing = [t for t in missing if t not in recent.index]
+
+    if missing and not offline:
+        print(f"Fetching info for {len(missing)} tickers missing from the snapshot...")
+        infos, _ = fetch_all(missing, lambda t: get_provider().info(t), kind="info", **scheduler_options)
+        rows = [info_to_row(t, universe.by_ticker.get(t, {"Index": "", "Name": ""}), info) for t, info in infos.items() if info]
+        if rows:
+            fundamentals_history.append_snapshot(rows)
+            parts.append(pd.DataFrame(rows).set_index("Ticker", drop=False))
+
+    if not parts:
+        return pd.DataFrame()
+    df = pd.concat(parts)
+    return df[df.index.isin(tickers)]
+
+
+# 2. Report Table
 # ---------------------------------------------------------
-msci_tickers = {
-    # --- GLOBAL & REGIONAL ---
-    "Global (MSCI ACWI)": "2559.T",
-    "Global ex-JP (MSCI ACWI ex-JP)": "1554.T",
-    "Dev Mkts (MSCI Kokusai)": "1550.T",
-    "Dev Mkts (MSCI Kokusai) #2": "1680.T",   # Added from PDF
-    "Dev Mkts Unhedged (MSCI Kokusai)": "2513.T",
-    "Dev Mkts ex-JP (MSCI Core)": "1657.T",
-    "Emerging (MSCI EM)": "1681.T",
-    "Emerging (MSCI EM IMI)": "1658.T",
-    "Emerging Unhedged (MSCI EM)": "2520.T",
-    "Saudi Arabia (MSCI Saudi)": "273A.T",    # Note: Very new listing
-
-    # --- JAPAN STRATEGY / ESG ---
-    "Japan High Div (MSCI)": "1478.T",
-    "Japan Min Vol (MSCI)": "1477.T",
-    "Japan High Div Low Vol (MSCI)": "1399.T",
-    "Japan ESG Select (MSCI)": "1653.T",
-    "Japan SRI (MSCI)": "2851.T",
-    "Japan Women (MSCI WIN)": "1652.T",
-    "Japan Women Select (MSCI)": "2518.T",
-    "Japan Human/Phys Inv (MSCI)": "1479.T",
-    "Japan Governance (MSCI)": "2636.T",
-    "Japan Country Select (MSCI)": "2643.T",
-    "Japan Climate Change (MSCI)": "2848.T",
-    "Japan Climate Action (MSCI)": "2250.T",
-    "Japan Climate Select (MSCI)": "294A.T",
-    "Japan SuperDiv (MSCI)": "2564.T",
-    "Japan Cash Flow King (MSCI)": "234A.T",
-
-    # --- HEDGED / SPECIALTY ---
-    "Dev Mkts Hedged (MSCI Kokusai)": "2514.T",
-    "Japan Long/Short (MSCI)": "1490.T",
-}
-
-# 2. Data Fetching Engine
+def build_report(df_prices, df_valuations, universe):
+    """One row per ticker (index: display label), returns + valuations."""
+    df = calculate_returns(df_prices)
+    if not df_valuations.empty:
+        vals = df_valuations[["Price", "P/E", "P/B", "Yield %"]].apply(pd.to_numeric, errors="coerce")
+        df = df.join(vals)
+    else:
+        df["Price"] = df_prices.iloc[-1]
+    df = df.rename(columns={"Price": "Price (JPY)"})
+    df["Ticker"] = df.index
+    df.index = [universe.get(t, "Label") or t for t in df.index]
+    df.index.name = "Index Name"
+    cols = [c for c in REPORT_COLS if c in df.columns]
+    return df[cols].sort_values("YTD", ascending=False)
+
+
+# 3. Visualization
 # ---------------------------------------------------------
-def get_dashboard_data(ticker_dict):
-    price_data = {}
-    valuation_rows = []
-    
-    # Fetch data starting 400 days ago to ensure we have a full 1-Year return
-    start_date = datetime.now() - timedelta(days=400) 
-
-    print(f"Fetching data for {len(ticker_dict)} MSCI ETFs from JPX...")
-    print("Note: New listings (like 234A) may have missing data.")
-    
-    for name, ticker in ticker_dict.items():
-        try:
-            stock = yf.Ticker(ticker)
-            
-            # A. Price History
-            hist = stock.history(start=start_date)
-            
-            if not hist.empty:
-                # Store closing prices
-                price_data[name] = hist['Close']
-                
-                # B. Fundamentals (Valuations)
-                info = stock.info
-                
-                # Calculate YTD Return manually
-                ytd_start_df = hist[hist.index.year == datetime.now().year]
-                if not ytd_start_df.empty:
-                    ytd_start_price = ytd_start_df['Close'].iloc[0]
-                    current_price = hist['Close'].iloc[-1]
-                    ytd_ret = ((current_price - ytd_start_price) / ytd_start_price) * 100
-                else:
-                    ytd_ret = 0.0
-
-                valuation_rows.append({
-                    "Index Name": name,
-                    "Ticker": ticker,
-                    "Price (JPY)": hist['Close'].iloc[-1],
-                    "YTD %": round(ytd_ret, 1),
-                    # Handle missing fundamental data gracefully
-                    "P/E": info.get('trailingPE', None),
-                    "P/B": info.get('priceToBook', None),
-                    "Yield %": round(info.get('yield', 0) * 100, 2) if info.get('yield') else None
-                })
-        except Exception as e:
-            # Just print error and continue, don't crash
-            print(f" > Skipped {name} ({ticker}): {e}")
-
-    if not valuation_rows:
-        print("No valuation data collected.")
-        return pd.DataFrame(), pd.DataFrame()
-
-    return pd.DataFrame(price_data), pd.DataFrame(valuation_rows).set_index("Index Name")
-
-# Run the fetch
-df_prices, df_valuations = get_dashboard_data(msci_tickers)
-
-# 3. Calculate Performance Metrics (1M, 3M, 1Y)
+def plot_msci_performance(df):
+    # Sort by YTD performance for the chart
+    df_sorted = df.sort_values('YTD', ascending=True)
+
+    fig = go.Figure()
+
+    # 1 Year Bar (Green)
+    fig.add_trace(go.Bar(
+        y=df_sorted.index, x=df_sorted['1Yr'],
+        name='1 Year', orientation='h', marker_color='#4c8c2b'
+    ))
+
+    # YTD Bar (Blue/Cyan)
+    fig.add_trace(go.Bar(
+        y=df_sorted.index, x=df_sorted['YTD'],
+        name='YTD', orientation='h', marker_color='#17a2b8'
+    ))
+
+    fig.update_layout(
+        title="JPX-Listed MSCI ETF Performance",
+        xaxis_title="Return (%)",
+        barmode='group',
+        height=max(400, 30 * len(df_sorted)),
+        template="plotly_white",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+
+def plot_normalized(df_prices, universe, timeframe="1Yr"):
+    df = normalize_prices(filter_by_timeframe(df_prices, timeframe))
+    fig = go.Figure()
+    for t in df.columns:
+        fig.add_trace(go.Scatter(x=df.index, y=df[t], mode="lines", name=universe.get(t, "Label") or t))
+    fig.update_layout(
+        title=f"Performance ({timeframe}, rebased to 0%)",
+        yaxis_title="Return (%)",
+        hovermode="x unified",
+        height=600,
+        template="plotly_white"
+    )
+    return fig
+
+
+# 4. Output
 # ---------------------------------------------------------
-def calculate_metrics(df_prices):
-    metrics = []
-    for col in df_prices.columns:
-        series = df_prices[col]
-        # Percentage change periods (assuming ~21 trading days/month)
-        ret_1m = series.pct_change(periods=21).iloc[-1] * 100
-        ret_3m = series.pct_change(periods=63).iloc[-1] * 100
-        
-        # 1Y Return (handle cases where ETF is new and has <252 days of data)
-        if len(series) >= 252:
-            ret_1y = series.pct_change(periods=252).iloc[-1] * 100
-        else:
-            ret_1y = None 
-        
-        metrics.append({
-            "Index Name": col,
-            "1M %": round(ret_1m, 1),
-            "3M %": round(ret_3m, 1),
-            "1Y %": round(ret_1y, 1) if ret_1y else None
-        })
-    return pd.DataFrame(metrics).set_index("Index Name")
-
-if not df_prices.empty:
-    df_perf = calculate_metrics(df_prices)
-    # Merge Price Performance with Valuations
-    df_final = df_valuations.join(df_perf)
-
-    # 4. Visualization: Performance Bar Chart
-    # ---------------------------------------------------------
-    def plot_msci_performance(df):
-        # Sort by YTD performance for the chart
-        df_sorted = df.sort_values('YTD %', ascending=True)
-        
-        fig = go.Figure()
-        
-        # 1 Year Bar (Green)
-        fig.add_trace(go.Bar(
-            y=df_sorted.index, x=df_sorted['1Y %'], 
-            name='1 Year', orientation='h', marker_color='#4c8c2b'
-        ))
-
-        # YTD Bar (Blue/Cyan)
-        fig.add_trace(go.Bar(
-            y=df_sorted.index, x=df_sorted['YTD %'], 
-            name='YTD', orientation='h', marker_color='#17a2b8'
-        ))
-        
-        fig.update_layout(
-            title="JPX-Listed MSCI ETF Performance",
-            xaxis_title="Return (%)",
-            barmode='group',
-            height=900,  # Adjusted height for full list
-            template="plotly_white",
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
-        return fig
-
-    # 5. Visualization: Valuation Table
-    # ---------------------------------------------------------
-    # Note: 'display()' is for Jupyter. We will just print the dataframe in standard script.
-    
-    # --- EXECUTION ---
-    print("\nGenerating Dashboard...")
-    fig = plot_msci_performance(df_final)
-    fig.show()
-
-    print("\n--- Valuation Table ---")
-    cols = ['Ticker', 'Price (JPY)', 'YTD %', '1M %', '3M %', '1Y %', 'P/E', 'P/B', 'Yield %']
-    # Filter columns that actually exist in the dataframe
-    cols = [c for c in cols if c in df_final.columns]
-    
-    # Sort and print
-    print(df_final[cols].sort_values('YTD %', ascending=False).to_markdown())
-
-else:
-    print("No data fetched. Please check your internet connection or ticker list.")
+def format_table(df):
+    """Rounded copy for the text outputs (Parquet keeps full precision)."""
+    out = df.copy()
+    for c in out.columns:
+        if c == "Price (JPY)":
+            out[c] = out[c].round(0)
+        elif c != "Ticker":
+            out[c] = out[c].round(2 if c == "Yield %" else 1)
+    return out
+
+
+def write_reports(df_report, df_prices, universe, out_dir, formats, self_contained=False):
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = df_prices.index[-1].strftime("%Y-%m-%d")
+    written = []
+
+    if "md" in formats:
+        path = os.path.join(out_dir, "report.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# JPX-Listed MSCI ETFs ({stamp})\n\n")
+            f.write(format_table(df_report).fillna("").to_markdown())
+            f.write("\n")
+        written.append(path)
+
+    if "html" in formats:
+        path = os.path.join(out_dir, "report.html")
+        plotlyjs = True if self_contained else "cdn"
+        charts = [plot_msci_performance(df_report), plot_normalized(df_prices, universe)]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"<html><head><meta charset='utf-8'><title>MSCI ETF Report {stamp}</title></head><body>\n")
+            f.write(f"<h1>JPX-Listed MSCI ETFs ({stamp})</h1>\n")
+            f.write(format_table(df_report).to_html(na_rep=""))
+            for i, fig in enumerate(charts):
+                f.write(fig.to_html(full_html=False, include_plotlyjs=plotlyjs if i == 0 else False))
+            f.write("\n</body></html>\n")
+        written.append(path)
+
+    if "parquet" in formats:
+        for name, df in (("report.parquet", df_report), ("prices.parquet", df_prices)):
+            path = os.path.join(out_dir, name)
+            df.to_parquet(path)
+            written.append(path)
+
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JPX-listed MSCI ETF report (no browser needed with --out).")
+    parser.add_argument("--out", help="write the report files here instead of opening the chart")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--tickers", nargs="+", help="subset of the universe (default: every ticker)")
+    parser.add_argument("--universe", help="registry JSON to use instead of etf_universe.json")
+    parser.add_argument("--offline", action="store_true", help="local store and snapshot only, no network")
+    parser.add_argument("--max-age-hours", type=float, default=12.0,
+                        help="re-sync a ticker's prices when its stored bars are older than this")
+    parser.add_argument("--workers", type=int, help="parallel downloads (default: MSCI_FETCH_WORKERS)")
+    parser.add_argument("--self-contained", action="store_true", help="embed plotly.js in report.html")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    universe = UNIVERSE
+    if args.universe:
+        import json
+        with open(args.universe, "r", encoding="utf-8") as f:
+            universe = Universe(json.load(f))
+    tickers = args.tickers or universe.tickers
+    scheduler_options = {"max_workers": args.workers} if args.workers else {}
+
+    df_prices = get_prices(tickers, offline=args.offline, max_age_hours=args.max_age_hours, **scheduler_options)
+    if df_prices.empty:
+        print("No data fetched. Please check your internet connection or ticker list.")
+        return 1
+    df_valuations = get_valuations(universe, tickers, offline=args.offline, max_age_hours=args.max_age_hours, **scheduler_options)
+    df_report = build_report(df_prices, df_valuations, universe)
+
+    if args.out:
+        for path in write_reports(df_report, df_prices, universe, args.out, args.formats, args.self_contained):
+            print(f"Wrote {path}")
+    else:
+        print("\n--- Valuation Table ---")
+        print(format_table(df_report).fillna("").to_markdown())
+        print("\nGenerating Dashboard...")
+        plot_msci_performance(df_report).show()
+
+    print(f"Done: {len(df_report)} tickers in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,34 @@
+import os
+import sys
+
+import pandas as pd
 import streamlit as st
 
+import startup
+from diagnostics import PROFILE_DIR
+
 st.set_page_config(page_title="Debug", layout="wide")
 
 st.write("Hello! If you can see this, Streamlit is working.")
 st.success("Success!")
+
+st.caption(f"Python {sys.version.split()[0]} / Streamlit {st.__version__} / pandas {pd.__version__}")
+
+# Per-stage timings and cache hit/miss live in the dashboard process itself:
+# open the dashboard with ?diag=1 (sidebar panel) or ?profile=1 (one sampled rerun).
+# What is on disk is shown here.
+st.subheader("Time to first paint (per server process)")
+records = startup.read_log()
+if records:
+    st.dataframe(pd.DataFrame(records[-50:]).iloc[::-1], use_container_width=True, hide_index=True)
+else:
+    st.info(f"No startup records yet ({startup.STARTUP_LOG}).")
+
+st.subheader("Saved profiles")
+profiles = sorted(os.listdir(PROFILE_DIR), reverse=True) if os.path.isdir(PROFILE_DIR) else []
+if profiles:
+    name = st.selectbox("Profile", profiles)
+    with open(os.path.join(PROFILE_DIR, name), "r", encoding="utf-8") as f:
+        st.download_button("Download collapsed stacks", f.read(), file_name=name, mime="text/plain")
+else:
+    st.info("No profiles yet. Open the dashboard with ?profile=1.")
@@ -0,0 +1,328 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+# --- DIAGNOSTICS ---
+# Process-wide timings for every stage of app.py's main() and every cached fetch
+# (with cache hit/miss), exported as JSON or Prometheus text and shown in the
+# optional sidebar panel (?diag=1). ?profile=1 samples the call stack of one rerun.
+
+DATA_DIR = os.environ.get("MSCI_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+PROFILE_INTERVAL = float(os.environ.get("MSCI_PROFILE_INTERVAL", "0.005"))  # seconds between samples
+
+
+class Metrics:
+    """Counters shared by all sessions (and the refresh thread). Thread-safe."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.stages = {}   # name -> {"count", "total_s", "max_s", "last_s"}
+        self.caches = {}   # name -> {"hits", "misses", "total_s", "last_s"}
+        self.fetches = {}  # kind -> {outcome: count}, upstream calls via fetch_scheduler
+        self.guard = {"breaker": "closed", "breaker_trips": 0, "breaker_retry_at": None, "negative": {}}
+        self.last_run = None
+
+    def observe(self, name, seconds):
+        with self.lock:
+            s = self.stages.setdefault(name, {"count": 0, "total_s": 0.0, "max_s": 0.0, "last_s": 0.0})
+            s["count"] += 1
+            s["total_s"] += seconds
+            s["max_s"] = max(s["max_s"], seconds)
+            s["last_s"] = seconds
+
+    def observe_cache(self, name, hit, seconds):
+        with self.lock:
+            c = self.caches.setdefault(name, {"hits": 0, "misses": 0, "total_s": 0.0, "last_s": 0.0})
+            c["hits" if hit else "misses"] += 1
+            c["total_s"] += seconds
+            c["last_s"] = seconds
+
+    def observe_fetch(self, kind, outcome, n=1):
+        """outcome: ok / empty / error / throttled / skipped (negative cache) / circuit_open."""
+        with self.lock:
+            f = self.fetches.setdefault(kind, {})
+            f[outcome] = f.get(outcome, 0) + n
+
+    def set_guard(self, **state):
+        """Circuit breaker state and negative cache sizes (see fetch_guard.py)."""
+        with self.lock:
+            self.guard.update(state)
+
+    def finish_run(self, run):
+        with self.lock:
+            self.last_run = run.summary()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "started": self.started.isoformat(timespec="seconds"),
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "caches": {k: dict(v) for k, v in self.caches.items()},
+                "fetches": {k: dict(v) for k, v in self.fetches.items()},
+                "guard": dict(self.guard, negative=dict(self.guard["negative"])),
+                "last_run": self.last_run,
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (0.0.4)."""
+        snap = self.snapshot()
+        lines = [
+            "# HELP msci_stage_seconds Wall time of dashboard stages.",
+            "# TYPE msci_stage_seconds summary",
+        ]
+        for name, s in sorted(snap["stages"].items()):
+            lines.append(f'msci_stage_seconds_sum{{stage="{name}"}} {s["total_s"]:.6f}')
+            lines.append(f'msci_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        lines += ["# HELP msci_stage_last_seconds Wall time of the latest run of each stage.",
+                  "# TYPE msci_stage_last_seconds gauge"]
+        for name, s in sorted(snap["stages"].items()):
+            lines.append(f'msci_stage_last_seconds{{stage="{name}"}} {s["last_s"]:.6f}')
+        lines += ["# HELP msci_cache_requests_total Cached fetch calls by result.",
+                  "# TYPE msci_cache_requests_total counter"]
+        for name, c in sorted(snap["caches"].items()):
+            lines.append(f'msci_cache_requests_total{{cache="{name}",result="hit"}} {c["hits"]}')
+            lines.append(f'msci_cache_requests_total{{cache="{name}",result="miss"}} {c["misses"]}')
+        lines += ["# HELP msci_cache_seconds_total Wall time spent in cached fetch calls.",
+                  "# TYPE msci_cache_seconds_total counter"]
+        for name, c in sorted(snap["caches"].items()):
+            lines.append(f'msci_cache_seconds_total{{cache="{name}"}} {c["total_s"]:.6f}')
+        lines += ["# HELP msci_fetch_total Upstream fetches by kind and outcome.",
+                  "# TYPE msci_fetch_total counter"]
+        for kind, outcomes in sorted(snap["fetches"].items()):
+            for outcome, n in sorted(outcomes.items()):
+                lines.append(f'msci_fetch_total{{kind="{kind}",result="{outcome}"}} {n}')
+        guard = snap["guard"]
+        lines += ["# HELP msci_circuit_breaker_open 1 while upstream fetches are suspended after throttling.",
+                  "# TYPE msci_circuit_breaker_open gauge",
+                  f'msci_circuit_breaker_open {int(guard["breaker"] == "open")}',
+                  "# HELP msci_circuit_breaker_trips_total Times the circuit breaker opened.",
+                  "# TYPE msci_circuit_breaker_trips_total counter",
+                  f'msci_circuit_breaker_trips_total {guard["breaker_trips"]}',
+                  "# HELP msci_negative_cached Keys currently skipped after empty or failed fetches.",
+                  "# TYPE msci_negative_cached gauge"]
+        for kind, n in sorted(guard["negative"].items()):
+            lines.append(f'msci_negative_cached{{kind="{kind}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+# --- PER-RERUN STAGES ---
+
+class RunTimer:
+    """
+    Times consecutive stages of one script run: lap(name) closes the stage that
+    started at the previous lap (or at creation) and records it in METRICS.
+    """
+
+    def __init__(self, metrics=METRICS, prefix="main."):
+        self.metrics = metrics
+        self.prefix = prefix
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.laps = []
+
+    def lap(self, name):
+        now = time.perf_counter()
+        seconds = now - self.last
+        self.last = now
+        self.laps.append((name, seconds))
+        self.metrics.observe(self.prefix + name, seconds)
+        return seconds
+
+    def finish(self):
+        self.metrics.observe(self.prefix + "total", time.perf_counter() - self.started)
+        self.metrics.finish_run(self)
+
+    def summary(self):
+        return {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "total_s": round(time.perf_counter() - self.started, 6),
+            "stages": [[name, round(s, 6)] for name, s in self.laps],
+        }
+
+
+_local = threading.local()
+
+
+def tracked_cache(name, cache_decorator, metrics=METRICS):
+    """
+    Applies a Streamlit cache decorator and records time + hit/miss per call:
+        @tracked_cache("fundamentals_history", st.cache_data(ttl=600))
+    The wrapped body only runs on a miss, which is how hits are told apart.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def body(*args, **kwargs):
+            _local.missed = True
+            return fn(*args, **kwargs)
+
+        cached = cache_decorator(body)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            _local.missed = False
+            start = time.perf_counter()
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                metrics.observe_cache(name, not _local.missed, time.perf_counter() - start)
+
+        call.clear = cached.clear
+        return call
+    return wrap
+
+
+class timed:
+    """with timed("refresh.prices"): ...  -> one METRICS.observe for the block."""
+
+    def __init__(self, name, metrics=METRICS):
+        self.name = name
+        self.metrics = metrics
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# --- SAMPLING PROFILER ---
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper thread
+    (sys._current_frames), so the profiled rerun runs at close to normal speed.
+    Output is collapsed stacks ("a;b;c count", flamegraph.pl / speedscope format)
+    plus a top-functions table.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.elapsed = 0.0
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="msci-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return False
+
+    def collapsed(self):
+        return "\n".join(f"{k} {v}" for k, v in sorted(self.stacks.items(), key=lambda kv: -kv[1]))
+
+    def top_functions(self, n=30):
+        """[(function, self samples, inclusive samples)] sorted by inclusive samples."""
+        self_counts, incl_counts = {}, {}
+        for key, count in self.stacks.items():
+            frames = key.split(";")
+            self_counts[frames[-1]] = self_counts.get(frames[-1], 0) + count
+            for f in set(frames):
+                incl_counts[f] = incl_counts.get(f, 0) + count
+        rows = [(f, self_counts.get(f, 0), c) for f, c in incl_counts.items()]
+        return sorted(rows, key=lambda r: (-r[2], -r[1]))[:n]
+
+    def save(self, out_dir=PROFILE_DIR):
+        """Writes the collapsed stacks to PROFILE_DIR/<timestamp>.txt and returns the path."""
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"{datetime.now():%Y%m%d-%H%M%S}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed() + "\n")
+        return path
+
+
+# --- SIDEBAR PANEL ---
+
+def render_panel(st, metrics=METRICS):
+    """Sidebar diagnostics: last rerun's stages, stage totals, cache hit/miss, exports."""
+    import pandas as pd
+
+    snap = metrics.snapshot()
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        last = snap["last_run"]
+        if last:
+            st.caption(f"Last rerun: {last['total_s'] * 1000:.0f} ms ({last['ts']})")
+            st.dataframe(
+                pd.DataFrame(last["stages"], columns=["Stage", "Seconds"]).assign(
+                    ms=lambda d: (d["Seconds"] * 1000).round(1)).drop(columns="Seconds"),
+                hide_index=True, use_container_width=True
+            )
+
+        if snap["caches"]:
+            st.caption("Cached fetches")
+            df_cache = pd.DataFrame(snap["caches"]).T
+            df_cache["hit %"] = (df_cache["hits"] / (df_cache["hits"] + df_cache["misses"]) * 100).round(0)
+            st.dataframe(df_cache[["hits", "misses", "hit %", "last_s"]], use_container_width=True)
+
+        if snap["stages"]:
+            st.caption("All stages since start (incl. background refresh)")
+            df_stages = pd.DataFrame(snap["stages"]).T
+            df_stages["avg_s"] = df_stages["total_s"] / df_stages["count"]
+            st.dataframe(df_stages[["count", "avg_s", "max_s", "last_s"]].round(4), use_container_width=True)
+
+        if snap["fetches"]:
+            guard = snap["guard"]
+            status = guard["breaker"]
+            if guard["breaker_retry_at"]:
+                status += f", retry at {guard['breaker_retry_at']}"
+            st.caption(f"Upstream fetches (circuit breaker: {status}, tripped {guard['breaker_trips']}x)")
+            df_fetch = pd.DataFrame(snap["fetches"]).T.fillna(0).astype(int)
+            df_fetch["negative cached"] = pd.Series(guard["negative"]).reindex(df_fetch.index).fillna(0).astype(int)
+            st.dataframe(df_fetch, use_container_width=True)
+
+        st.download_button("Metrics (JSON)", metrics.to_json(), file_name="msci_metrics.json", mime="application/json")
+        st.download_button("Metrics (Prometheus)", metrics.to_prometheus(), file_name="msci_metrics.prom", mime="text/plain")
+        st.caption("Add ?profile=1 to the URL to profile one rerun.")
+
+
+def render_profile(st, profiler, path=None):
+    """Shows a finished SamplingProfiler under the page."""
+    import pandas as pd
+
+    with st.expander(f"Profile of this rerun ({profiler.samples} samples, {profiler.elapsed * 1000:.0f} ms)", expanded=True):
+        rows = profiler.top_functions()
+        total = max(profiler.samples, 1)
+        st.dataframe(pd.DataFrame(
+            [(f, s / total * 100, c / total * 100) for f, s, c in rows],
+            columns=["Function", "Self %", "Total %"]
+        ).round(1), hide_index=True, use_container_width=True)
+        if path:
+            st.caption(f"Collapsed stacks saved to {path}")
+        st.download_button("Collapsed stacks (flamegraph)", profiler.collapsed(), file_name="msci_profile.txt", mime="text/plain")
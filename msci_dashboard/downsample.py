@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+
+from startup import lazy_module
+
+# Trace classes are only needed once a chart is drawn
+go = lazy_module("plotly.graph_objects")
+
+# --- CHART DOWNSAMPLING ---
+# Long horizons and many tickers would otherwise ship every point of every series to
+# the browser. The budget is per figure, about 2 points per pixel of the plot area
+# shared by all its traces, and each series is reduced to its share with a
+# shape-preserving method (LTTB, or min/max per bucket). The chart switches to WebGL
+# traces when there are still many points to draw.
+#
+# What that reduces at the default width (~2700 points per figure): a 3Yr/MAX daily
+# series (~740 bars) once 4+ tickers are compared, the 1W 5m window (~330 bars) from
+# 9 tickers on. 1D and short time frames are always drawn in full.
+
+# Streamlit does not tell the server how wide the chart is, so the budget follows the
+# configured width of a full-width chart (wide layout), minus the y axis labels.
+CHART_WIDTH_PX = int(os.environ.get("MSCI_CHART_WIDTH_PX", "1400"))
+AXIS_PX = 60  # tick labels + axis title (the legend sits above the plot)
+POINTS_PER_PX = 2
+MIN_SERIES_POINTS = 150  # floor per series, so many-ticker charts keep their shape
+WEBGL_THRESHOLD = 20_000  # total points across all traces
+
+
+def point_budget(n_series=1, width_px=CHART_WIDTH_PX):
+    """Points per series when n_series traces share one chart."""
+    figure_points = (width_px - AXIS_PX) * POINTS_PER_PX
+    return max(figure_points // max(n_series, 1), MIN_SERIES_POINTS)
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape.
+    y may be 2-D (points x series) sharing the same x; then one index column per series.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n) if np.ndim(y) == 1 else np.tile(np.arange(n)[:, None], (1, np.shape(y)[1]))
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    one_d = y.ndim == 1
+    if one_d:
+        y = y[:, None]
+    cols = np.arange(y.shape[1])
+
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty((n_out, y.shape[1]), dtype=np.int64)
+    out[0] = 0
+    out[-1] = n - 1
+
+    a = np.zeros(y.shape[1], dtype=np.int64)
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean(axis=0)
+        xa, ya = x[a], y[a, cols]
+        # Triangle area between the last kept point, each candidate and the next bucket's average
+        area = np.abs((xa - avg_x) * (y[start:end] - ya) - (xa - x[start:end, None]) * (avg_y - ya))
+        a = start + np.argmax(area, axis=0)
+        out[i + 1] = a
+    return out[:, 0] if one_d else out
+
+
+def minmax(y, n_out):
+    """Min and max of each bucket (2 points per bucket), in time order."""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    n_buckets = n_out // 2
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    keep = set()
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            chunk = y[start:end]
+            keep.add(start + int(np.argmin(chunk)))
+            keep.add(start + int(np.argmax(chunk)))
+    keep.update((0, n - 1))
+    return np.array(sorted(keep), dtype=np.int64)
+
+
+def downsample_series(x, y, n_out, method="lttb"):
+    """Drops NaNs and reduces (x, y) to about n_out points. x may be a DatetimeIndex."""
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    x = np.asarray(x)[valid]
+    y = y[valid]
+    if len(y) <= n_out:
+        return x, y
+    if method == "minmax":
+        idx = minmax(y, n_out)
+    else:
+        x_num = x.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+        idx = lttb(x_num, y, n_out)
+    return x[idx], y[idx]
+
+
+def downsample_frame(df, n_out=None, method="lttb"):
+    """{column: (x, y)} for every column of a Date x Ticker frame (budget shared by its columns)."""
+    n_out = n_out or point_budget(df.shape[1])
+    if len(df) <= n_out:
+        return {col: downsample_series(df.index, df[col].to_numpy(), n_out) for col in df.columns}
+
+    out = {}
+    values = df.to_numpy(dtype=np.float64)
+    complete = ~np.isnan(values).any(axis=0)
+    if method == "lttb" and complete.sum() > 1:
+        # Gap-free columns share x, so LTTB runs once for all of them
+        x = df.index.to_numpy()
+        x_num = x.astype("datetime64[ns]").astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+        complete_pos = np.flatnonzero(complete)
+        idx = lttb(x_num, values[:, complete_pos], n_out)
+        for j, pos in enumerate(complete_pos):
+            out[df.columns[pos]] = (x[idx[:, j]], values[idx[:, j], pos])
+    for col in df.columns:
+        if col not in out:
+            out[col] = downsample_series(df.index, df[col].to_numpy(), n_out, method)
+    return {col: out[col] for col in df.columns}
+
+
+def scatter_class(total_points):
+    """go.Scattergl above WEBGL_THRESHOLD total points, go.Scatter otherwise."""
+    return go.Scattergl if total_points > WEBGL_THRESHOLD else go.Scatter
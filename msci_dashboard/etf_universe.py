@@ -0,0 +1,68 @@
+import json
+import os
+
+# --- ETF UNIVERSE REGISTRY ---
+# Single source of truth for the ETF list, shared by app.py, dashboard.py,
+# fetch_snapshot.py and the helper modules. Records live in etf_universe.json:
+#   {"Ticker", "Index", "Name", "Category", "Issuer", "Label"}
+# Lookups by ticker / category / tracked index / issuer are dicts built once at load,
+# so per-row lookups are O(1) and can be done with Series.map(dict).
+
+UNIVERSE_PATH = os.environ.get(
+    "MSCI_UNIVERSE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "etf_universe.json")
+)
+
+FIELDS = ["Index", "Name", "Category", "Issuer", "Label"]
+
+
+class Universe:
+    """Registry of ETF records with precomputed indexes. Treat as read-only."""
+
+    def __init__(self, records):
+        self.records = records
+        self.tickers = [r["Ticker"] for r in records]
+        # Ticker -> record (same shape as the old ETF_METADATA dict)
+        self.by_ticker = {r["Ticker"]: r for r in records}
+        # Field -> {Ticker: value}, for vectorized Series.map lookups
+        self.fields = {f: {r["Ticker"]: r.get(f, "") for r in records} for f in FIELDS}
+
+        self.by_category = {}
+        self.by_index = {}
+        self.by_issuer = {}
+        for r in records:
+            self.by_category.setdefault(r["Category"], []).append(r["Ticker"])
+            self.by_index.setdefault(r["Index"], []).append(r["Ticker"])
+            self.by_issuer.setdefault(r.get("Issuer", ""), []).append(r["Ticker"])
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, ticker):
+        return ticker in self.by_ticker
+
+    def get(self, ticker, field, default=""):
+        record = self.by_ticker.get(ticker)
+        return record.get(field, default) if record else default
+
+    def field_map(self, field):
+        """{Ticker: value} for one field, e.g. df["Ticker"].map(universe.field_map("Index"))."""
+        return self.fields[field]
+
+    def tickers_in(self, categories):
+        """Tickers of the given categories, in registry order."""
+        categories = set(categories)
+        return [t for t in self.tickers if self.by_ticker[t]["Category"] in categories]
+
+
+def load_universe(path=UNIVERSE_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return Universe(json.load(f))
+
+
+UNIVERSE = load_universe()
+
+# Convenience aliases used across the scripts
+ETF_METADATA = UNIVERSE.by_ticker
+TICKERS = UNIVERSE.tickers
+CATEGORIES = UNIVERSE.by_category
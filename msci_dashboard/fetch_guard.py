@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+
+from diagnostics import DATA_DIR, METRICS
+
+# --- NEGATIVE CACHE + CIRCUIT BREAKER ---
+# Two guards in front of every upstream call made through fetch_scheduler:
+#
+# * Negative cache: tickers that came back empty (new listings like 234A.T often have no
+#   history / info yet) or kept failing are skipped until their entry expires. The expiry
+#   doubles with every consecutive miss (capped), and one good fetch clears it. Entries are
+#   kept in DATA_DIR/negative_cache.json, so restarts and batch runs don't retry them either.
+# * Circuit breaker: after BREAKER_THRESHOLD throttling errors in a row (HTTP 429 /
+#   "Too Many Requests" / yfinance's YFRateLimitError) every fetch fails fast with
+#   CircuitOpen for BREAKER_COOLDOWN seconds; callers keep serving what they have stored.
+#   After the cool-down one trial call goes through: success closes the breaker, another
+#   throttle opens it again.
+#
+# Counts show up in the diagnostics panel (?diag=1) and its Prometheus export.
+
+NEGATIVE_CACHE_PATH = os.path.join(DATA_DIR, "negative_cache.json")
+
+# Seconds a ticker is skipped after its first empty result, per kind of fetch.
+# Intraday is short: outside market hours every ticker is empty.
+NEGATIVE_TTL = {"prices": 6 * 3600, "shares": 6 * 3600, "info": 6 * 3600, "intraday": 900}
+DEFAULT_NEGATIVE_TTL = 3600
+ERROR_TTL = 600               # after a fetch that still failed once retries were used up
+MAX_NEGATIVE_TTL = 24 * 3600  # cap for the doubling
+
+BREAKER_THRESHOLD = int(os.environ.get("MSCI_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("MSCI_BREAKER_COOLDOWN", "300"))  # seconds
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling upstream while the breaker is open."""
+
+
+class NoData(Exception):
+    """Raise from a fetch function when upstream answered but has nothing for the key (not retried)."""
+
+
+def _status_code(exc):
+    """HTTP status of a requests / curl_cffi / urllib error, if it carries one."""
+    response = getattr(exc, "response", None)
+    for obj in (response, exc):
+        status = getattr(obj, "status_code", None) or getattr(obj, "code", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_throttle(exc):
+    """True for rate-limit errors (yfinance's YFRateLimitError, HTTP 429 / 'Too Many Requests')."""
+    if "RateLimit" in type(exc).__name__ or _status_code(exc) == 429:
+        return True
+    # Text only as a fallback, and never a bare "429" (tickers like 1429.T, row counts)
+    text = str(exc).lower()
+    return "too many requests" in text or "rate limit" in text
+
+
+def is_empty(result):
+    """Empty frame / series / dict / None: upstream has no data for this key."""
+    if result is None:
+        return True
+    if hasattr(result, "empty"):
+        return result.empty
+    if isinstance(result, dict):
+        return not result
+    return False
+
+
+class NegativeCache:
+    """(kind, key) -> {"until", "misses", "reason"}, persisted as JSON. Thread-safe."""
+
+    def __init__(self, path=NEGATIVE_CACHE_PATH, metrics=METRICS):
+        self.path = path
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+        self._load()
+        metrics.set_guard(negative=self.counts())
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for kind, entries in json.load(f).items():
+                    self.entries[kind] = entries
+        except Exception as e:
+            print(f"Ignoring unreadable negative cache {self.path}: {e}")
+
+    def blocked(self, kind, key):
+        with self.lock:
+            entry = self.entries.get(kind, {}).get(key)
+            return entry is not None and entry["until"] > time.time()
+
+    def split(self, kind, keys):
+        """(allowed, skipped) keys."""
+        now = time.time()
+        with self.lock:
+            entries = self.entries.get(kind, {})
+            skipped = [k for k in keys if k in entries and entries[k]["until"] > now]
+        skipped_set = set(skipped)
+        return [k for k in keys if k not in skipped_set], skipped
+
+    def add(self, kind, key, reason):
+        base = ERROR_TTL if reason == "error" else NEGATIVE_TTL.get(kind, DEFAULT_NEGATIVE_TTL)
+        with self.lock:
+            entries = self.entries.setdefault(kind, {})
+            misses = entries.get(key, {}).get("misses", 0) + 1
+            ttl = min(base * 2 ** (misses - 1), MAX_NEGATIVE_TTL)
+            entries[key] = {"until": time.time() + ttl, "misses": misses, "reason": reason}
+            self.dirty = True
+
+    def clear(self, kind, key):
+        with self.lock:
+            if self.entries.get(kind, {}).pop(key, None) is not None:
+                self.dirty = True
+
+    def counts(self):
+        """kind -> number of keys currently skipped."""
+        now = time.time()
+        with self.lock:
+            return {kind: sum(e["until"] > now for e in entries.values())
+                    for kind, entries in self.entries.items()}
+
+    def flush(self):
+        """Writes the entries if anything changed (once per fetch_all, not per key)."""
+        with self.lock:
+            if not self.dirty:
+                return
+            now = time.time()
+            # Drop long-expired entries, but keep recent ones so the miss count keeps doubling
+            payload = {kind: {k: e for k, e in entries.items() if e["until"] + MAX_NEGATIVE_TTL > now}
+                       for kind, entries in self.entries.items()}
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Could not write negative cache {self.path}: {e}")
+        self.metrics.set_guard(negative=self.counts())
+
+
+class CircuitBreaker:
+    """Process-wide breaker over upstream calls, opened by consecutive throttling errors."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, metrics=METRICS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.state = "closed"   # "closed" | "open" | "half-open"
+        self.throttles = 0      # consecutive
+        self.opened_until = 0.0
+        self.trips = 0
+
+    def allow(self):
+        """True if a call may go upstream now (in half-open: only the one trial call)."""
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() >= self.opened_until:
+                self._set("half-open")
+                return True
+            return False
+
+    def record(self, throttled):
+        """Outcome of an allowed call: throttled or not (any other answer means upstream is serving)."""
+        with self.lock:
+            if self.state == "open":
+                # Stragglers started before the breaker opened: no extra trip, no early close
+                return
+            if not throttled:
+                self.throttles = 0
+                if self.state != "closed":
+                    self._set("closed")
+                return
+            self.throttles += 1
+            if self.state == "half-open" or self.throttles >= self.threshold:
+                self.opened_until = time.monotonic() + self.cooldown
+                self.trips += 1
+                print(f"Circuit breaker open: {self.throttles} throttled calls, "
+                      f"serving cached data for {self.cooldown:.0f}s")
+                self._set("open")
+
+    def call(self, fn, *args):
+        """fn(*args) through the breaker: CircuitOpen while open, outcome recorded otherwise."""
+        if not self.allow():
+            raise CircuitOpen("upstream throttled, circuit breaker open")
+        try:
+            result = fn(*args)
+        except NoData:
+            self.record(False)
+            raise
+        except Exception as e:
+            self.record(is_throttle(e))
+            raise
+        self.record(False)
+        return result
+
+    def _set(self, state):
+        # Caller holds self.lock
+        self.state = state
+        retry_at = None
+        if state == "open":
+            retry_at = time.strftime("%H:%M:%S", time.localtime(time.time() + self.opened_until - time.monotonic()))
+        self.metrics.set_guard(breaker=state, breaker_trips=self.trips, breaker_retry_at=retry_at)
+
+
+NEGATIVE = NegativeCache()
+BREAKER = CircuitBreaker()
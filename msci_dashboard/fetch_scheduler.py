@@ -0,0 +1,134 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from diagnostics import METRICS
+from fetch_guard import BREAKER, NEGATIVE, CircuitOpen, NoData, is_empty, is_throttle
+
+# --- FETCH SCHEDULER ---
+# Runs one fetch per ticker on a bounded worker pool, shares a requests-per-second
+# budget across all workers and retries each ticker on its own with exponential
+# backoff, so one bad symbol never takes its neighbours down with it.
+# Every call goes through the circuit breaker, and with a `kind` tickers that came back
+# empty or failing are skipped for a while (see fetch_guard.py).
+
+# Defaults can be tuned per deployment without touching code
+DEFAULT_WORKERS = int(os.environ.get("MSCI_FETCH_WORKERS", "4"))
+DEFAULT_RPS = float(os.environ.get("MSCI_FETCH_RPS", "2.0"))
+DEFAULT_RETRIES = int(os.environ.get("MSCI_FETCH_RETRIES", "3"))
+DEFAULT_BACKOFF = 0.5  # seconds, doubled on every retry
+
+
+class RateLimiter:
+    """Token bucket shared by all workers (requests_per_second <= 0 disables it)."""
+
+    def __init__(self, requests_per_second, burst=1):
+        self.rate = requests_per_second
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _fetch_with_retry(key, fetch_fn, limiter, max_retries, backoff, kind):
+    """
+    Calls fetch_fn(key) until it succeeds or max_retries is used up.
+    NoData and CircuitOpen are final: retrying can't help.
+    """
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            return BREAKER.call(fetch_fn, key)
+        except (NoData, CircuitOpen):
+            raise
+        except Exception as e:
+            if is_throttle(e):
+                METRICS.observe_fetch(kind or "other", "throttled")
+            if attempt >= max_retries:
+                raise
+            # Exponential backoff with a little jitter so workers don't retry in lockstep
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+            attempt += 1
+
+
+def fetch_all(keys, fetch_fn, max_workers=None, requests_per_second=None,
+              max_retries=None, backoff=DEFAULT_BACKOFF, progress=None, kind=None, cache_empty=None):
+    """
+    Runs fetch_fn(key) for every key and returns (results, errors) dicts keyed by key.
+
+    progress, if given, is called with the completed fraction (0..1) from the calling
+    thread, so it is safe to pass st.progress(...).progress directly.
+
+    kind ("prices", "info", ...) turns on the negative cache: keys it holds are skipped
+    (in neither dict), keys that fail or come back empty are added, a good result clears
+    them. cache_empty limits which keys count as missing when empty (default: all), e.g.
+    only tickers with nothing stored, since an incremental fetch can rightly be empty.
+    """
+    keys = list(keys)
+    results = {}
+    errors = {}
+    if kind is not None:
+        keys, skipped = NEGATIVE.split(kind, keys)
+        if skipped:
+            METRICS.observe_fetch(kind, "skipped", len(skipped))
+    if not keys:
+        return results, errors
+    cache_empty = set(keys if cache_empty is None else cache_empty)
+
+    max_workers = max_workers or DEFAULT_WORKERS
+    limiter = RateLimiter(DEFAULT_RPS if requests_per_second is None else requests_per_second)
+    max_retries = DEFAULT_RETRIES if max_retries is None else max_retries
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        futures = {
+            pool.submit(_fetch_with_retry, key, fetch_fn, limiter, max_retries, backoff, kind): key
+            for key in keys
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            key = futures[future]
+            try:
+                result = future.result()
+                results[key] = result
+                outcome = "empty" if key in cache_empty and is_empty(result) else "ok"
+            except CircuitOpen as e:
+                errors[key] = e
+                outcome = "circuit_open"
+            except NoData as e:
+                errors[key] = e
+                outcome = "empty"
+            except Exception as e:
+                print(f"Error fetching {key}: {e}")
+                errors[key] = e
+                outcome = "error"
+            METRICS.observe_fetch(kind or "other", outcome)
+            if kind is not None:
+                if outcome in ("empty", "error"):
+                    NEGATIVE.add(kind, key, outcome)
+                elif outcome == "ok":
+                    NEGATIVE.clear(kind, key)
+            if progress is not None:
+                progress(done / len(keys))
+
+    if kind is not None:
+        NEGATIVE.flush()
+    open_count = sum(isinstance(e, CircuitOpen) for e in errors.values())
+    if open_count:
+        print(f"Circuit breaker open: skipped {open_count} fetches, serving stored data")
+    return results, errors
@@ -0,0 +1,167 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import fetch_scheduler
+from price_store import DATA_DIR
+from providers import get_provider
+
+# --- FUND FLOWS ---
+# Creations / redemptions estimated from historical shares outstanding
+# (yfinance get_shares_full): flow on day t = (shares_t - shares_t-1) * close_t, in JPY.
+# Shares history is stored like the prices (data/shares/<ticker>.parquet) and only
+# the entries after each ticker's last stored date are fetched, by the background
+# refresher; sessions only read the precomputed FlowCache.
+
+SHARES_DIR = os.path.join(DATA_DIR, "shares")
+
+# Display name -> resample rule (None = daily, as stored)
+FLOW_FREQUENCIES = {"Daily": None, "Weekly": "W-FRI", "Monthly": "ME"}
+
+# Trailing sums shown in the performance table (calendar days, like returns_engine.PERIODS)
+FLOW_PERIODS = {"Flow 1D": 1, "Flow 1W": 7, "Flow 1M": 30}
+
+
+def _shares_path(ticker):
+    return os.path.join(SHARES_DIR, f"{ticker}.parquet")
+
+
+def read_shares(ticker):
+    """Stored shares outstanding for one ticker (empty Series if nothing stored yet)."""
+    path = _shares_path(ticker)
+    if not os.path.exists(path):
+        return pd.Series(dtype="float64")
+    try:
+        return pd.read_parquet(path)["Shares"]
+    except Exception as e:
+        print(f"Could not read stored shares for {ticker}: {e}")
+        return pd.Series(dtype="float64")
+
+
+def write_shares(ticker, shares):
+    os.makedirs(SHARES_DIR, exist_ok=True)
+    path = _shares_path(ticker)
+    tmp_path = path + ".tmp"
+    shares.to_frame("Shares").to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _clean_shares(shares):
+    """One value per day (the last reported), naive DatetimeIndex named Date."""
+    if shares is None or len(shares) == 0:
+        return pd.Series(dtype="float64")
+    shares = pd.Series(shares, dtype="float64").dropna()
+    index = pd.DatetimeIndex(shares.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    shares.index = index.normalize()
+    shares = shares[~shares.index.duplicated(keep="last")].sort_index()
+    shares.index.name = "Date"
+    return shares
+
+
+def download_shares(ticker, start_date):
+    return _clean_shares(get_provider().shares(ticker, start=start_date))
+
+
+def sync_shares(tickers, start_date, progress=None, **scheduler_options):
+    """
+    Brings the local shares store up to date and returns the Date x Ticker shares matrix.
+    Same incremental rule as price_store.sync_prices: full history for new tickers,
+    otherwise only entries from the last stored date on.
+    """
+    stored = {t: read_shares(t) for t in tickers}
+    fetch_from = {
+        t: pd.Timestamp(start_date) if s.empty else s.index[-1]
+        for t, s in stored.items()
+    }
+
+    new_shares, _ = fetch_scheduler.fetch_all(
+        tickers,
+        lambda t: download_shares(t, fetch_from[t].normalize()),
+        progress=progress,
+        kind="shares",
+        cache_empty=[t for t, s in stored.items() if s.empty],
+        **scheduler_options
+    )
+
+    for ticker, shares in new_shares.items():
+        if shares.empty:
+            continue
+        merged = pd.concat([stored[ticker], shares]) if not stored[ticker].empty else shares
+        merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+        try:
+            write_shares(ticker, merged)
+        except Exception as e:
+            print(f"Could not write stored shares for {ticker}: {e}")
+        stored[ticker] = merged
+
+    return shares_matrix(stored, start_date)
+
+
+def shares_matrix(stored, start_date=None):
+    series = {t: s for t, s in stored.items() if not s.empty}
+    if not series:
+        return pd.DataFrame()
+    df = pd.concat(series, axis=1).sort_index()
+    if start_date is not None:
+        df = df[df.index >= pd.Timestamp(start_date)]
+    return df
+
+
+def load_shares(tickers, start_date=None):
+    """Shares matrix straight from the local store (no network)."""
+    return shares_matrix({t: read_shares(t) for t in tickers}, start_date)
+
+
+def compute_flows(df_shares, df_prices):
+    """
+    Daily flows in JPY (Date x Ticker) for every ticker in one step: shares are aligned to
+    the trading days of df_prices (carried forward between reports), then
+    diff(shares) * close. Creations are positive, redemptions negative.
+    """
+    if df_shares.empty or df_prices.empty:
+        return pd.DataFrame(index=df_prices.index)
+    tickers = [t for t in df_prices.columns if t in df_shares.columns]
+    # Reports can land on non-trading days: union, carry forward, then keep trading days
+    union = df_prices.index.union(df_shares.index)
+    shares = df_shares[tickers].reindex(union).ffill().reindex(df_prices.index)
+    flows = shares.diff().to_numpy() * df_prices[tickers].to_numpy()
+    return pd.DataFrame(flows, index=df_prices.index, columns=tickers)
+
+
+def resample_flows(df_flows, rule):
+    """Sums daily flows per week / month; NaN where nothing was reported in the bucket."""
+    if rule is None or df_flows.empty:
+        return df_flows
+    return df_flows.resample(rule).sum(min_count=1)
+
+
+def trailing_flows(df_flows, periods=FLOW_PERIODS):
+    """Sum of flows over the last N calendar days per ticker (index: Ticker)."""
+    if df_flows.empty:
+        return pd.DataFrame(columns=list(periods), dtype=np.float64)
+    end = df_flows.index[-1]
+    values = df_flows.to_numpy()
+    out = {}
+    for name, days in periods.items():
+        start = np.searchsorted(df_flows.index.values, (end - pd.Timedelta(days=days)).to_datetime64(), side="right")
+        window = values[start:]
+        total = np.nansum(window, axis=0)
+        total[np.isnan(window).all(axis=0)] = np.nan
+        out[name] = total
+    return pd.DataFrame(out, index=pd.Index(df_flows.columns, name="Ticker"))
+
+
+class FlowCache:
+    """Daily / weekly / monthly flow matrices and trailing sums, built once per refresh."""
+
+    def __init__(self, df_shares, df_prices):
+        self.daily = compute_flows(df_shares, df_prices)
+        self.by_frequency = {name: resample_flows(self.daily, rule) for name, rule in FLOW_FREQUENCIES.items()}
+        self.trailing = trailing_flows(self.daily)
+
+    def get(self, frequency, tickers):
+        df = self.by_frequency[frequency]
+        return df[[t for t in tickers if t in df.columns]]
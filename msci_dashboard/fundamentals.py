@@ -0,0 +1,73 @@
+import json
+import os
+import pandas as pd
+
+from fetch_scheduler import fetch_all
+from providers import get_provider
+
+# --- FUNDAMENTALS ---
+# Price / NAV / Premium / AUM / P/E / P/B / Yield per ticker.
+# The dashboard reads the etf_snapshot.json snapshot first (Yahoo blocks data
+# center IPs, e.g. Streamlit Cloud) and only falls back to live info calls.
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'etf_snapshot.json')
+
+
+def info_to_row(ticker, meta, info):
+    """Turns a provider info dict into one fundamentals row."""
+    price = info.get('regularMarketPreviousClose') or info.get('previousClose')
+    nav = info.get('navPrice')
+
+    premium = None
+    if price and nav:
+        premium = ((price - nav) / nav) * 100
+
+    return {
+        "Index Name": meta["Index"],
+        "ETF Name": meta["Name"],
+        "Ticker": ticker,
+        "Price": price,
+        "NAV": nav,
+        "Premium %": premium,
+        "AUM (B)": info.get('totalAssets'),
+        "P/E": info.get('trailingPE'),
+        "P/B": info.get('priceToBook'),
+        "Yield %": (info.get('yield', 0) or 0) * 100
+    }
+
+
+def load_snapshot(universe, snapshot_path=SNAPSHOT_PATH):
+    """Loads the snapshot file (indexed by Ticker); empty DataFrame if missing or unreadable."""
+    if not os.path.exists(snapshot_path):
+        return pd.DataFrame()
+    try:
+        with open(snapshot_path, "r", encoding="utf-8") as f:
+            df = pd.DataFrame(json.load(f))
+        # Ensure Metadata Columns exist (Critical for Merge)
+        df["Index Name"] = df["Ticker"].map(universe.field_map("Index")).fillna("")
+        df["ETF Name"] = df["Ticker"].map(universe.field_map("Name")).fillna("")
+        return df.set_index("Ticker", drop=False)
+    except Exception as e:
+        print(f"Could not read snapshot {snapshot_path}: {e}")
+        return pd.DataFrame()
+
+
+def fetch_live(universe):
+    """
+    Live info fetch for every ticker (often empty or blocked on Streamlit Cloud).
+    Tickers with empty info are skipped for a while (negative cache) but keep their row,
+    so the table still lists them with returns only.
+    """
+    infos, _ = fetch_all(universe.tickers, lambda t: get_provider().info(t), kind="info")
+    if not any(infos.values()):
+        return pd.DataFrame()
+    rows = [info_to_row(ticker, meta, infos.get(ticker) or {}) for ticker, meta in universe.by_ticker.items()]
+    return pd.DataFrame(rows).set_index("Ticker", drop=False)
+
+
+def load_fundamentals(universe):
+    """Snapshot first (Fastest/Safest for Cloud), live fetch as fallback."""
+    df = load_snapshot(universe)
+    if not df.empty:
+        return df
+    return fetch_live(universe)
@@ -0,0 +1,107 @@
+import os
+import pandas as pd
+
+from price_store import DATA_DIR
+
+# --- FUNDAMENTALS HISTORY ---
+# Every snapshot run is appended to a point-in-time history so premium/discount,
+# AUM etc. can be charted over time.
+# Layout: fundamentals_history/<YYYY-MM>.parquet, one row per (Ticker, Date), rows sorted
+# by Ticker then Date. Range queries only open the months they need and push the
+# ticker/date filter down into Parquet row groups.
+
+HISTORY_DIR = os.path.join(DATA_DIR, "fundamentals_history")
+
+FIELDS = ["Price", "NAV", "Premium %", "AUM (B)", "P/E", "P/B", "Yield %"]
+
+ROW_GROUP_SIZE = 2048
+
+
+def _partition_path(month):
+    return os.path.join(HISTORY_DIR, f"{month}.parquet")
+
+
+def _to_frame(rows, as_of=None):
+    """Snapshot rows (dicts) -> long frame with Date, Ticker and the numeric fields."""
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    if as_of is not None:
+        dates = pd.Series(pd.Timestamp(as_of), index=df.index)
+    elif "Fetched At" in df.columns:
+        dates = pd.to_datetime(df["Fetched At"], errors="coerce").fillna(pd.Timestamp.now())
+    else:
+        dates = pd.Series(pd.Timestamp.now(), index=df.index)
+
+    out = pd.DataFrame({"Date": dates.dt.normalize(), "Ticker": df["Ticker"].astype(str)})
+    for field in FIELDS:
+        out[field] = pd.to_numeric(df[field], errors="coerce").astype("float64") if field in df.columns else float("nan")
+    return out
+
+
+def append_snapshot(rows, as_of=None):
+    """
+    Appends one snapshot (list of row dicts, as in etf_snapshot.json) to the history.
+    A second snapshot on the same day replaces that day's values for the same ticker.
+    """
+    new = _to_frame(rows, as_of)
+    if new.empty:
+        return 0
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+
+    for month, part in new.groupby(new["Date"].dt.strftime("%Y-%m")):
+        path = _partition_path(month)
+        if os.path.exists(path):
+            part = pd.concat([pd.read_parquet(path), part], ignore_index=True)
+        part = (
+            part.drop_duplicates(subset=["Ticker", "Date"], keep="last")
+            .sort_values(["Ticker", "Date"])
+            .reset_index(drop=True)
+        )
+        tmp_path = path + ".tmp"
+        part.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    return len(new)
+
+
+def _months_between(start, end):
+    return pd.period_range(start.to_period("M"), end.to_period("M"), freq="M").strftime("%Y-%m")
+
+
+def query(tickers=None, start=None, end=None, fields=None):
+    """Long frame (Date, Ticker, fields...) for the given tickers and [start, end] date range."""
+    fields = list(fields or FIELDS)
+    if not os.path.isdir(HISTORY_DIR):
+        return pd.DataFrame(columns=["Date", "Ticker"] + fields)
+
+    end = pd.Timestamp(end or pd.Timestamp.now()).normalize()
+    if start is None:
+        months = sorted(f[:-len(".parquet")] for f in os.listdir(HISTORY_DIR) if f.endswith(".parquet"))
+    else:
+        start = pd.Timestamp(start).normalize()
+        months = _months_between(start, end)
+
+    filters = [("Date", "<=", end)]
+    if start is not None:
+        filters.append(("Date", ">=", start))
+    if tickers is not None:
+        filters.append(("Ticker", "in", list(tickers)))
+
+    parts = []
+    for month in months:
+        path = _partition_path(month)
+        if os.path.exists(path):
+            parts.append(pd.read_parquet(path, columns=["Date", "Ticker"] + fields, filters=filters))
+    if not parts:
+        return pd.DataFrame(columns=["Date", "Ticker"] + fields)
+    return pd.concat(parts, ignore_index=True).sort_values(["Ticker", "Date"]).reset_index(drop=True)
+
+
+def field_history(field, tickers=None, days=None, start=None, end=None):
+    """Date x Ticker matrix of one field, e.g. field_history("Premium %", ["1478.T"], days=90)."""
+    if days is not None:
+        start = pd.Timestamp(end or pd.Timestamp.now()).normalize() - pd.Timedelta(days=days)
+    df = query(tickers, start, end, fields=[field])
+    if df.empty:
+        return pd.DataFrame()
+    return df.pivot(index="Date", columns="Ticker", values=field).sort_index()
@@ -0,0 +1,356 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import fetch_scheduler
+import shared_cache
+from diagnostics import METRICS
+from fetch_guard import BREAKER, NEGATIVE, CircuitOpen
+from providers import get_provider
+
+# --- INTRADAY STREAM ---
+# Keeps today's 5-minute bars per ticker in a fixed-size ring buffer and, on each
+# refresh, asks only for the bars from the last stored timestamp onwards.
+# The last stored bar is re-requested because it is usually still forming.
+
+INTRADAY_INTERVAL = "5m"
+REFRESH_SECONDS = int(os.environ.get("MSCI_INTRADAY_REFRESH", "60"))
+RING_CAPACITY = 288  # 24h of 5m bars, more than any session needs
+MAX_CACHED_FRAMES = 32  # distinct ticker selections kept as ready-made frames
+# Cross-replica cache (shared_cache.py): lease per ticker while fetching, and how long to
+# wait for another replica's first load before fetching here anyway
+SHARED_LEASE_SECONDS = 60
+SHARED_WAIT_SECONDS = 10
+# Tickers no session has shown for this long are no longer polled
+WATCH_SECONDS = 600
+
+
+class TickerRing:
+    """Ring buffer of (timestamp, close) for one ticker's latest trading session."""
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.times = np.empty(capacity, dtype="datetime64[ns]")
+        self.closes = np.empty(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.version = 0  # bumped on every change so readers can skip rebuilding frames
+        self.epoch = 0    # bumped when the ring is cleared (new session): frames must be rebuilt
+
+    def _order(self):
+        return (self.start + np.arange(self.size)) % self.capacity
+
+    def last_time(self):
+        if self.size == 0:
+            return None
+        return pd.Timestamp(self.times[(self.start + self.size - 1) % self.capacity])
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+        self.version += 1
+        self.epoch += 1
+
+    def extend(self, close):
+        """Adds bars from a Close series (tz-naive index). Returns the number of new bars."""
+        close = close.dropna()
+        if close.empty:
+            return 0
+
+        # A new session started: the ring only holds the latest day
+        newest_day = close.index[-1].normalize()
+        last = self.last_time()
+        if last is not None and newest_day > last.normalize():
+            self.clear()
+            last = None
+        close = close[close.index >= newest_day]
+
+        added = 0
+        changed = False
+        for ts, value in zip(close.index.to_numpy(dtype="datetime64[ns]"), close.to_numpy(dtype=np.float64)):
+            if last is not None and ts < last.to_datetime64():
+                continue
+            if last is not None and ts == last.to_datetime64():
+                # Still-forming bar: overwrite in place
+                slot = (self.start + self.size - 1) % self.capacity
+                if self.closes[slot] != value:
+                    self.closes[slot] = value
+                    changed = True
+                continue
+            slot = (self.start + self.size) % self.capacity
+            if self.size == self.capacity:
+                self.start = (self.start + 1) % self.capacity
+            else:
+                self.size += 1
+            self.times[slot] = ts
+            self.closes[slot] = value
+            last = pd.Timestamp(ts)
+            added += 1
+        if added or changed:
+            self.version += 1
+        return added
+
+    def tail(self, since):
+        """(times, closes) arrays of the bars at or after since, in time order."""
+        order = self._order()
+        times = self.times[order]
+        keep = times >= np.datetime64(since, "ns")
+        return times[keep], self.closes[order[keep]]
+
+    def series(self, name):
+        order = self._order()
+        return pd.Series(self.closes[order], index=pd.DatetimeIndex(self.times[order]), name=name)
+
+
+def close_of(bars):
+    """Close column with a tz-naive (market local time) index."""
+    if bars is None or bars.empty or "Close" not in bars.columns:
+        return pd.Series(dtype=np.float64)
+    close = bars["Close"]
+    if close.index.tz is not None:
+        close = close.tz_localize(None)
+    return close
+
+
+class IntradayStream:
+    """
+    Process-wide intraday bars for any set of tickers, refreshed incrementally by a poller
+    thread (start()). Sessions only watch() the tickers they show and read frame(), so no
+    rerun ever waits on Yahoo or on another replica's fetch.
+    """
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.rings = {}
+        self.last_refresh = {}
+        self.frames = {}  # tuple(tickers) -> (versions, DataFrame)
+        self.inflight = set()  # tickers being fetched right now
+        self.watched = {}  # ticker -> monotonic time a session last asked for it
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="msci-intraday", daemon=True)
+            self.thread.start()
+        return self
+
+    def watch(self, tickers):
+        """Marks tickers as shown; new ones wake the poller so their first load starts now."""
+        now = time.monotonic()
+        with self.lock:
+            new = [t for t in tickers if t not in self.watched]
+            for t in tickers:
+                self.watched[t] = now
+        if new:
+            self.wakeup.set()
+
+    def _run(self):
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                for t in [t for t, seen in self.watched.items() if now - seen > WATCH_SECONDS]:
+                    del self.watched[t]
+                tickers = list(self.watched)
+            if tickers:
+                try:
+                    self.update(tickers)
+                except Exception as e:
+                    print(f"Intraday refresh failed: {e}")
+            self.wakeup.wait(self.refresh_seconds)
+            self.wakeup.clear()
+
+    def update(self, tickers):
+        """
+        Fetches new bars for tickers whose last refresh is older than refresh_seconds (run by
+        the poller thread). The lock is only held to pick the tickers and to apply the bars,
+        never during the upstream call, so frame() readers are never held up by it.
+        """
+        now = time.monotonic()
+        with self.lock:
+            due = [t for t in tickers if t not in self.inflight
+                   and now - self.last_refresh.get(t, -np.inf) >= self.refresh_seconds]
+            if not due:
+                return
+            self.inflight.update(due)
+            since = {t: self.rings[t].last_time() if t in self.rings else None for t in due}
+
+        try:
+            cache = shared_cache.get_cache()
+            if cache is None:
+                self._apply(self._fetch(since))
+            else:
+                try:
+                    self._fetch_shared(cache, since)
+                except sqlite3.Error as e:
+                    print(f"Shared cache error for intraday bars: {e}")
+                    self._apply(self._fetch(since))
+            with self.lock:
+                for t in due:
+                    self.last_refresh[t] = now
+        finally:
+            with self.lock:
+                self.inflight.difference_update(due)
+
+    def _apply(self, closes):
+        """Adds fetched Close series (ticker -> Series) to the rings."""
+        with self.lock:
+            for t, close in closes.items():
+                self.rings.setdefault(t, TickerRing()).extend(close)
+
+    def _fetch(self, since):
+        """
+        Upstream fetch for {ticker: last stored timestamp or None}. Returns ticker -> Close
+        series; called without self.lock.
+        """
+        closes = {}
+        empty = [t for t, last in since.items() if last is None]
+        known = [t for t, last in since.items() if last is not None]
+
+        # First load: one batched call for today's full session (minus tickers known to be empty)
+        empty = [t for t in empty if not NEGATIVE.blocked("intraday", t)]
+        if empty:
+            try:
+                bars = BREAKER.call(get_provider().intraday, empty, "1d", INTRADAY_INTERVAL)
+            except CircuitOpen:
+                METRICS.observe_fetch("intraday", "circuit_open", len(empty))
+                bars = None
+            if bars is not None:
+                for t in empty:
+                    closes[t] = close = close_of(bars.get(t))
+                    if close.empty:
+                        NEGATIVE.add("intraday", t, "empty")
+                    else:
+                        NEGATIVE.clear("intraday", t)
+                    METRICS.observe_fetch("intraday", "empty" if close.empty else "ok")
+                NEGATIVE.flush()
+
+        # After that: only bars from each ticker's last stored timestamp
+        if known:
+            new_bars, _ = fetch_scheduler.fetch_all(
+                known,
+                lambda t: get_provider().history(t, start=since[t], interval=INTRADAY_INTERVAL),
+                kind="intraday", cache_empty=[]  # no new bar since the last one is normal
+            )
+            for t, bars in new_bars.items():
+                closes[t] = close_of(bars)
+        return closes
+
+    def _fetch_shared(self, cache, since):
+        """
+        Same as _fetch, but through the cross-replica cache (one entry per ticker holding the
+        session's closes): fresh entries are used as-is, tickers whose lease we get are fetched
+        here and published, and tickers another replica is fetching use its (stale) entry.
+        """
+        ttl = self.refresh_seconds
+        found = {}
+        waiting = {}
+        leased = []
+        for t in since:
+            key = f"intraday:{t}"
+            value, _, fresh = cache.get(key)
+            if fresh:
+                found[t] = value
+            elif cache.acquire(key, SHARED_LEASE_SECONDS):
+                leased.append(t)
+            elif value is not None:
+                found[t] = value
+            else:
+                waiting[t] = key
+        self._apply(found)
+
+        try:
+            if leased:
+                self._apply(self._fetch({t: since[t] for t in leased}))
+                with self.lock:
+                    sessions = {t: self.rings[t].series(t) for t in leased
+                                if t in self.rings and self.rings[t].size}
+                for t, session in sessions.items():
+                    cache.put(f"intraday:{t}", session, ttl)
+        finally:
+            for t in leased:
+                cache.release(f"intraday:{t}")
+
+        # Nothing stored yet and another replica is on it: wait for its first load
+        deadline = time.time() + SHARED_WAIT_SECONDS
+        while waiting and time.time() < deadline:
+            time.sleep(shared_cache.POLL_INTERVAL)
+            for t, key in list(waiting.items()):
+                value, _, fresh = cache.get(key)
+                if value is not None:
+                    self._apply({t: value})
+                    del waiting[t]
+        if waiting:
+            self._apply(self._fetch({t: since[t] for t in waiting}))
+
+    def frame(self, tickers):
+        """
+        Close matrix (Datetime x Ticker). Reuses the previous frame if nothing changed, and
+        otherwise extends it: rows after its last bar are appended and each changed ticker's
+        tail (from its still-forming bar on) is overwritten. Only a new session (ring cleared)
+        or a different ticker set rebuilds it from all rings.
+        """
+        key = tuple(tickers)
+        with self.lock:
+            rings = {t: self.rings[t] for t in tickers if t in self.rings and self.rings[t].size}
+            versions = {t: r.version for t, r in rings.items()}
+            cached = self.frames.get(key)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+            if not rings:
+                return pd.DataFrame()
+            epochs = {t: r.epoch for t, r in rings.items()}
+            if cached is not None and cached[3] == epochs:
+                df = self._extend(cached, rings)
+            else:
+                df = pd.concat([r.series(t) for t, r in rings.items()], axis=1).sort_index().ffill()
+            seen = {t: r.last_time() for t, r in rings.items()}
+            self.frames.pop(key, None)
+            self.frames[key] = (versions, df, seen, epochs)
+            while len(self.frames) > MAX_CACHED_FRAMES:
+                self.frames.pop(next(iter(self.frames)))
+            return df
+
+    @staticmethod
+    def _extend(cached, rings):
+        """
+        New frame from the cached one plus the changed rings' bars since their last seen bar
+        (caller holds the lock). The cached frame itself is left alone: sessions may be reading it.
+        """
+        versions, df, seen, _ = cached
+        tails = {t: tail for t, r in rings.items()
+                 if r.version != versions[t] and len((tail := r.tail(seen[t]))[0])}
+        if not tails:
+            return df
+
+        # Usually appended after the last row; a lagging ticker can also fill a slot the others skipped
+        old_times = df.index.to_numpy(dtype="datetime64[ns]")
+        tail_times = np.unique(np.concatenate([times for times, _ in tails.values()]))
+        new_times = np.setdiff1d(tail_times, old_times)
+        times = np.concatenate([old_times, new_times])
+        values = np.vstack([df.to_numpy(dtype=np.float64), np.full((len(new_times), df.shape[1]), np.nan)])
+        if len(new_times) and new_times[0] < old_times[-1]:
+            order = np.argsort(times, kind="stable")
+            times, values = times[order], values[order]
+
+        # Each changed ticker: its tail bars from its first tail bar on (ffilled below)
+        first = tail_times[0]
+        col_of = {t: i for i, t in enumerate(df.columns)}
+        for t, (tail_times_t, closes) in tails.items():
+            j = col_of[t]
+            rows = times >= tail_times_t[0]
+            values[rows, j] = np.nan
+            values[np.searchsorted(times, tail_times_t), j] = closes
+
+        # Forward-fill only the rows from the one before the earliest change on
+        p = max(int(np.searchsorted(times, first)) - 1, 0)
+        block = values[p:]
+        filled = np.where(np.isnan(block), 0, np.arange(len(block))[:, None])
+        np.maximum.accumulate(filled, axis=0, out=filled)
+        values[p:] = block[filled, np.arange(block.shape[1])]
+        return pd.DataFrame(values, index=pd.DatetimeIndex(times), columns=df.columns)
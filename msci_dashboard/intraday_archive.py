@@ -0,0 +1,289 @@
+"""
+Rolling on-disk archive of 5-minute intraday closes, one Parquet file per trading day.
+
+    python msci_dashboard/intraday_archive.py sync [--days 30]   # fetch what is missing
+    python msci_dashboard/intraday_archive.py list               # archived days and sizes
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from fetch_scheduler import fetch_all
+from intraday import INTRADAY_INTERVAL, close_of
+from price_store import DATA_DIR
+from providers import get_provider
+
+# --- INTRADAY ARCHIVE ---
+# Yahoo only serves 5m bars for the last ~60 days, so each day's bars are kept locally:
+# data/intraday/<YYYY-MM-DD>.parquet, Time x Ticker float32 closes (market local time).
+# sync() brings the archive up to date incrementally (per ticker, from its last archived
+# bar, looked up in a small last_bars.json index) and is run by the background refresher.
+# Readers prune by file name, so a 1W view opens ~5 small files (kept parsed in memory
+# until they change), never the whole archive.
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "intraday")
+# Ticker -> last archived bar, kept by sync() so it never has to search the day files
+INDEX_PATH = os.path.join(ARCHIVE_DIR, "last_bars.json")
+ARCHIVE_DTYPE = np.float32
+
+# Yahoo serves 5m bars for the last 60 days; stay one day inside that
+YAHOO_INTRADAY_DAYS = 59
+# First sync reaches back this far
+BACKFILL_DAYS = min(int(os.environ.get("MSCI_INTRADAY_BACKFILL_DAYS", "7")), YAHOO_INTRADAY_DAYS)
+# Days kept on disk (rolling)
+RETENTION_DAYS = int(os.environ.get("MSCI_INTRADAY_RETENTION_DAYS", "730"))
+
+# Parsed day files kept in memory, shared by all sessions: path -> (mtime, DataFrame)
+MAX_CACHED_DAYS = 32
+
+
+def _day_path(day):
+    return os.path.join(ARCHIVE_DIR, f"{pd.Timestamp(day):%Y-%m-%d}.parquet")
+
+
+def archived_days():
+    """Archived trading days (sorted Timestamps), from the file names only."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    days = []
+    for name in os.listdir(ARCHIVE_DIR):
+        if name.endswith(".parquet"):
+            try:
+                days.append(pd.Timestamp(name[:-len(".parquet")]))
+            except ValueError:
+                continue
+    return sorted(days)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def read_day(day, tickers=None):
+    """One day's Time x Ticker closes (only the stored columns of tickers); empty if not archived."""
+    path = _day_path(day)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return pd.DataFrame()
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is None or cached[0] != mtime:
+        try:
+            df = pd.read_parquet(path)
+        except Exception as e:
+            print(f"Could not read intraday archive {path}: {e}")
+            return pd.DataFrame()
+        with _cache_lock:
+            _cache.pop(path, None)
+            _cache[path] = (mtime, df)
+            while len(_cache) > MAX_CACHED_DAYS:
+                _cache.pop(next(iter(_cache)))
+    else:
+        df = cached[1]
+    if tickers is None:
+        return df
+    return df[[t for t in tickers if t in df.columns]]
+
+
+def write_day(day, closes):
+    """Merges closes (Time x Ticker) into the day's file; new values win over archived ones."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = _day_path(day)
+    old = read_day(day)
+    df = closes.combine_first(old) if not old.empty else closes
+    df = df.sort_index().astype(ARCHIVE_DTYPE)
+    df.index.name = "Time"
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+
+
+def load(tickers, start=None, end=None):
+    """
+    Time x Ticker closes from the archive between start and end (dates, inclusive).
+    Partition pruning: only the day files in the range are opened, and only tickers' columns used.
+    """
+    days = archived_days()
+    if start is not None:
+        days = [d for d in days if d >= pd.Timestamp(start).normalize()]
+    if end is not None:
+        days = [d for d in days if d <= pd.Timestamp(end).normalize()]
+    frames = [df for df in (read_day(d, tickers) for d in days) if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames).sort_index()
+
+
+def _scan_last_bars():
+    """
+    Ticker -> last archived bar from the day files themselves (newest first; a file is only
+    opened for tickers its schema has and no newer file had). Seeds the index once.
+    """
+    found = {}
+    for day in reversed(archived_days()):
+        try:
+            columns = pq.read_schema(_day_path(day)).names
+        except Exception as e:
+            print(f"Could not read intraday archive {_day_path(day)}: {e}")
+            continue
+        wanted = [t for t in columns if t != "Time" and t not in found]
+        if not wanted:
+            continue
+        df = read_day(day, wanted)
+        for t in df.columns:
+            valid = df[t].dropna()
+            if not valid.empty:
+                found[t] = valid.index[-1]
+    return found
+
+
+def read_index():
+    """Ticker -> last archived bar (Timestamp); None if there is no readable index yet."""
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return {t: pd.Timestamp(ts) for t, ts in json.load(f).items()}
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable intraday archive index {INDEX_PATH}: {e}")
+        return None
+
+
+def write_index(index):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    tmp_path = INDEX_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({t: ts.isoformat() for t, ts in sorted(index.items())}, f)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def last_archived(tickers):
+    """Ticker -> timestamp of its last archived bar (tickers never archived are left out)."""
+    index = read_index()
+    if index is None:
+        index = _scan_last_bars()
+        try:
+            write_index(index)
+        except Exception as e:
+            print(f"Could not write intraday archive index {INDEX_PATH}: {e}")
+    return {t: index[t] for t in tickers if t in index}
+
+
+def prune(retention_days=RETENTION_DAYS):
+    """Deletes day files older than the retention window. Returns the number removed."""
+    cutoff = pd.Timestamp(datetime.now().date()) - timedelta(days=retention_days)
+    removed = 0
+    for day in archived_days():
+        if day < cutoff:
+            try:
+                os.remove(_day_path(day))
+                removed += 1
+            except OSError as e:
+                print(f"Could not remove {_day_path(day)}: {e}")
+    return removed
+
+
+def sync(tickers, backfill_days=BACKFILL_DAYS, **scheduler_options):
+    """
+    Fetches each ticker's 5m bars from its last archived bar on (the last bar is re-fetched,
+    it may still have been forming) or backfill_days back for new tickers, and writes them
+    into the day files. Returns the number of bars fetched.
+    """
+    last = last_archived(tickers)
+    today = pd.Timestamp(datetime.now().date())
+    default_start = today - timedelta(days=backfill_days)
+    # After a long outage, resume as far back as Yahoo still has 5m bars
+    oldest_available = today - timedelta(days=YAHOO_INTRADAY_DAYS)
+    gaps = [t for t, ts in last.items() if ts < oldest_available]
+    if gaps:
+        print(f"Intraday archive: {len(gaps)} tickers last archived before {oldest_available:%Y-%m-%d}, "
+              f"bars in between are no longer available")
+    fetch_from = {t: max(last[t], oldest_available) if t in last else default_start for t in tickers}
+
+    new_bars, _ = fetch_all(
+        tickers,
+        lambda t: close_of(get_provider().history(t, start=fetch_from[t], interval=INTRADAY_INTERVAL)),
+        kind="intraday",
+        cache_empty=[t for t in tickers if t not in last],
+        **scheduler_options
+    )
+    series = {t: s for t, s in new_bars.items() if not s.empty}
+    index = read_index() or {}
+    if series:
+        df = pd.concat(series, axis=1).sort_index()
+        for day, closes in df.groupby(df.index.normalize()):
+            closes = closes.dropna(axis=1, how="all")
+            try:
+                write_day(day, closes)
+            except Exception as e:
+                print(f"Could not write intraday archive for {day:%Y-%m-%d}: {e}")
+                continue
+            for t in closes.columns:
+                index[t] = max(index.get(t, closes.index[0]), closes[t].last_valid_index())
+    prune()
+    # Tickers whose files were all pruned count as never archived again
+    cutoff = pd.Timestamp(datetime.now().date()) - timedelta(days=RETENTION_DAYS)
+    index = {t: ts for t, ts in index.items() if ts >= cutoff}
+    try:
+        write_index(index)
+    except Exception as e:
+        print(f"Could not write intraday archive index {INDEX_PATH}: {e}")
+    return sum(len(s) for s in series.values())
+
+
+def combine(archived, live):
+    """Archived bars plus the live stream's (live wins where both have a bar), forward-filled."""
+    if archived.empty:
+        return live
+    archived = archived.astype(np.float64)
+    df = live.combine_first(archived) if not live.empty else archived
+    return df.sort_index().ffill()
+
+
+def session_window(tickers, sessions, live=None):
+    """
+    Bars of the last `sessions` archived/live trading days for tickers (e.g. 1 for 1D,
+    5 for 1W), with today's live stream merged in.
+    """
+    live = live if live is not None else pd.DataFrame()
+    days = archived_days()
+    if not live.empty:
+        days = sorted(set(days) | set(live.index.normalize()))
+    if not days:
+        return pd.DataFrame()
+    start = days[-sessions] if len(days) >= sessions else days[0]
+    df = combine(load(tickers, start=start), live[live.index >= start] if not live.empty else live)
+    return df[[t for t in tickers if t in df.columns]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Intraday (5m) archive.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_sync = sub.add_parser("sync", help="fetch bars newer than the archive for every ticker")
+    p_sync.add_argument("--days", type=int, default=BACKFILL_DAYS, help="backfill for tickers not archived yet (max 59)")
+    sub.add_parser("list", help="archived days")
+    args = parser.parse_args(argv)
+
+    if args.command == "sync":
+        from etf_universe import UNIVERSE
+        n = sync(UNIVERSE.tickers, backfill_days=min(args.days, YAHOO_INTRADAY_DAYS))
+        print(f"Fetched {n} bars; {len(archived_days())} days archived in {ARCHIVE_DIR}")
+    else:
+        for day in archived_days():
+            path = _day_path(day)
+            meta = pq.ParquetFile(path).metadata
+            print(f"{day:%Y-%m-%d}  {meta.num_rows:4d} bars  {meta.num_columns - 1:4d} tickers  "
+                  f"{os.path.getsize(path) / 1024:7.1f} KB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
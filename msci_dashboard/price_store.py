@@ -0,0 +1,219 @@
+import os
+import time
+import pandas as pd
+import fetch_scheduler
+from providers import get_provider
+
+# --- LOCAL PRICE STORE ---
+# One Parquet file per ticker (data/prices/<ticker>.parquet) holding the daily bars.
+# fetch_data reads this first and only asks Yahoo for the bars after each ticker's
+# last stored date, so a restart is a local read and a refresh is a few rows per ticker.
+# Dividend / split events that come with the bars are kept next to them
+# (data/events/<ticker>.parquet, event rows only) for the total-return series.
+
+DATA_DIR = os.environ.get(
+    "MSCI_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+)
+PRICES_DIR = os.path.join(DATA_DIR, "prices")
+EVENTS_DIR = os.path.join(DATA_DIR, "events")
+
+# Columns we keep from yfinance. Raw (unadjusted) bars are stored on purpose:
+# adjusted closes get rewritten by Yahoo after every dividend, which would make
+# old stored rows and newly appended rows disagree.
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close", "Volume"]
+# Corporate actions from the same history call (stored separately, see read_events)
+ACTION_COLUMNS = ["Dividends", "Stock Splits"]
+
+
+def _ticker_path(ticker):
+    return os.path.join(PRICES_DIR, f"{ticker}.parquet")
+
+
+def read_ticker(ticker):
+    """Returns the stored bars for one ticker (empty DataFrame if nothing stored yet)."""
+    path = _ticker_path(ticker)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        # A corrupt partition just means a full re-download for that ticker
+        print(f"Could not read stored prices for {ticker}: {e}")
+        return pd.DataFrame()
+
+
+def write_ticker(ticker, df):
+    """Writes the bars for one ticker (temp file + rename so readers never see half a file)."""
+    os.makedirs(PRICES_DIR, exist_ok=True)
+    path = _ticker_path(ticker)
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _events_path(ticker):
+    return os.path.join(EVENTS_DIR, f"{ticker}.parquet")
+
+
+def read_events(ticker):
+    """
+    Stored dividend / split events for one ticker (Date x ACTION_COLUMNS, event rows only).
+    None if the ticker's events were never synced (an empty frame means: synced, no events).
+    """
+    path = _events_path(ticker)
+    if not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception as e:
+        print(f"Could not read stored events for {ticker}: {e}")
+        return None
+
+
+def write_events(ticker, events):
+    os.makedirs(EVENTS_DIR, exist_ok=True)
+    path = _events_path(ticker)
+    tmp_path = path + ".tmp"
+    events.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def events_of(bars):
+    """Rows of a bar frame with a dividend or a split."""
+    cols = [c for c in ACTION_COLUMNS if c in bars.columns]
+    events = bars[cols].reindex(columns=ACTION_COLUMNS).fillna(0.0).astype("float64")
+    return events[(events != 0).any(axis=1)]
+
+
+def last_stored_date(ticker):
+    """Returns the last stored bar date for a ticker, or None."""
+    df = read_ticker(ticker)
+    if df.empty:
+        return None
+    return df.index[-1]
+
+
+def stale_tickers(tickers, max_age_seconds):
+    """Tickers with nothing stored or whose stored file is older than max_age_seconds."""
+    now = time.time()
+    stale = []
+    for ticker in tickers:
+        path = _ticker_path(ticker)
+        if not os.path.exists(path) or now - os.path.getmtime(path) > max_age_seconds:
+            stale.append(ticker)
+    return stale
+
+
+def merge_bars(stored, new):
+    """Appends new bars to stored ones. On overlapping dates the new bar wins."""
+    if stored.empty:
+        return new.sort_index()
+    if new.empty:
+        return stored
+    combined = pd.concat([stored, new])
+    combined = combined[~combined.index.duplicated(keep="last")]
+    return combined.sort_index()
+
+
+def _clean_bars(df):
+    """Normalizes a per-ticker bar frame: naive DatetimeIndex, known columns, no empty rows."""
+    df = df[[c for c in BAR_COLUMNS + ACTION_COLUMNS if c in df.columns]]
+    df = df.dropna(how="all")
+    if df.empty:
+        return df
+    df.index = pd.DatetimeIndex(df.index).tz_localize(None)
+    df.index.name = "Date"
+    return df
+
+
+def download_bars(ticker, start_date):
+    """Downloads daily bars for one ticker starting at start_date."""
+    # Per-ticker history instead of yf.download: download keeps its results in module-level
+    # state, which is not safe when several workers call it at the same time.
+    hist = get_provider().history(ticker, start=start_date, auto_adjust=False)
+    return _clean_bars(hist)
+
+
+def sync_prices(tickers, start_date, progress=None, **scheduler_options):
+    """
+    Brings the local store up to date and returns the Close matrix (Date x Ticker).
+
+    Tickers with nothing stored get the full history from start_date; the rest only
+    get the bars from their last stored date onwards (the last bar is re-fetched
+    because it may have been an intraday snapshot when it was stored).
+    Downloads run through fetch_scheduler (worker pool, rate limit, per-ticker retry);
+    a ticker that still fails just keeps serving what is already stored.
+
+    Dividend / split events in the new bars are added to the events store. Tickers whose
+    events were never synced get the full history once. A new split makes Yahoo re-base
+    the whole (split-adjusted) history, so that ticker is re-downloaded in full and its
+    stored bars and events replaced, keeping everything on one basis.
+    """
+    stored = {t: read_ticker(t) for t in tickers}
+    events = {t: read_events(t) for t in tickers}
+
+    full_start = pd.Timestamp(start_date)
+    fetch_from = {
+        t: full_start if df.empty or events[t] is None else df.index[-1]
+        for t, df in stored.items()
+    }
+
+    new_bars, _ = fetch_scheduler.fetch_all(
+        tickers,
+        lambda t: download_bars(t, fetch_from[t].normalize()),
+        progress=progress,
+        kind="prices",
+        # Nothing new since the last stored bar is normal; no history at all is a miss
+        cache_empty=[t for t, df in stored.items() if df.empty],
+        **scheduler_options
+    )
+
+    split = [
+        t for t, bars in new_bars.items()
+        if fetch_from[t] > full_start and not bars.empty and "Stock Splits" in bars.columns
+        and (bars.loc[bars.index > fetch_from[t], "Stock Splits"].fillna(0) != 0).any()
+    ]
+    if split:
+        print(f"New splits for {', '.join(split)}: re-downloading their full history")
+        rebased, _ = fetch_scheduler.fetch_all(
+            split, lambda t: download_bars(t, full_start.normalize()), kind="prices", **scheduler_options
+        )
+        for t, bars in rebased.items():
+            if not bars.empty:
+                new_bars[t] = bars
+                fetch_from[t] = full_start
+                stored[t] = pd.DataFrame()
+
+    for ticker, bars in new_bars.items():
+        if bars.empty:
+            continue
+        full = fetch_from[ticker] == full_start
+        new_events = events_of(bars)
+        if not full and events[ticker] is not None:
+            new_events = merge_bars(events[ticker], new_events)
+        merged = merge_bars(stored[ticker], bars[[c for c in BAR_COLUMNS if c in bars.columns]])
+        try:
+            write_ticker(ticker, merged)
+            write_events(ticker, new_events)
+        except Exception as e:
+            print(f"Could not write stored prices for {ticker}: {e}")
+        stored[ticker] = merged
+
+    return close_matrix(stored, start_date)
+
+
+def close_matrix(stored, start_date=None):
+    """Builds the Date x Ticker Close matrix from {ticker: bars}."""
+    closes = {t: df["Close"] for t, df in stored.items() if not df.empty and "Close" in df.columns}
+    if not closes:
+        return pd.DataFrame()
+    df_close = pd.concat(closes, axis=1).sort_index()
+    if start_date is not None:
+        df_close = df_close[df_close.index >= pd.Timestamp(start_date)]
+    return df_close
+
+
+def load_prices(tickers, start_date=None):
+    """Close matrix straight from the local store (no network)."""
+    return close_matrix({t: read_ticker(t) for t in tickers}, start_date)
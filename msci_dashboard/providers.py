@@ -0,0 +1,283 @@
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# --- MARKET DATA PROVIDERS ---
+# Every module gets history / intraday bars / info / shares outstanding through
+# get_provider() instead of calling yfinance directly.
+#   MSCI_DATA_PROVIDER=yfinance (default)  -> live Yahoo data
+#   MSCI_DATA_PROVIDER=replay              -> recorded or synthetic data from local files,
+#                                             so the whole pipeline runs offline
+# Replay options:
+#   MSCI_REPLAY_DIR      folder with recorded data (default: data/replay next to this file)
+#   MSCI_REPLAY_LATENCY  artificial latency per call in seconds (default: 0)
+#   MSCI_REPLAY_END      last date of synthetic history, YYYY-MM-DD (default: today)
+
+MARKET_TZ = "Asia/Tokyo"
+
+# Synthetic replay data: trading days of 5m bars served by history(interval="5m")
+INTRADAY_SESSIONS = 10
+
+
+class MarketDataProvider:
+    """Interface shared by all providers. Frames look like yfinance output."""
+
+    def history(self, ticker, start=None, end=None, interval="1d", auto_adjust=False):
+        """Bars (Open/High/Low/Close/Adj Close/Volume/Dividends/Stock Splits) for one ticker."""
+        raise NotImplementedError
+
+    def intraday(self, tickers, period="1d", interval="5m"):
+        """Today's intraday bars as {ticker: bars}."""
+        raise NotImplementedError
+
+    def info(self, ticker):
+        """Info fields (navPrice, totalAssets, trailingPE, ...) as a dict."""
+        raise NotImplementedError
+
+    def shares(self, ticker, start=None, end=None):
+        """Historical shares outstanding as a Series indexed by date."""
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    """Live data from Yahoo Finance."""
+
+    def __init__(self):
+        import yfinance as yf
+        self.yf = yf
+
+    def history(self, ticker, start=None, end=None, interval="1d", auto_adjust=False):
+        return self.yf.Ticker(ticker).history(start=start, end=end, interval=interval, auto_adjust=auto_adjust)
+
+    def intraday(self, tickers, period="1d", interval="5m"):
+        df = self.yf.download(tickers, period=period, interval=interval, progress=False, threads=True)
+        out = {}
+        if df is None or df.empty:
+            return out
+        if isinstance(df.columns, pd.MultiIndex):
+            # yfinance structure: (Price, Ticker)
+            present = df.columns.get_level_values(1).unique()
+            for ticker in tickers:
+                if ticker in present:
+                    out[ticker] = df.xs(ticker, axis=1, level=1).dropna(how="all")
+        elif len(tickers) == 1:
+            out[tickers[0]] = df.dropna(how="all")
+        return out
+
+    def info(self, ticker):
+        return self.yf.Ticker(ticker).info or {}
+
+    def shares(self, ticker, start=None, end=None):
+        shares = self.yf.Ticker(ticker).get_shares_full(start=start, end=end)
+        return shares if shares is not None else pd.Series(dtype="float64")
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves recorded data from local files, falling back to deterministic synthetic data.
+
+    Layout under root: history/<ticker>.parquet, intraday/<ticker>.parquet,
+    info/<ticker>.json, shares/<ticker>.parquet (see record()).
+    """
+
+    def __init__(self, root, latency=0.0, end_date=None):
+        self.root = root
+        self.latency = latency
+        self.end_date = pd.Timestamp(end_date or datetime.now().date())
+
+    # -- helpers --
+    def _sleep(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def _path(self, kind, ticker, ext):
+        return os.path.join(self.root, kind, f"{ticker}.{ext}")
+
+    def _rng(self, ticker, salt=""):
+        # Seeded by ticker so every run (and every process) sees the same data
+        return np.random.default_rng(zlib.crc32(f"{ticker}{salt}".encode("utf-8")))
+
+    def _read_frame(self, kind, ticker):
+        path = self._path(kind, ticker, "parquet")
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+        return None
+
+    def _synthetic_daily(self, ticker):
+        rng = self._rng(ticker)
+        dates = pd.bdate_range(end=self.end_date, periods=260 * 20, tz=MARKET_TZ)
+        start_price = rng.uniform(500, 30000)
+        close = start_price * np.exp(np.cumsum(rng.normal(0.0002, 0.01, len(dates))))
+        spread = np.abs(rng.normal(0, 0.004, len(dates)))
+        # Semiannual dividends (own seed, so the prices stay the same as before)
+        div_rng = self._rng(ticker, "dividends")
+        dividends = np.zeros(len(dates))
+        ex_dates = np.arange(int(div_rng.integers(0, 130)), len(dates), 130)
+        dividends[ex_dates] = close[ex_dates] * div_rng.uniform(0.0, 0.04) / 2
+        return pd.DataFrame({
+            "Open": close * (1 + rng.normal(0, 0.002, len(dates))),
+            "High": close * (1 + spread),
+            "Low": close * (1 - spread),
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(1_000, 500_000, len(dates)),
+            "Dividends": dividends,
+            "Stock Splits": 0.0,
+        }, index=pd.DatetimeIndex(dates, name="Date"))
+
+    def _synthetic_intraday(self, ticker, sessions=1):
+        """5m bars of the last `sessions` trading days on or before end_date (same bars for a day every time)."""
+        daily = self._synthetic_daily(ticker)["Close"]
+        frames = []
+        for day in pd.bdate_range(end=self.end_date, periods=sessions):
+            day = day.strftime("%Y-%m-%d")
+            rng = self._rng(ticker, f"intraday{day}")
+            morning = pd.date_range(f"{day} 09:00", f"{day} 11:25", freq="5min", tz=MARKET_TZ)
+            afternoon = pd.date_range(f"{day} 12:30", f"{day} 15:25", freq="5min", tz=MARKET_TZ)
+            idx = morning.append(afternoon)
+            base = daily.iloc[daily.index.searchsorted(idx[0], side="left") - 1]
+            close = base * np.exp(np.cumsum(rng.normal(0, 0.001, len(idx))))
+            frames.append(pd.DataFrame({
+                "Open": close, "High": close, "Low": close, "Close": close, "Adj Close": close,
+                "Volume": rng.integers(100, 10_000, len(idx)),
+            }, index=pd.DatetimeIndex(idx, name="Datetime")))
+        return pd.concat(frames)
+
+    # -- interface --
+    def history(self, ticker, start=None, end=None, interval="1d", auto_adjust=False):
+        self._sleep()
+        if interval == "1d":
+            df = self._read_frame("history", ticker)
+            if df is None:
+                df = self._synthetic_daily(ticker)
+        else:
+            df = self._read_frame("intraday", ticker)
+            if df is None:
+                # Like Yahoo, fine-grained history only reaches back a limited number of days
+                df = self._synthetic_intraday(ticker, sessions=INTRADAY_SESSIONS)
+        index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+        mask = np.ones(len(df), dtype=bool)
+        if start is not None:
+            mask &= index >= pd.Timestamp(start)
+        if end is not None:
+            mask &= index < pd.Timestamp(end)
+        return df[mask]
+
+    def intraday(self, tickers, period="1d", interval="5m"):
+        self._sleep()
+        out = {}
+        for ticker in tickers:
+            df = self._read_frame("intraday", ticker)
+            out[ticker] = df if df is not None else self._synthetic_intraday(ticker)
+        return out
+
+    def info(self, ticker):
+        self._sleep()
+        path = self._path("info", ticker, "json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        rng = self._rng(ticker, "info")
+        price = float(self._synthetic_daily(ticker)["Close"].iloc[-1])
+        return {
+            "regularMarketPreviousClose": price,
+            "previousClose": price,
+            "navPrice": price * (1 + rng.normal(0, 0.003)),
+            "totalAssets": float(rng.uniform(1e9, 1e12)),
+            "sharesOutstanding": float(rng.uniform(1e6, 1e9)),
+            "trailingPE": float(rng.uniform(10, 30)),
+            "priceToBook": float(rng.uniform(0.8, 3.0)),
+            "yield": float(rng.uniform(0.0, 0.05)),
+        }
+
+    def shares(self, ticker, start=None, end=None):
+        self._sleep()
+        df = self._read_frame("shares", ticker)
+        if df is not None:
+            shares = df.iloc[:, 0]
+        else:
+            rng = self._rng(ticker, "shares")
+            dates = pd.bdate_range(end=self.end_date, periods=260 * 3, tz=MARKET_TZ)
+            base = rng.uniform(1e6, 1e8)
+            # Creations/redemptions come in lumps, most days nothing changes
+            lumps = rng.normal(0, base * 0.01, len(dates)) * (rng.random(len(dates)) < 0.2)
+            shares = pd.Series(np.maximum(base + np.cumsum(lumps), 0).round(), index=dates)
+        index = shares.index.tz_localize(None) if shares.index.tz is not None else shares.index
+        mask = np.ones(len(shares), dtype=bool)
+        if start is not None:
+            mask &= index >= pd.Timestamp(start)
+        if end is not None:
+            mask &= index < pd.Timestamp(end)
+        return shares[mask]
+
+
+_PROVIDER = None
+
+
+def get_provider():
+    """Returns the process-wide provider selected by MSCI_DATA_PROVIDER."""
+    global _PROVIDER
+    if _PROVIDER is None:
+        name = os.environ.get("MSCI_DATA_PROVIDER", "yfinance").lower()
+        if name == "replay":
+            root = os.environ.get(
+                "MSCI_REPLAY_DIR",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "replay")
+            )
+            latency = float(os.environ.get("MSCI_REPLAY_LATENCY", "0"))
+            _PROVIDER = ReplayProvider(root, latency=latency, end_date=os.environ.get("MSCI_REPLAY_END"))
+        else:
+            _PROVIDER = YFinanceProvider()
+    return _PROVIDER
+
+
+def set_provider(provider):
+    """Overrides the process-wide provider (benchmarks, offline runs)."""
+    global _PROVIDER
+    _PROVIDER = provider
+
+
+def record(tickers, out_dir, source=None, years=5):
+    """Records live data for tickers into a replay folder."""
+    source = source or YFinanceProvider()
+    start = datetime.now() - timedelta(days=365 * years)
+    for kind in ("history", "intraday", "info", "shares"):
+        os.makedirs(os.path.join(out_dir, kind), exist_ok=True)
+
+    intraday = source.intraday(list(tickers))
+    for ticker in tickers:
+        print(f"Recording {ticker}...")
+        try:
+            source.history(ticker, start=start).to_parquet(os.path.join(out_dir, "history", f"{ticker}.parquet"))
+            if ticker in intraday:
+                intraday[ticker].to_parquet(os.path.join(out_dir, "intraday", f"{ticker}.parquet"))
+            with open(os.path.join(out_dir, "info", f"{ticker}.json"), "w", encoding="utf-8") as f:
+                json.dump(source.info(ticker), f, indent=2, ensure_ascii=False, default=str)
+            shares = source.shares(ticker, start=start)
+            if not shares.empty:
+                shares = shares[~shares.index.duplicated(keep="last")]
+                shares.to_frame("Shares").to_parquet(os.path.join(out_dir, "shares", f"{ticker}.parquet"))
+        except Exception as e:
+            print(f"Error recording {ticker}: {e}")
+
+
+if __name__ == "__main__":
+    # python msci_dashboard/providers.py record [OUT_DIR] [TICKER ...]
+    if len(sys.argv) >= 2 and sys.argv[1] == "record":
+        here = os.path.dirname(os.path.abspath(__file__))
+        out_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(here, "data", "replay")
+        tickers = sys.argv[3:]
+        if not tickers:
+            # Default: the whole registry
+            from etf_universe import TICKERS
+            tickers = TICKERS
+        record(tickers, out_dir)
+        print(f"Replay data saved to {out_dir}")
+    else:
+        print("Usage: python msci_dashboard/providers.py record [OUT_DIR] [TICKER ...]")
@@ -1,13 +1,14 @@
-import yfinance as yf
 import pandas as pd
 
+from providers import get_provider
+
 ticker = "2559.T" # MAXIS ACWI
 print(f"Checking data for {ticker}...")
-stock = yf.Ticker(ticker)
+provider = get_provider()
 
 # 1. Check get_shares_full (Historical Shares Outstanding)
 try:
-    shares = stock.get_shares_full(start="2024-01-01")
+    shares = provider.shares(ticker, start="2024-01-01")
     print("\n--- HISTORICAL SHARES ---")
     if not shares.empty:
         print(shares.head())
@@ -18,6 +19,6 @@ except Exception as e:
     print(f"Error fetching shares: {e}")
 
 # 2. Check metadata
-info = stock.info
+info = provider.info(ticker)
 print(f"\nTotal Assets (Current): {info.get('totalAssets')}")
 print(f"Shares Outstanding (Current): {info.get('sharesOutstanding')}")
@@ -1,13 +1,15 @@
-import yfinance as yf
 import pandas as pd
+from datetime import datetime, timedelta
+
+from providers import get_provider
 
 # Test Ticker: 2559.T (MAXIS ACWI)
 ticker = "2559.T"
 print(f"Fetching info for {ticker}...")
-stock = yf.Ticker(ticker)
+provider = get_provider()
 
 # 1. Check Info dictionary for NAV-related fields
-info = stock.info
+info = provider.info(ticker)
 print("\n--- INFO DICT KEYS (containing 'nav' or 'net') ---")
 for k in info.keys():
     if 'nav' in k.lower() or 'net' in k.lower():
@@ -17,7 +19,7 @@ for k in info.keys():
 print(f"\nnavPrice: {info.get('navPrice')}")
 
 # 3. Check History for 'Capital Gains' or other events that *might* imply NAV (unlikely)
-hist = stock.history(period="1mo")
+hist = provider.history(ticker, start=datetime.now() - timedelta(days=30), auto_adjust=True)
 print("\n--- HISTORY COLUMNS ---")
 print(hist.columns)
 
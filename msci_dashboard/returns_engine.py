@@ -0,0 +1,146 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+# --- RETURNS ENGINE ---
+# Computes the whole (Ticker x Period) returns matrix in one pass over the aligned
+# price matrix instead of slicing every ticker's series once per period.
+# Also holds the timeframe slicing and rebase-to-0% used by the charts.
+
+# Rolling periods in calendar days, measured back from each ticker's last date
+PERIODS = {
+    '1D': 1,
+    '1W': 7,
+    '1M': 30,
+    '3M': 91,
+    '1Yr': 365,
+    '3Yr': 365*3,
+    '5Yr': 365*5
+}
+
+CALENDAR_PERIODS = ['MTD', 'QTD', 'YTD']
+
+# Chart time frames (1D, 1W, 1M, 3M, MTD, QTD, YTD, 1Yr, 3Yr, MAX)
+TIME_FRAMES = [
+    "1D", "1W", "1M", "3M", "MTD", "QTD", "YTD", "1Yr", "3Yr", "MAX"
+]
+
+
+def _last_valid_positions(values):
+    """Row position of the last non-NaN value per column (-1 if the column is all NaN)."""
+    valid = ~np.isnan(values)
+    n_rows = values.shape[0]
+    last_pos = n_rows - 1 - np.argmax(valid[::-1], axis=0)
+    last_pos[~valid.any(axis=0)] = -1
+    return last_pos
+
+
+def _target_dates(last_dates):
+    """
+    Start-of-period reference date per (ticker, period).
+    Rows follow last_dates, columns follow list(PERIODS) + CALENDAR_PERIODS.
+    """
+    targets = [last_dates - np.timedelta64(days, 'D') for days in PERIODS.values()]
+
+    # Calendar periods: the day before the month / quarter / year started
+    months = last_dates.astype('datetime64[M]')
+    month_of_year = months.astype(np.int64) % 12
+    quarter_start = months - (month_of_year % 3)
+    year_start = last_dates.astype('datetime64[Y]')
+
+    one_day = np.timedelta64(1, 'D')
+    targets.append(months.astype('datetime64[D]') - one_day)         # MTD
+    targets.append(quarter_start.astype('datetime64[D]') - one_day)  # QTD
+    targets.append(year_start.astype('datetime64[D]') - one_day)     # YTD (Dec 31 of last year)
+
+    return np.stack([t.astype('datetime64[ns]') for t in targets], axis=1)
+
+
+def calculate_returns(df_prices):
+    """
+    Calculates returns for all rolling and calendar periods, handling data gaps robustly.
+
+    Same semantics as the old per-ticker loop: every ticker is measured from its own
+    last valid date (Foreign vs Japan ETFs have different holidays) against the last
+    valid price on or before each target date; periods without history are NaN.
+    """
+    if df_prices.empty:
+        return pd.DataFrame()
+
+    if not df_prices.index.is_monotonic_increasing:
+        df_prices = df_prices.sort_index()
+
+    values = df_prices.to_numpy(dtype=np.float64)
+    last_pos = _last_valid_positions(values)
+    has_data = last_pos >= 0
+    if not has_data.any():
+        return pd.DataFrame()
+
+    values = values[:, has_data]
+    last_pos = last_pos[has_data]
+    tickers = df_prices.columns[has_data]
+
+    # Last valid price on or before each row == forward-filled matrix
+    filled = pd.DataFrame(values).ffill().to_numpy()
+
+    dates = df_prices.index.to_numpy(dtype='datetime64[ns]')
+    last_dates = dates[last_pos]
+    col_idx = np.arange(len(tickers))
+    last_prices = filled[last_pos, col_idx]
+
+    # Sorted-index lookup for all (ticker, period) targets at once
+    targets = _target_dates(last_dates)
+    pos = np.searchsorted(dates, targets.ravel(), side='right').reshape(targets.shape) - 1
+    start_prices = np.where(pos >= 0, filled[np.clip(pos, 0, None), col_idx[:, None]], np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = ((last_prices[:, None] - start_prices) / start_prices) * 100
+
+    df_res = pd.DataFrame(returns, index=tickers, columns=list(PERIODS) + CALENDAR_PERIODS)
+    df_res.index.name = 'Ticker'
+    return df_res
+
+
+def filter_by_timeframe(df, timeframe):
+    """Filters dataframe based on selected timeframe."""
+    if df.empty:
+        return df
+    return df[df.index >= timeframe_start(df, timeframe)].copy()
+
+
+def timeframe_start(df, timeframe):
+    """First date kept by filter_by_timeframe (df must not be empty)."""
+    end_date = df.index[-1]
+    start_date = df.index[0] # Default filter
+    
+    if timeframe == "1D":
+        start_date = end_date - timedelta(days=1)
+    elif timeframe == "1W":
+        start_date = end_date - timedelta(days=7)
+    elif timeframe == "1M":
+        start_date = end_date - timedelta(days=30)
+    elif timeframe == "3M":
+        start_date = end_date - timedelta(days=90)
+    elif timeframe == "1Yr":
+        start_date = end_date - timedelta(days=365)
+    elif timeframe == "3Yr":
+        start_date = end_date - timedelta(days=365*3)
+    elif timeframe == "YTD":
+        start_date = datetime(end_date.year, 1, 1)
+    elif timeframe == "MTD":
+        start_date = datetime(end_date.year, end_date.month, 1) 
+    elif timeframe == "QTD":
+        q_month = ((end_date.month - 1) // 3) * 3 + 1
+        start_date = datetime(end_date.year, q_month, 1)
+    elif timeframe == "MAX":
+        start_date = df.index[0]
+
+    return start_date
+
+
+def normalize_prices(df_sliced):
+    """Rebases every column to 0% at its first valid price."""
+    # Use bfill to get the first VALID price for each ticker, even if they start at slightly different times.
+    # This prevents the whole column from becoming NaN if iloc[0] is NaN.
+    first_valid_prices = df_sliced.bfill().iloc[0]
+    return (df_sliced / first_valid_prices - 1) * 100
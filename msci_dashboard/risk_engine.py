@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from returns_engine import TIME_FRAMES
+
+# --- RISK ANALYTICS ---
+# Volatility, max drawdown (+ duration), Sharpe / Sortino, beta and correlation vs the
+# benchmark for every ticker, computed on the whole Date x Ticker matrix at once
+# (NaN-aware column reductions, no per-ticker loops). RiskCache builds the table for
+# every time frame once per data refresh (see background_refresh.Dataset).
+
+BENCHMARK = os.environ.get("MSCI_RISK_BENCHMARK", "2559.T")  # MSCI ACWI
+RISK_FREE_RATE = float(os.environ.get("MSCI_RISK_FREE_RATE", "0.0"))  # annual, e.g. 0.005
+TRADING_DAYS = 252
+
+# "1D" is intraday-only on the chart; one daily return says nothing about risk
+RISK_TIME_FRAMES = [tf for tf in TIME_FRAMES if tf != "1D"]
+
+RISK_COLUMNS = ["Volatility %", "Max Drawdown %", "Max DD Duration (d)",
+                "Sharpe", "Sortino", "Beta", "Correlation"]
+
+
+def max_drawdown(prices, dates):
+    """
+    Max drawdown (fraction, <= 0) and longest underwater stretch (calendar days,
+    from a peak to its recovery or the end) per column of a Date x Ticker array.
+    """
+    running_max = np.fmax.accumulate(prices, axis=0)  # fmax skips the NaNs before listing
+    drawdown = prices / running_max - 1
+    with np.errstate(all="ignore"):
+        mdd = np.where(np.isnan(drawdown).all(axis=0), np.nan, np.nanmin(np.nan_to_num(drawdown, nan=0.0), axis=0))
+
+    # Row of the last peak (or missing row) at each date; underwater time = date - that peak's date
+    at_peak = ~(drawdown < 0)
+    rows = np.arange(len(dates))[:, None]
+    last_peak = np.maximum.accumulate(np.where(at_peak, rows, 0), axis=0)
+    day_numbers = dates.astype("datetime64[D]").astype(np.int64)
+    underwater_days = day_numbers[:, None] - day_numbers[last_peak]
+    duration = underwater_days.max(axis=0).astype(np.float64)
+    duration[np.isnan(mdd)] = np.nan
+    return mdd, duration
+
+
+def risk_metrics(df_prices, benchmark=BENCHMARK, risk_free_rate=RISK_FREE_RATE):
+    """Risk table (index: Ticker, columns: RISK_COLUMNS) for one Date x Ticker price matrix."""
+    if df_prices.empty or len(df_prices) < 2:
+        return pd.DataFrame(columns=RISK_COLUMNS, index=pd.Index(df_prices.columns, name="Ticker"), dtype=np.float64)
+
+    prices = df_prices.to_numpy(dtype=np.float64)
+    with np.errstate(all="ignore"):
+        rets = prices[1:] / prices[:-1] - 1
+    valid = ~np.isnan(rets)
+    n = valid.sum(axis=0)
+    rf_daily = risk_free_rate / TRADING_DAYS
+
+    with np.errstate(all="ignore"):
+        mean = np.nanmean(rets, axis=0)
+        vol = np.nanstd(rets, axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+        excess = (mean - rf_daily) * TRADING_DAYS
+        sharpe = excess / vol
+        downside = np.sqrt(np.nanmean(np.minimum(rets - rf_daily, 0) ** 2, axis=0)) * np.sqrt(TRADING_DAYS)
+        sortino = excess / downside
+
+        # Beta / correlation on pairwise-complete days (new listings are shorter than the benchmark)
+        beta = corr = np.full(rets.shape[1], np.nan)
+        if benchmark in df_prices.columns:
+            rb = rets[:, df_prices.columns.get_loc(benchmark)][:, None]
+            both = valid & ~np.isnan(rb)
+            m = both.sum(axis=0)
+            x = np.where(both, rets, 0.0)
+            y = np.where(both, rb, 0.0)
+            x = np.where(both, x - x.sum(axis=0) / m, 0.0)
+            y = np.where(both, y - y.sum(axis=0) / m, 0.0)
+            cov = (x * y).sum(axis=0) / (m - 1)
+            var_x = (x * x).sum(axis=0) / (m - 1)
+            var_b = (y * y).sum(axis=0) / (m - 1)
+            beta = np.where(m > 2, cov / var_b, np.nan)
+            corr = np.where(m > 2, cov / np.sqrt(var_x * var_b), np.nan)
+
+    mdd, duration = max_drawdown(prices, df_prices.index.to_numpy())
+
+    too_short = n < 2
+    table = pd.DataFrame({
+        "Volatility %": vol * 100,
+        "Max Drawdown %": mdd * 100,
+        "Max DD Duration (d)": duration,
+        "Sharpe": sharpe,
+        "Sortino": sortino,
+        "Beta": beta,
+        "Correlation": corr,
+    }, index=pd.Index(df_prices.columns, name="Ticker"))
+    table.loc[too_short, ["Volatility %", "Sharpe", "Sortino"]] = np.nan
+    return table.replace([np.inf, -np.inf], np.nan)
+
+
+class RiskCache:
+    """Risk table per time frame for the whole universe, from SeriesCache's sliced matrices."""
+
+    def __init__(self, series, time_frames=RISK_TIME_FRAMES):
+        self.tables = {tf: risk_metrics(series.sliced[tf]) for tf in time_frames}
+
+    def get(self, timeframe, tickers):
+        df = self.tables[timeframe]
+        return df.loc[[t for t in tickers if t in df.index]]
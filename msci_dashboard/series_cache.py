@@ -0,0 +1,25 @@
+from returns_engine import TIME_FRAMES, normalize_prices, timeframe_start
+
+# --- DERIVED SERIES CACHE ---
+# Sliced and rebased-to-0% price matrices for every time frame, built once per data
+# refresh for the whole universe. Slicing only depends on the date index and rebasing
+# is per column, so selecting tickers from these afterwards gives exactly what
+# filter_by_timeframe + normalize_prices would give on the filtered frame.
+# Sliced matrices are row slices (views) of the shared price matrix, not copies.
+
+
+class SeriesCache:
+    """Per-timeframe sliced / normalized matrices (Date x Ticker). Read-only, shared by sessions."""
+
+    def __init__(self, df_prices, time_frames=TIME_FRAMES):
+        self.sliced = {}
+        self.normalized = {}
+        for tf in time_frames:
+            sliced = df_prices.loc[timeframe_start(df_prices, tf):] if not df_prices.empty else df_prices
+            self.sliced[tf] = sliced
+            self.normalized[tf] = normalize_prices(sliced) if not sliced.empty else sliced
+
+    def get(self, timeframe, tickers, normalized=True):
+        """Columns for tickers (in the given order) from the cached matrix of timeframe."""
+        df = (self.normalized if normalized else self.sliced)[timeframe]
+        return df[[t for t in tickers if t in df.columns]]
@@ -0,0 +1,193 @@
+import hashlib
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+
+from price_store import DATA_DIR
+
+# --- CROSS-REPLICA SHARED CACHE ---
+# Several dashboard processes (replicas behind a load balancer) sharing one MSCI_DATA_DIR
+# also share this SQLite cache, so each upstream fetch happens once per TTL no matter how
+# many replicas run. Single-flight: the first caller takes a lease on the key and fetches;
+# everyone else serves the stale value if there is one, or waits for the leader's result.
+# Leases are short and renewed by a heartbeat while the leader computes, so a crashed
+# leader's lease expires within lease_seconds and the next caller takes over.
+#
+# SQLite needs a local filesystem (same host / local volume), not NFS.
+# MSCI_SHARED_CACHE=0 turns it off (every process fetches for itself again).
+
+SHARED_CACHE_ENABLED = os.environ.get("MSCI_SHARED_CACHE", "1") != "0"
+SHARED_CACHE_PATH = os.environ.get("MSCI_SHARED_CACHE_PATH", os.path.join(DATA_DIR, "shared_cache.sqlite"))
+
+POLL_INTERVAL = 0.2  # seconds between checks while waiting on another replica
+
+
+def tickers_key(prefix, tickers):
+    """Short stable key for a ticker list, e.g. prices:3f2a9c01."""
+    digest = hashlib.sha1(",".join(sorted(tickers)).encode("utf-8")).hexdigest()[:8]
+    return f"{prefix}:{digest}"
+
+
+class SharedCache:
+    """Key -> pickled value with expiry, plus leases for single-flight refreshes."""
+
+    def __init__(self, path=SHARED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        # Lease owner prefix: this instance in this process (threads get their own suffix)
+        self.replica = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, created REAL, expires REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+
+    def _connect(self):
+        # One connection per thread (sqlite3 connections are not shared across threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def owner(self):
+        # Per thread, so threads of one process also single-flight against each other
+        return f"{self.replica}:{threading.get_ident()}"
+
+    # -- entries --
+    def get(self, key):
+        """(value, created, fresh) or (None, None, False) if nothing is stored."""
+        row = self._connect().execute("SELECT value, created, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None, False
+        value, created, expires = row
+        return pickle.loads(value), created, expires > time.time()
+
+    def put(self, key, value, ttl):
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO entries (key, value, created, expires) VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now, now + ttl)
+        )
+
+    # -- leases --
+    def acquire(self, key, lease_seconds):
+        """Takes the refresh lease for key unless another live owner holds it."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT owner, expires FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now and row[0] != self.owner():
+                conn.execute("COMMIT")
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (key, owner, expires) VALUES (?, ?, ?)",
+                         (key, self.owner(), now + lease_seconds))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def renew(self, key, lease_seconds, owner):
+        """Extends owner's lease on key. False if it no longer holds it (expired and taken over)."""
+        cur = self._connect().execute("UPDATE leases SET expires = ? WHERE key = ? AND owner = ?",
+                                      (time.time() + lease_seconds, key, owner))
+        return cur.rowcount > 0
+
+    def release(self, key):
+        self._connect().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, self.owner()))
+
+    def _heartbeat(self, key, lease_seconds):
+        """Renews the calling thread's lease every lease_seconds / 3 until the returned event is set."""
+        owner = self.owner()
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(lease_seconds / 3):
+                try:
+                    if not self.renew(key, lease_seconds, owner):
+                        print(f"Shared cache: lost the lease on {key}")
+                        return
+                except sqlite3.Error as e:
+                    print(f"Shared cache: could not renew the lease on {key}: {e}")
+
+        threading.Thread(target=beat, name=f"lease:{key}", daemon=True).start()
+        return stop
+
+    # -- single-flight --
+    def get_or_compute(self, key, ttl, compute, lease_seconds=60, wait_timeout=60, serve_stale=True):
+        """
+        Fresh cached value, else compute() under the key's lease (renewed while compute() runs)
+        and store it for ttl seconds. While another replica holds the lease: the stale value
+        right away (serve_stale), or wait for its result (up to wait_timeout, then compute here
+        anyway; a dead holder's lease lapses after lease_seconds and is taken over before that).
+        """
+        value, _, fresh = self.get(key)
+        if fresh:
+            return value
+        stale = value
+
+        deadline = time.time() + wait_timeout
+        while True:
+            if self.acquire(key, lease_seconds):
+                try:
+                    # Someone may have finished between our read and our lease
+                    value, _, fresh = self.get(key)
+                    if fresh:
+                        return value
+                    heartbeat = self._heartbeat(key, lease_seconds)
+                    try:
+                        value = compute()
+                    finally:
+                        heartbeat.set()
+                    # Empty results (upstream failed) are not shared: the next caller retries
+                    if not getattr(value, "empty", False):
+                        self.put(key, value, ttl)
+                    return value
+                finally:
+                    self.release(key)
+
+            if serve_stale and stale is not None:
+                return stale
+            if time.time() > deadline:
+                print(f"Shared cache: gave up waiting for {key}, fetching locally")
+                return compute()
+            time.sleep(POLL_INTERVAL)
+            value, _, fresh = self.get(key)
+            if fresh:
+                return value
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache():
+    """Process-wide SharedCache, or None when disabled or the database can't be opened."""
+    global _CACHE
+    if not SHARED_CACHE_ENABLED:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            try:
+                _CACHE = SharedCache()
+            except Exception as e:
+                print(f"Shared cache unavailable ({SHARED_CACHE_PATH}): {e}")
+                return None
+        return _CACHE
+
+
+def cached_fetch(key, ttl, compute, **options):
+    """get_or_compute through the shared cache; plain compute() if it is off or broken."""
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    try:
+        return cache.get_or_compute(key, ttl, compute, **options)
+    except sqlite3.Error as e:
+        print(f"Shared cache error for {key}: {e}")
+        return compute()
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+# --- SHARED PRICE MATRIX ---
+# One read-only float32 Date x Ticker matrix per data generation, shared by every session
+# of the process (it lives in the Dataset held by the st.cache_resource refresher).
+# Columns are laid out in category blocks, so selecting whole categories is a column
+# slice and selecting a time frame is a row slice: both are views, no copies.
+# The array is not writeable and pandas' copy-on-write copies on any write attempt,
+# so no session can change what the others see.
+
+PRICE_DTYPE = np.float32
+
+
+def category_order(universe):
+    """Tickers grouped by category (sorted like the sidebar), registry order inside a block."""
+    return [t for c in sorted(universe.by_category) for t in universe.by_category[c]]
+
+
+class SharedPrices:
+    """Read-only price matrix with zero-copy column (ticker) and row (date) selection."""
+
+    def __init__(self, df_close, order=None):
+        cols = [t for t in (order or df_close.columns) if t in df_close.columns]
+        values = np.ascontiguousarray(df_close[cols].to_numpy(dtype=PRICE_DTYPE))
+        values.flags.writeable = False
+        self.values = values
+        self.frame = pd.DataFrame(values, index=df_close.index, columns=cols, copy=False)
+        self.positions = {t: i for i, t in enumerate(cols)}
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def select(self, tickers):
+        """
+        Columns for tickers, in matrix order. A view when they form one contiguous block
+        (e.g. all tickers of adjacent categories); otherwise a copy of just those columns.
+        """
+        pos = sorted(self.positions[t] for t in set(tickers) if t in self.positions)
+        if not pos:
+            return self.frame.iloc[:, 0:0]
+        if pos[-1] - pos[0] + 1 == len(pos):
+            return self.frame.iloc[:, pos[0]:pos[-1] + 1]
+        return self.frame.iloc[:, pos]
+
+    def since(self, start):
+        """Rows from start on (a view)."""
+        return self.frame.loc[pd.Timestamp(start):]
@@ -0,0 +1,218 @@
+"""
+Cold-start helpers: lazy imports and startup timing.
+
+    python msci_dashboard/startup.py imports             # per-module import cost of app.py's imports
+    python msci_dashboard/startup.py imports --top 40 plotly.graph_objects
+    python msci_dashboard/startup.py history             # recorded time to first paint, per process
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# --- STARTUP MODE ---
+# MSCI_LAZY_IMPORTS=1 (default) defers heavy modules (plotly trace classes, ...) until the
+# first code path that touches them; 0 imports everything up front (easier to debug).
+LAZY_IMPORTS = os.environ.get("MSCI_LAZY_IMPORTS", "1") != "0"
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# Same data dir as price_store.py (not imported here so this module stays dependency free)
+DATA_DIR = os.environ.get("MSCI_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+STARTUP_LOG = os.path.join(DATA_DIR, "startup_log.jsonl")
+
+IMPORTED_AT = time.time()
+
+
+def lazy_module(name):
+    """Module object that is only executed on first attribute access (importlib LazyLoader)."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if not LAZY_IMPORTS:
+        return importlib.import_module(name)
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def process_start_time():
+    """Epoch seconds when this process started (Linux /proc); falls back to this module's import."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Field 22 (after the ")" that closes the command name) = start time in clock ticks since boot
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return IMPORTED_AT
+
+
+PROCESS_START = process_start_time()
+
+
+# --- TIME TO FIRST PAINT ---
+
+class StartupTimer:
+    """
+    Marks on the first painted script run of a process (app.py calls mark() at each stage);
+    paint() writes one line to STARTUP_LOG the first time the page is fully rendered.
+    """
+
+    def __init__(self, log_path=STARTUP_LOG):
+        self.log_path = log_path
+        self.marks = {}
+        self.script_start = None
+        self.done = False
+
+    def begin(self):
+        """Start of a script run; runs that end before the page is painted (no data yet) start over."""
+        if not self.done:
+            self.script_start = time.time()
+            self.marks = {}
+
+    def mark(self, name):
+        if not self.done and name not in self.marks:
+            self.marks[name] = time.time()
+
+    def paint(self):
+        """Records time to first meaningful paint once per process; returns the record (or None)."""
+        if self.done or self.script_start is None:
+            return None
+        self.done = True
+        now = time.time()
+        record = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "lazy_imports": LAZY_IMPORTS,
+            "process_to_paint_s": round(now - PROCESS_START, 3),
+            "script_to_paint_s": round(now - self.script_start, 3),
+            # Seconds from script start to each stage
+            "stages": {k: round(v - self.script_start, 3) for k, v in self.marks.items()},
+        }
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            print(f"Could not write startup log {self.log_path}: {e}")
+        return record
+
+
+# One per process: Streamlit re-executes app.py on every rerun but keeps imported modules
+TIMER = StartupTimer()
+
+
+def read_log(log_path=STARTUP_LOG):
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- IMPORT-TIME REPORT ---
+
+def app_imports(path=APP_PATH):
+    """Module names imported at the top level of app.py."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names.extend(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module)
+    return list(dict.fromkeys(names))
+
+
+def import_times(modules):
+    """
+    Runs `python -X importtime` in a fresh interpreter (cold) and parses its report.
+    Returns [(module, self_us, cumulative_us, depth)] in import order.
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(APP_PATH), capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cum_us), depth))
+    return rows
+
+
+def print_import_report(modules, top=25):
+    rows = import_times(modules)
+
+    print("== Requested modules (cumulative, cold interpreter) ==")
+    by_name = {name: cum for name, _, cum, _ in rows}
+    for m in modules:
+        # Already imported by an earlier module -> no line of its own
+        cum = by_name.get(m)
+        print(f"  {m:<30} {cum / 1000:9.1f} ms" if cum is not None else f"  {m:<30}    (shared)")
+
+    # Self time rolled up per top-level package
+    packages = {}
+    for name, self_us, _, _ in rows:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    total = sum(packages.values())
+    print(f"\n== Top packages by self time (total {total / 1000:.1f} ms) ==")
+    for root, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {root:<30} {us / 1000:9.1f} ms  {us / total * 100:5.1f}%")
+
+    print(f"\n== Top {top} modules by self time ==")
+    for name, self_us, cum_us, _ in sorted(rows, key=lambda r: -r[1])[:top]:
+        print(f"  {name:<50} {self_us / 1000:9.1f} ms  (cum {cum_us / 1000:.1f} ms)")
+
+
+def print_history(last=20):
+    records = read_log()
+    if not records:
+        print(f"No startup records yet ({STARTUP_LOG}). Open the dashboard once.")
+        return
+    for r in records[-last:]:
+        stages = "  ".join(f"{k}={v:.2f}s" for k, v in r.get("stages", {}).items())
+        mode = "lazy" if r.get("lazy_imports") else "eager"
+        print(f"{r['ts']}  {mode:<5}  process->paint {r['process_to_paint_s']:7.2f}s  "
+              f"script->paint {r['script_to_paint_s']:6.2f}s  {stages}")
+    recent = sorted(r["script_to_paint_s"] for r in records[-last:])
+    print(f"\nMedian script->paint over last {len(recent)}: {recent[len(recent) // 2]:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard cold-start diagnostics.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_imp = sub.add_parser("imports", help="per-module import cost (python -X importtime)")
+    p_imp.add_argument("modules", nargs="*", help="defaults to app.py's top-level imports")
+    p_imp.add_argument("--top", type=int, default=25)
+    p_hist = sub.add_parser("history", help="recorded time to first paint")
+    p_hist.add_argument("--last", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "imports":
+        print_import_report(args.modules or app_imports(), top=args.top)
+    else:
+        print_history(args.last)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- PERFORMANCE TABLE ---
+# Builds the "Performance and valuations (%)" table: merge of returns with
+# fundamentals, column order and how st.dataframe renders it.
+#   "fast" (default): numeric columns prepared once with vectorized ops, formats and the YTD
+#                     scale done by st.dataframe's column_config in the browser.
+#   "styler":         the original pandas Styler (per-cell formatters, matplotlib colormap).
+
+TABLE_MODE = os.environ.get("MSCI_TABLE_MODE", "fast")
+
+cols_perf = ['1D', '1W', '1M', '3M', 'MTD', 'QTD', 'YTD', '1Yr', '3Yr']
+cols_nav = ['Price', 'NAV', 'Premium %', 'AUM (B)']
+cols_flow = ['Flow 1D', 'Flow 1W', 'Flow 1M']  # JPY, from fund_flows.trailing_flows
+cols_fund = ['P/B', 'P/E', 'Yield %']
+cols_meta = ['Category', 'Index Name', 'ETF Name', 'Ticker']
+final_cols_order = cols_meta + cols_perf + cols_nav + cols_flow + cols_fund
+
+
+def build_final_table(df_fund, df_perf, universe):
+    """Merges fundamentals (indexed by Ticker) with returns; performance-only if df_fund is empty."""
+    if not df_fund.empty:
+        df_fund = df_fund.copy()
+        # Add Category if missing (from snapshot or live)
+        if "Category" not in df_fund.columns:
+             df_fund["Category"] = df_fund["Ticker"].map(universe.field_map("Category")).fillna("")
+
+        # Merge Performance with Fundamentals
+        # df_fund has "Ticker" column. df_perf index is Ticker.
+        # df_fund ALSO has Ticker as Index (from get_fundamentals).
+        # We merge on Index to avoid "Ticker is both index and column" error.
+        df_final = df_fund.merge(df_perf, left_index=True, right_index=True, how="left")
+    else:
+        df_final = df_perf.copy()
+        df_final["Ticker"] = df_final.index
+        # Registry lookups are plain dicts, so each column is one vectorized map
+        tickers = df_final.index.to_series()
+        df_final["Index Name"] = tickers.map(universe.field_map("Index")).fillna("")
+        df_final["ETF Name"] = tickers.map(universe.field_map("Name")).fillna("")
+        df_final["Category"] = tickers.map(universe.field_map("Category")).fillna("")
+
+        for c in cols_nav + cols_fund:
+             df_final[c] = pd.NA
+
+    return df_final
+
+
+def visible_columns(df_final):
+    """Filter only existing columns, in display order."""
+    return [c for c in final_cols_order if c in df_final.columns]
+
+
+# --- FAST PATH (column_config) ---
+
+# YTD scale, same range as the Styler's background_gradient
+YTD_MIN, YTD_MAX = -20, 40
+
+
+def display_frame(df_final, final_cols):
+    """
+    Numeric table for st.dataframe + column_config: every column converted once, vectorized
+    (snapshot values can be None / strings -> NaN), AUM in billions.
+    """
+    df = df_final[final_cols].copy()
+    for c in cols_perf + cols_nav + cols_flow + cols_fund:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype(np.float64)
+    for c in ['AUM (B)'] + cols_flow:
+        if c in df.columns:
+            df[c] = df[c] / 1_000_000_000
+    return df
+
+
+def column_config(final_cols):
+    """Native st.dataframe formats matching style_table (formatting happens client side)."""
+    import streamlit as st
+
+    config = {c: st.column_config.NumberColumn(format="%+.1f") for c in cols_perf}
+    config.update({
+        'YTD': st.column_config.ProgressColumn(format="%+.1f", min_value=YTD_MIN, max_value=YTD_MAX),
+        'Price': st.column_config.NumberColumn(format="%,.0f"),
+        'NAV': st.column_config.NumberColumn(format="%,.0f"),
+        'Premium %': st.column_config.NumberColumn(format="%+.2f"),
+        'AUM (B)': st.column_config.NumberColumn(format="%,.1fB"),
+        **{c: st.column_config.NumberColumn(format="%+,.2fB", help="Creations - redemptions (JPY)") for c in cols_flow},
+        'P/B': st.column_config.NumberColumn(format="%.1f"),
+        'P/E': st.column_config.NumberColumn(format="%.1f"),
+        'Yield %': st.column_config.NumberColumn(format="%.1f"),
+        'Index Name': st.column_config.TextColumn(width="large"),
+        'ETF Name': st.column_config.TextColumn(width="large"),
+    })
+    return {c: cfg for c, cfg in config.items() if c in final_cols}
+
+
+def risk_table(df_risk, universe):
+    """Risk metrics (index: Ticker) with the same leading name columns as the main table."""
+    df = df_risk.copy()
+    tickers = df.index.to_series()
+    df.insert(0, "Ticker", tickers)
+    df.insert(0, "ETF Name", tickers.map(universe.field_map("Name")).fillna(""))
+    df.insert(0, "Index Name", tickers.map(universe.field_map("Index")).fillna(""))
+    return df
+
+
+def risk_column_config():
+    import streamlit as st
+
+    return {
+        'Index Name': st.column_config.TextColumn(width="large"),
+        'ETF Name': st.column_config.TextColumn(width="large"),
+        'Volatility %': st.column_config.NumberColumn(format="%.1f"),
+        'Max Drawdown %': st.column_config.NumberColumn(format="%.1f"),
+        'Max DD Duration (d)': st.column_config.NumberColumn(format="%d", help="Longest time below a previous peak (calendar days)"),
+        'Sharpe': st.column_config.NumberColumn(format="%.2f"),
+        'Sortino': st.column_config.NumberColumn(format="%.2f"),
+        'Beta': st.column_config.NumberColumn(format="%.2f"),
+        'Correlation': st.column_config.NumberColumn(format="%.2f"),
+    }
+
+
+# --- STYLER PATH ---
+
+
+# Safe formatter
+def safe_fmt(fmt):
+    return lambda x: fmt.format(x) if pd.notnull(x) and x is not None and x is not pd.NA else ""
+
+
+def fmt_aum(x):
+    if pd.notnull(x) and x is not None and x is not pd.NA:
+        try:
+            return f"{float(x)/1_000_000_000:,.1f}B" # Billions
+        except:
+            return ""
+    return ""
+
+
+def fmt_flow(x):
+    if pd.notnull(x) and x is not None and x is not pd.NA:
+        try:
+            return f"{float(x)/1_000_000_000:+,.2f}B"
+        except:
+            return ""
+    return ""
+
+
+def style_table(df_final, final_cols):
+    """Styler for st.dataframe: number formats, YTD color scale, wrapped names."""
+    format_dict = {c: safe_fmt("{:+.1f}") for c in cols_perf}
+    format_dict.update({
+        'Price': safe_fmt("{:,.0f}"),
+        'NAV': safe_fmt("{:,.0f}"),
+        'Premium %': safe_fmt("{:+.2f}"),
+        'AUM (B)': fmt_aum,
+        **{c: fmt_flow for c in cols_flow},
+        'P/B': safe_fmt("{:.1f}"),
+        'P/E': safe_fmt("{:.1f}"),
+        'Yield %': safe_fmt("{:.1f}"),
+        'ETF Name': lambda x: x # String
+    })
+    # Styler.format raises on keys that are not in the frame
+    format_dict = {c: f for c, f in format_dict.items() if c in final_cols}
+
+    return (
+        df_final[final_cols].style
+        .format(format_dict)
+        .background_gradient(subset=['YTD'], cmap="ocean_r", vmin=-20, vmax=40)
+        .set_properties(**{'white-space': 'wrap'}, subset=['Index Name', 'ETF Name'])
+    )
@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+import price_store
+
+# --- TOTAL RETURN ---
+# Dividend-reinvested ("配当込み") series from the raw closes and the stored dividend events
+# (price_store.read_events). Dividends are reinvested at the close of the ex-date:
+#     factor_t = factor_t-1 * (1 + D_t / C_t),   TR_t = C_t * factor_t
+# for the whole Date x Ticker matrix in one cumprod. Stored closes are split-adjusted
+# (a new split re-downloads the ticker's history, see price_store.sync_prices), so only
+# dividends enter the factor.
+#
+# The factor only changes on ex-dates and only depends on earlier rows, so a refresh that
+# appends bars extends the previous factors from their last row instead of rebuilding the
+# full history; only a changed past event or ticker set forces a rebuild.
+# Factors are rebased to 1.0 on the first row of the price window (TR starts at the close
+# there), so the level only depends on the window, not on how many refreshes built it: the
+# window start moves forward every day, and dividends that left it must drop out.
+
+
+def load_events(tickers):
+    """Stored events of tickers as one long frame: Ticker, Date, Dividends, Stock Splits."""
+    frames = {t: ev for t in tickers if (ev := price_store.read_events(t)) is not None and not ev.empty}
+    if not frames:
+        return pd.DataFrame({"Ticker": pd.Series(dtype=object), "Date": pd.Series(dtype="datetime64[ns]"),
+                             "Dividends": pd.Series(dtype="float64"), "Stock Splits": pd.Series(dtype="float64")})
+    df = pd.concat(frames, names=["Ticker", "Date"]).reset_index()
+    df["Date"] = df["Date"].astype("datetime64[ns]")
+    return df
+
+
+def cash_dividends(events):
+    """Dividend rows of a load_events frame, sorted by (Ticker, Date): Ticker, Date, Dividends."""
+    div = events.loc[events["Dividends"] > 0, ["Ticker", "Date", "Dividends"]]
+    return div.sort_values(["Ticker", "Date"], kind="stable").reset_index(drop=True)
+
+
+def dividend_matrix(dividends, index, columns, after=None):
+    """
+    Date x Ticker cash dividends on the price dates, in one scatter-add. An ex-date that is
+    not a row of index (holiday in the price matrix) counts on the next row. Events before
+    index[0] are dropped, or with `after` (the date of the row before index[0]) those on or before it.
+    """
+    out = np.zeros((len(index), len(columns)))
+    if len(index) == 0 or dividends.empty:
+        return out
+    dates = index.to_numpy(dtype="datetime64[ns]")
+    ex = dividends["Date"].to_numpy(dtype="datetime64[ns]")
+    col = pd.Index(columns).get_indexer(dividends["Ticker"])
+    pos = np.searchsorted(dates, ex, side="left")
+    first = ex > np.datetime64(after, "ns") if after is not None else ex >= dates[0]
+    keep = first & (pos < len(dates)) & (col >= 0)
+    np.add.at(out, (pos[keep], col[keep]), dividends["Dividends"].to_numpy()[keep])
+    return out
+
+
+def _between(dividends, start, end):
+    dates = dividends["Date"]
+    return dividends[(dates >= start) & (dates <= end)].reset_index(drop=True)
+
+
+def growth(closes, dividends):
+    """1 + D_t / C_t per cell (1 where there is no dividend or no price)."""
+    with np.errstate(all="ignore"):
+        g = 1 + dividends / closes
+    return np.where(np.isfinite(g), g, 1.0)
+
+
+class TotalReturn:
+    """Cumulative dividend factors (Date x Ticker) for one price matrix, built incrementally."""
+
+    def __init__(self, dates, tickers, factors, dividends):
+        self.dates = dates
+        self.tickers = tickers
+        self.factors = factors      # float64, same shape as the price matrix
+        self.dividends = dividends  # cash_dividends() the factors were built from
+        self.reused_rows = 0     # rows taken over from the previous build (diagnostics)
+
+    @classmethod
+    def build(cls, df_prices, events, previous=None):
+        """
+        Factors for df_prices (forward-filled closes) and events (load_events frame).
+        With the previous build, rows it already
+        covered are reused and only the rows from its last (possibly revised) bar on are computed.
+        """
+        dates = df_prices.index
+        tickers = list(df_prices.columns)
+        dividends = cash_dividends(events)
+        k, old_start = cls._reusable(previous, dates, tickers, dividends)
+
+        # Only rows k.. are computed
+        closes = df_prices.iloc[k:].to_numpy(dtype=np.float64)
+        g = growth(closes, dividend_matrix(dividends, dates[k:], tickers, after=dates[k - 1] if k > 0 else None))
+        factors = np.empty((len(dates), len(tickers)))
+        if k > 0:
+            factors[:k] = previous.factors[old_start:old_start + k]
+            factors[k:] = factors[k - 1] * np.cumprod(g, axis=0)
+        else:
+            factors[:] = np.cumprod(g, axis=0)
+        if len(dates) and (k == 0 or old_start > 0):
+            # Same base as a full rebuild: 1.0 on the first row of this window
+            factors /= factors[0]
+
+        result = cls(dates, tickers, factors, dividends)
+        result.reused_rows = k
+        return result
+
+    @staticmethod
+    def _reusable(previous, dates, tickers, dividends):
+        """(rows of previous to reuse, previous row of dates[0]); (0, 0) means full rebuild."""
+        if previous is None or previous.tickers != tickers or len(previous.dates) < 2 or len(dates) == 0:
+            return 0, 0
+        last = previous.dates[-1]
+        if dates[0] not in previous.dates or last not in dates:
+            return 0, 0
+        old_start = previous.dates.get_loc(dates[0])
+        k = dates.get_loc(last)  # previous' last row is recomputed (its close may have changed)
+        if old_start + k != len(previous.dates) - 1 or not dates[:k].equals(previous.dates[old_start:old_start + k]):
+            return 0, 0
+        # Any added / changed / removed dividend before that row invalidates the old factors
+        committed = previous.dates[old_start + k - 1] if k > 0 else None
+        if committed is None:
+            return 0, 0
+        if not _between(previous.dividends, dates[0], committed).equals(_between(dividends, dates[0], committed)):
+            return 0, 0
+        return k, old_start
+
+    def frame(self, df_prices):
+        """Total-return index (closes x factors), same shape and index as df_prices."""
+        values = df_prices.to_numpy(dtype=np.float64) * self.factors
+        return pd.DataFrame(values, index=df_prices.index, columns=df_prices.columns)
+
+    def factor_frame(self):
+        return pd.DataFrame(self.factors, index=self.dates, columns=self.tickers)
+
+
+def apply_to_intraday(df_intraday, total_return):
+    """Intraday closes x the factor of their day (last known factor for days after the daily data)."""
+    if df_intraday.empty:
+        return df_intraday
+    factors = total_return.factor_frame()
+    cols = [c for c in df_intraday.columns if c in factors.columns]
+    day_factors = factors[cols].reindex(df_intraday.index.normalize(), method="ffill").to_numpy()
+    return df_intraday[cols] * np.where(np.isnan(day_factors), 1.0, day_factors)
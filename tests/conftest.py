@@ -0,0 +1,42 @@
+import os
+import sys
+import tempfile
+import time as real_time
+
+import pytest
+
+# The dashboard modules are flat and import each other by name (like `streamlit run` does)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "msci_dashboard"))
+# Keep module-level state (negative cache file, shared cache database) out of the real data dir
+os.environ.setdefault("MSCI_DATA_DIR", tempfile.mkdtemp(prefix="msci-tests-"))
+
+
+class FakeClock:
+    """Stands in for the `time` module: time() / monotonic() only move on sleep() or advance()."""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.on_sleep = None  # callback(clock) after every sleep, e.g. another replica finishing
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.on_sleep is not None:
+            self.on_sleep(self)
+
+    # Formatting helpers used for log lines / metrics
+    strftime = staticmethod(real_time.strftime)
+    localtime = staticmethod(real_time.localtime)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,163 @@
+import urllib.error
+
+import pytest
+
+import fetch_guard
+from diagnostics import Metrics
+from fetch_guard import (ERROR_TTL, MAX_NEGATIVE_TTL, NEGATIVE_TTL, CircuitBreaker, CircuitOpen,
+                         NegativeCache, NoData, is_throttle)
+
+
+@pytest.fixture(autouse=True)
+def fake_time(clock, monkeypatch):
+    monkeypatch.setattr(fetch_guard, "time", clock)
+    return clock
+
+
+class YFRateLimitError(Exception):
+    pass
+
+
+def throttled():
+    raise YFRateLimitError("Too Many Requests. Rate limited. Try after a while.")
+
+
+def ok():
+    return "data"
+
+
+def raising(exc):
+    def fn():
+        raise exc
+    return fn
+
+
+def trip(breaker):
+    for _ in range(breaker.threshold):
+        with pytest.raises(YFRateLimitError):
+            breaker.call(throttled)
+
+
+# --- throttle detection ---
+
+@pytest.mark.parametrize("exc, expected", [
+    (YFRateLimitError("x"), True),
+    (urllib.error.HTTPError("u", 429, "x", None, None), True),
+    (Exception("429 Client Error: Too Many Requests for url"), True),
+    (Exception("1429.T: No data found, symbol may be delisted"), False),
+    (Exception("parsed 4290 rows"), False),
+    (urllib.error.HTTPError("u", 404, "x", None, None), False),
+])
+def test_is_throttle(exc, expected):
+    assert is_throttle(exc) is expected
+
+
+# --- circuit breaker ---
+
+def test_breaker_opens_after_consecutive_throttles_and_fails_fast(clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=300, metrics=Metrics())
+    trip(breaker)
+    assert breaker.state == "open" and breaker.trips == 1
+    with pytest.raises(CircuitOpen):
+        breaker.call(lambda: pytest.fail("called upstream while open"))
+
+
+def test_success_resets_the_throttle_count():
+    breaker = CircuitBreaker(threshold=3, cooldown=300, metrics=Metrics())
+    for _ in range(2):
+        with pytest.raises(YFRateLimitError):
+            breaker.call(throttled)
+    assert breaker.call(ok) == "data"
+    with pytest.raises(YFRateLimitError):
+        breaker.call(throttled)
+    assert breaker.state == "closed"
+
+
+def test_no_data_and_other_errors_do_not_count_as_throttling():
+    breaker = CircuitBreaker(threshold=1, cooldown=300, metrics=Metrics())
+    with pytest.raises(NoData):
+        breaker.call(raising(NoData("empty")))
+    with pytest.raises(ValueError):
+        breaker.call(raising(ValueError("1429.T bad row")))
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_a_single_trial_call(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=300, metrics=Metrics())
+    trip(breaker)
+    clock.advance(299)
+    assert not breaker.allow()
+    clock.advance(2)
+    assert breaker.allow()          # the trial
+    assert breaker.state == "half-open"
+    assert not breaker.allow()      # everyone else still fails fast while it runs
+    breaker.record(False)
+    assert breaker.state == "closed"
+    assert breaker.allow()
+
+
+def test_throttled_trial_reopens_for_another_cooldown(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=300, metrics=Metrics())
+    trip(breaker)
+    clock.advance(301)
+    with pytest.raises(YFRateLimitError):
+        breaker.call(throttled)     # one throttled trial is enough
+    assert breaker.state == "open" and breaker.trips == 2
+    clock.advance(299)
+    with pytest.raises(CircuitOpen):
+        breaker.call(ok)
+
+
+def test_stragglers_while_open_neither_retrip_nor_close(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=300, metrics=Metrics())
+    trip(breaker)
+    opened_until = breaker.opened_until
+    clock.advance(100)
+    breaker.record(True)            # calls started before the breaker opened
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.trips == 1 and breaker.opened_until == opened_until
+
+
+# --- negative cache ---
+
+@pytest.fixture
+def negative(tmp_path):
+    return NegativeCache(path=str(tmp_path / "negative_cache.json"), metrics=Metrics())
+
+
+def test_empty_result_is_skipped_until_its_ttl(negative, clock):
+    negative.add("prices", "234A.T", "empty")
+    assert negative.blocked("prices", "234A.T")
+    assert not negative.blocked("info", "234A.T")
+    assert negative.split("prices", ["2559.T", "234A.T"]) == (["2559.T"], ["234A.T"])
+    clock.advance(NEGATIVE_TTL["prices"] + 1)
+    assert not negative.blocked("prices", "234A.T")
+
+
+def test_ttl_doubles_per_miss_up_to_the_cap(negative, clock):
+    base = NEGATIVE_TTL["prices"]
+    ttls = []
+    for _ in range(5):
+        negative.add("prices", "234A.T", "empty")
+        ttls.append(negative.entries["prices"]["234A.T"]["until"] - clock.now)
+    assert ttls == [base, 2 * base, min(4 * base, MAX_NEGATIVE_TTL), MAX_NEGATIVE_TTL, MAX_NEGATIVE_TTL]
+
+
+def test_errors_use_the_short_ttl_and_a_good_fetch_clears(negative, clock):
+    negative.add("intraday", "2559.T", "error")
+    assert negative.entries["intraday"]["2559.T"]["until"] - clock.now == ERROR_TTL
+    negative.clear("intraday", "2559.T")
+    assert not negative.blocked("intraday", "2559.T")
+    negative.add("intraday", "2559.T", "empty")  # miss count restarted
+    assert negative.entries["intraday"]["2559.T"]["until"] - clock.now == NEGATIVE_TTL["intraday"]
+
+
+def test_entries_survive_a_restart(negative, clock):
+    negative.add("shares", "234A.T", "empty")
+    negative.add("shares", "234A.T", "empty")
+    negative.flush()
+    reloaded = NegativeCache(path=negative.path, metrics=Metrics())
+    assert reloaded.blocked("shares", "234A.T")
+    reloaded.add("shares", "234A.T", "empty")  # keeps doubling from the stored count
+    assert reloaded.entries["shares"]["234A.T"]["misses"] == 3
@@ -0,0 +1,105 @@
+import time
+
+import pandas as pd
+import pytest
+
+import shared_cache
+from shared_cache import SharedCache
+
+
+@pytest.fixture
+def replicas(tmp_path, clock, monkeypatch):
+    """Two replicas (separate SharedCache instances) on one database, on a fake clock."""
+    monkeypatch.setattr(shared_cache, "time", clock)
+    path = str(tmp_path / "shared_cache.sqlite")
+    return SharedCache(path), SharedCache(path)
+
+
+def test_fresh_value_is_served_without_computing(replicas):
+    a, b = replicas
+    a.put("k", "value", ttl=60)
+    assert b.get_or_compute("k", 60, lambda: pytest.fail("computed a fresh key")) == "value"
+
+
+def test_live_lease_blocks_other_replica_until_it_expires(replicas, clock):
+    a, b = replicas
+    assert a.acquire("k", 60)
+    assert not b.acquire("k", 60)
+    clock.advance(59)
+    assert not b.acquire("k", 60)
+    clock.advance(2)
+    assert b.acquire("k", 60)
+    # The old holder lost it: its renewals no longer extend anything
+    assert not a.renew("k", 60, a.owner())
+
+
+def test_release_lets_the_next_replica_in(replicas):
+    a, b = replicas
+    assert a.acquire("k", 60)
+    a.release("k")
+    assert b.acquire("k", 60)
+
+
+def test_waiter_takes_over_a_crashed_holder_after_the_lease(replicas, clock):
+    a, b = replicas
+    assert a.acquire("k", 60)  # holder dies without releasing
+    start = clock.now
+    value = b.get_or_compute("k", 600, lambda: "mine", lease_seconds=60, wait_timeout=300, serve_stale=False)
+    assert value == "mine"
+    assert 60 <= clock.now - start < 61
+    assert a.get("k")[0] == "mine"
+
+
+def test_waiter_gets_the_holders_result(replicas, clock):
+    a, b = replicas
+    assert a.acquire("k", 60)
+    finish_at = clock.now + 5
+
+    def holder_finishes(c):
+        if c.now >= finish_at and a.get("k")[0] is None:
+            a.put("k", "theirs", ttl=600)
+            a.release("k")
+
+    clock.on_sleep = holder_finishes
+    value = b.get_or_compute("k", 600, lambda: pytest.fail("computed while the holder was working"),
+                             wait_timeout=60, serve_stale=False)
+    assert value == "theirs"
+
+
+def test_stale_value_is_served_while_another_replica_refreshes(replicas, clock):
+    a, b = replicas
+    a.put("k", "old", ttl=10)
+    clock.advance(11)
+    assert a.acquire("k", 60)
+    assert b.get_or_compute("k", 10, lambda: pytest.fail("computed while leased")) == "old"
+
+
+def test_wait_timeout_computes_locally_behind_a_live_holder(replicas, clock):
+    a, b = replicas
+    assert a.acquire("k", 3600)
+    start = clock.now
+    assert b.get_or_compute("k", 60, lambda: "local", wait_timeout=5, serve_stale=False) == "local"
+    assert 5 <= clock.now - start < 6
+
+
+def test_empty_results_are_not_shared(replicas):
+    a, b = replicas
+    assert a.get_or_compute("k", 60, lambda: pd.DataFrame()).empty
+    assert b.get_or_compute("k", 60, lambda: pd.DataFrame({"x": [1]})).shape == (1, 1)
+
+
+def test_lease_is_renewed_while_compute_runs(replicas, clock):
+    # Heartbeat runs on its own thread every lease_seconds / 3 (real time); expiry uses the fake clock
+    a, b = replicas
+    lease = 0.3
+
+    def slow_compute():
+        clock.advance(0.2)
+        time.sleep(lease)          # let the heartbeat renew at least once
+        clock.advance(0.2)         # past the original expiry, inside the renewed one
+        assert not b.acquire("k", lease)
+        return "done"
+
+    assert a.get_or_compute("k", 60, slow_compute, lease_seconds=lease) == "done"
+    clock.advance(61)
+    assert b.acquire("k", lease)  # released after compute